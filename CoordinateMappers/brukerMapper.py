@@ -1,6 +1,6 @@
 from CoordinateMappers import coordinateMapper
 from GUICanvases import GUIConstants
-from ImageUtilities import blob
+from ImageUtilities import blobParser
 import abc
 import numpy as np
 import itertools
@@ -279,25 +279,8 @@ class brukerMapper(coordinateMapper.CoordinateMapper, metaclass=abc.ABCMeta):
         '''
         infile = open(filename, 'r')
         lines = infile.readlines()
-        result = []
-        #ignore header and footer
-        for l in lines[13:-12]:
-            toks = l.split('"')
-            pos = toks[3].split('_')
-            #parse pixel position and group
-            if len(pos) == 4:
-                offset = 1
-                x = int(pos[1+offset][:-1])
-                y = int(pos[2+offset])
-                s = int(pos[1][:-1])
-                result.append(blob.blob(x=x, y=y, group =  s))
-            else:
-                offset= 0
-                x = int(pos[1+offset][:-1])
-                y = int(pos[2+offset])
-                result.append(blob.blob(x = x, y = y))
-            
-        return result
+        infile.close()
+        return blobParser.parseXEO(lines)
 
     
     def getIntermediateMap(self):
@@ -1,5 +1,5 @@
 from CoordinateMappers.solarixMapper import solarixMapper
-from ImageUtilities.blob import blob
+from ImageUtilities import blobParser
 import os
 
 class flexImagingSolarix(solarixMapper):
@@ -64,12 +64,6 @@ class flexImagingSolarix(solarixMapper):
         returns a list of blobs
         '''
         input = open(filename, 'r')
-        result = []
-        for l in input.readlines()[1:]:
-            toks = l.split(' ')
-            toks = toks[2].split('_')
-            if len(toks) == 3:
-                result.append(blob(int(toks[1][1:]), int(toks[2][1:]), group = int(toks[0][1:])))
-            elif len(toks) == 2:
-                result.append(blob(int(toks[0][1:]), int(toks[1][1:])))
-        return result
\ No newline at end of file
+        lines = input.readlines()
+        input.close()
+        return blobParser.parseFlexImaging(lines)
\ No newline at end of file
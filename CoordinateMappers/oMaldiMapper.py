@@ -3,7 +3,7 @@ import os
 import numpy as np
 import itertools
 
-from ImageUtilities import blob
+from ImageUtilities import blobParser
 
 class oMaldiMapper(coordinateMapper.CoordinateMapper):
     '''
@@ -128,12 +128,8 @@ class oMaldiMapper(coordinateMapper.CoordinateMapper):
         result = []
         if os.path.exists(filename[0:-4] + '.txt'):
             reader = open(filename[0:-4] + '.txt', 'r')
-            for l in reader.readlines():
-                toks = l.split('\t')
-                if len(toks) == 3:
-                    result.append(blob.blob(float(toks[0]), float(toks[1]), group = int(toks[2])))
-                else:
-                    result.append(blob.blob(float(toks[0]), float(toks[1])))
+            result = blobParser.parseDelimited(reader.readlines())
+            reader.close()
         else:
             print('{} containing pixel positions not found!'.format(filename[0:-4] + '.txt'))
         return result
@@ -1,5 +1,5 @@
 from CoordinateMappers import coordinateMapper
-from ImageUtilities import blob
+from ImageUtilities import blobParser
 
 import numpy as np
 import scipy.linalg
@@ -134,24 +134,12 @@ class srsMapper(coordinateMapper.CoordinateMapper):
         Loads a srsMapper instrument file and returns a list of blobs
         with the target locations.
         filename: the file to load
-        returns a list of blob objects
+        returns a blobParser.blobColumns of the target locations
         '''
-        result = []
         reader = open(filename, 'r')
-
-        for l in reader.readlines()[2:]:#toss focus plane
-            toks = l.split('\t')
-            pos = toks[0].split('_')
-            #parse pixel position and group
-            x = int(pos[1][:-1])
-            y = int(pos[2])
-            if len(toks) == 4:
-                s = int(toks[3])
-                result.append(blob.blob(x = x, y = y, group = s))
-            else:
-                result.append(blob.blob(x = x, y = y))
-
-        return result
+        lines = reader.readlines()
+        reader.close()
+        return blobParser.parseSRS(lines)
 
     def getIntermediateMap(self):
         '''
@@ -1,7 +1,7 @@
 from CoordinateMappers import coordinateMapper
 from CoordinateMappers import zaber3axis
 
-from ImageUtilities import blob
+from ImageUtilities import blobParser
 
 class zaberMapper(coordinateMapper.CoordinateMapper):
     '''
@@ -91,21 +91,13 @@ class zaberMapper(coordinateMapper.CoordinateMapper):
         Loads a zaberMapper instrument file and returns a list of blobs
         with the target locations.
         filename: the file to load
-        returns a list of blob objects
+        returns a blobParser.blobColumns of the target locations
         '''
-        result = []
         reader = open(filename, 'r')
-
-        for l in reader.readlines():
-            toks = l.split('\t')
-            if len(toks) == 3:
-                #group is encoded
-                result.append(blob.blob(float(toks[0]), float(toks[1]), group = int(toks[2])))
-            else:
-                #no group
-                result.append(blob.blob(float(toks[0]), float(toks[1])))
-
-        return result
+        lines = reader.readlines()
+        reader.close()
+        #group is encoded in an optional third column
+        return blobParser.parseDelimited(lines)
 
     def saveInstrumentFile(self, filename, blobs):
         '''
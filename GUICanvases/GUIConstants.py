@@ -28,6 +28,11 @@ DEFAULT_RADIUS          =   8#363
 FIDUCIAL_RADIUS         =   100
 #maximum number of blobs to draw when limit is selected
 DRAW_LIMIT              =   250
+#opacity of the sparsest and densest aggregated cells when drawing is limited
+DENSITY_ALPHA_MIN       =   0.15
+DENSITY_ALPHA_MAX       =   0.6
+#minimum spacing between drawn group labels in pixels, denser labels are hidden
+LABEL_SPACING           =   40
 #maximum number of blobs to check prior to deselecting TSP optimization
 TSP_LIMIT               =   1000
 
@@ -65,6 +70,7 @@ IMAGE_HOTKEYS           =   ("w,s,a,d\t\tMove\n"
         "r\t\tReset view\n"
         "t\t\tSwitch views\n"
         "b\t\tTest blob find\n"
+        "Esc\t\tCancel global blob find\n"
         "B\t\tSwitch to threshold view\n"
         "m\t\tMirror x axis\n"
         "p\t\tToggle predicted location\n"
@@ -3,6 +3,7 @@ The GUICanvases package contains classes for display and user interaction
 colors.py:      a collection of constant variables with named colors for display
 histCanvas.py:  a widget for displaying and interacting with population level metrics
 mplCanvas.py:   a abstract class extending figure canvas for displaying matplotlib figures
+overlayRenderer.py: persistent collections of the blobs, fiducials and ROI drawn over the slide
 popup.py:       a collection of small, custom windows for user IO to set parameters with 
                 blob finding, histogram display, and intermediate maps
 slideCanvas.py  a widget to display and interact with a slideWrapper object.
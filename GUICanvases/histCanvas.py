@@ -42,6 +42,9 @@ class HistCanvas(MplCanvas):
     
         #offset from blob radius to consider when extracting fluorescence
         self.offset = 0
+        #pixels the intensities were reduced over, measured features cover the blob
+        #pixels while reading the slide covers the square around each blob
+        self.intensityRegion = None
 
         #x axis limits for zooming
         self.xlo = None
@@ -123,23 +126,24 @@ class HistCanvas(MplCanvas):
         '''
         calculate the population values with either the current set of blobs from the model
         this can require some calculation time to complete due to repeated disk reads on the image
+        unless the intensities were measured during blob finding
         '''
         #set a new set of global blbs
         self.blobSet = self.model.blobCollection[self.model.currentBlobs]
 
         #return immediately if globalBlbs is not set
-        if self.blobSet is None or len(self.blobSet.blobs) == 0:
+        if self.blobSet is None or self.blobSet.length() == 0:
             self.populationValues = None
             self._calculateHist()
             return
 
         #metric == 3 -> look at the area (= pi * r^2)
         if self.populationMetric == 3:
-            self.populationValues = np.array([x.radius*x.radius*3.14 for x in self.blobSet.blobs])
+            self.populationValues = self.blobSet.getColumn('radius')**2*3.14
 
         #metric == 4 -> look at circularity
         elif self.populationMetric == 4:
-            self.populationValues = np.array([x.circularity for x in self.blobSet.blobs])
+            self.populationValues = np.array(self.blobSet.getColumn('circularity'))
             
         #metric == 5 -> look at minimum distance between samples
         elif self.populationMetric == 5:
@@ -147,7 +151,14 @@ class HistCanvas(MplCanvas):
             
         #metric == [0, 1, 2] -> look at intensities of [r, g, b] channel of image at imgInd
         else:
-            self.populationValues = np.array(self.model.slide.getFluorInt(self.blobSet.blobs, self.populationMetric, self.imgInd, self.offset, self.reduceMax))
+            #use intensities measured during blob finding when available
+            feature = blobFinder.featureName(self.imgInd, self.populationMetric, self.reduceMax)
+            if self.offset == 0 and self.blobSet.hasFeature(feature):
+                self.populationValues = self.blobSet.getFeature(feature)
+                self.intensityRegion = 'blob pixels'
+            else:
+                self.intensityRegion = 'bounding square'
+                self.populationValues = np.array(self.model.slide.getFluorInt(self.blobSet.blobs, self.populationMetric, self.imgInd, self.offset, self.reduceMax))
             
         self._calculateHist()
     
@@ -315,8 +326,7 @@ class HistCanvas(MplCanvas):
             else:
                 tempbool = self.populationValues < self.lowIntens
 
-            lowblbs = [self.blobSet.blobs[i] for i in np.where(tempbool)[0]]
-            result.append(self.blobSet.partialDeepCopy(lowblbs))
+            result.append(self.blobSet.partialDeepCopy(np.where(tempbool)[0], 'histogram'))
             result[-1].filters.append(self._getFilterDescription(self.lowLimit, self.lowIntens))
                 
         #high intensity
@@ -326,8 +336,7 @@ class HistCanvas(MplCanvas):
             else:
                 tempbool = self.populationValues >  self.highIntens
                 
-            highblbs = [self.blobSet.blobs[i] for i in np.where(tempbool)[0]]
-            result.append(self.blobSet.partialDeepCopy(highblbs))
+            result.append(self.blobSet.partialDeepCopy(np.where(tempbool)[0], 'histogram'))
             result[-1].filters.append(self._getFilterDescription(self.highIntens, self.highLimit))
 
         return result
@@ -408,7 +417,7 @@ class HistCanvas(MplCanvas):
                 #add the low threshold blobs to the blob subset to pass to slideCanvas
                 if np.any(tempbool2):
                     blbSubset.append(copy(self.blobSet))
-                    blbSubset[-1].blobs = [self.blobSet.blobs[i] for i in np.where(tempbool2)[0]]
+                    blbSubset[-1].blobs = self.blobSet.blobs[np.where(tempbool2)[0]]
                     blbSubset[-1].description = 'low'
                     blbSubset[-1].threshCutoff = int(self.lowIntens)
                     blbColors.append(GUIConstants.LOW_BAR)
@@ -427,7 +436,7 @@ class HistCanvas(MplCanvas):
                 #add the high threshold blobs to the blob subset to pass to slideCanvas
                 if np.any(tempbool2):
                     blbSubset.append(copy(self.blobSet))
-                    blbSubset[-1].blobs = [self.blobSet.blobs[i] for i in np.where(tempbool2)[0]]
+                    blbSubset[-1].blobs = self.blobSet.blobs[np.where(tempbool2)[0]]
                     blbSubset[-1].color = GUIConstants.HIGH_BAR
                     blbSubset[-1].description = 'high'
                     blbSubset[-1].threshCutoff = int(self.highIntens)
@@ -449,7 +458,7 @@ class HistCanvas(MplCanvas):
                     tempbool = tempbool & (self.populationValues >= self.bins[ind-1])
                 if np.any(tempbool):
                     blbSubset.append(copy(self.blobSet))
-                    blbSubset[-1].blobs = [self.blobSet.blobs[i] for i in np.where(tempbool)[0]]
+                    blbSubset[-1].blobs = self.blobSet.blobs[np.where(tempbool)[0]]
                     blbSubset[-1].description = 'single'
                     blbSubset[-1].threshCutoff = int(self.bins[ind])
                     if self.moveSlide == True:
@@ -496,7 +505,8 @@ class HistCanvas(MplCanvas):
         #colors are labeled as intensity and limited to 0,255 
         else:
             self.xlo, self.xhi = 0,255
-            self.axes.set_xlabel('Intensity')
+            self.axes.set_xlabel('Intensity' if self.intensityRegion is None 
+                                 else 'Intensity ({})'.format(self.intensityRegion))
 
         self.redraw_zoom()
         
\ No newline at end of file
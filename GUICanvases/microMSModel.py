@@ -1,9 +1,6 @@
 
 from PIL import ImageDraw, ImageFont
 import matplotlib as mpl
-from matplotlib.path import Path
-from matplotlib.collections import PatchCollection
-import matplotlib.pyplot as plt
 import os
 import random
 from scipy.spatial.distance import pdist
@@ -13,11 +10,12 @@ from copy import deepcopy, copy
 from GUICanvases import GUIConstants
 
 from ImageUtilities import slideWrapper
-from ImageUtilities import blobFinder
 from ImageUtilities import blob
 from ImageUtilities import TSPutil
 from ImageUtilities.enumModule import Direction, StepSize
 from ImageUtilities import blobList
+from ImageUtilities import blobPreview
+from ImageUtilities import thresholdEstimator
 
 from CoordinateMappers import supportedCoordSystems
 
@@ -34,6 +32,8 @@ class MicroMSModel(object):
         GUI: the supporting GUI
         '''
         self.slide = None
+        self.preview = None
+        self.thresholds = None
         self.coordinateMapper = supportedCoordSystems.supportedMappers[0]
         self.GUI = GUI
         self.resetVariables()
@@ -45,6 +45,10 @@ class MicroMSModel(object):
         '''
         self.slide = slideWrapper.SlideWrapper(filename)
         self.resetVariables()
+        #cached, downsampled blob finding of the current view
+        self.preview = blobPreview.blobPreview(self.slide)
+        #cached intensity histograms for threshold suggestions
+        self.thresholds = thresholdEstimator.thresholdEstimator(self.slide)
 
     def resetVariables(self):
         '''
@@ -298,13 +302,16 @@ class MicroMSModel(object):
         '''
         return self.coordinateMapper.instrumentExtension
 
-    def runGlobalBlobFind(self):
+    def runGlobalBlobFind(self, progress = None, cancel = None):
         '''
         Performs global blob finding on the current slide and sets to current blob list
+        progress: function called with progress dicts, see blobFinder.blobSlideIter
+        cancel: a threading.Event checked between subregions, set to stop early
         '''
         if self.slide is None:
             return "No slide was open"
-        return self.blobCollection[self.currentBlobs].blobSlide() + " in list {}".format(self.currentBlobs+1)
+        return self.blobCollection[self.currentBlobs].blobSlide(progress, cancel) + \
+            " in list {}".format(self.currentBlobs+1)
 
     def updateCurrentBlobs(self, newBlobs):
         if not isinstance(newBlobs, blobList.blobList):
@@ -351,6 +358,41 @@ class MicroMSModel(object):
         endLen = self.currentBlobLength()
         return "{} blobs removed, {} remain in list {}".format(startLen - endLen, endLen, self.currentBlobs+1)
 
+    def nameROI(self, name):
+        '''
+        Saves the current ROI of the current list under a name
+        name: the name of the ROI
+        '''
+        if len(self.blobCollection[self.currentBlobs].ROI) < 3:
+            return "No ROI selected"
+        self.blobCollection[self.currentBlobs].nameROI(name)
+        return "Saved ROI {} in list {}".format(name, self.currentBlobs+1)
+
+    def namedRoiFilter(self, names, combine = 'union', inverse = False):
+        '''
+        Filters the current list with a combination of named ROIs
+        names: list of ROI names, None or empty for all named ROIs
+        combine: 'union', 'intersection' or 'difference'
+        inverse: set to remove the selected blobs instead of keeping them
+        '''
+        blbs = self.blobCollection[self.currentBlobs]
+        if self.currentBlobLength() == 0:
+            return "No blobs to filter"
+        if len(blbs.ROIs) == 0:
+            return "No named ROIs saved"
+        if names is None or len(names) == 0:
+            names = blbs.ROIs.names()
+        missing = [n for n in names if n not in blbs.ROIs.polygons]
+        if len(missing) != 0:
+            return "Unknown ROI {}".format(', '.join(missing))
+        startLen = self.currentBlobLength()
+        if inverse:
+            self.updateCurrentBlobs(blbs.roiFilterInverse(names, combine))
+        else:
+            self.updateCurrentBlobs(blbs.roiFilter(names, combine))
+        endLen = self.currentBlobLength()
+        return "{} blobs removed, {} remain in list {}".format(startLen - endLen, endLen, self.currentBlobs+1)
+
 
     def hexPackBlobs(self, separation, layers, dynamicLayering = False):
         '''
@@ -433,11 +475,11 @@ class MicroMSModel(object):
     def testBlobFind(self):
         '''
         Performs a test blob find on the current position
-        Sets the zoom level to the maximum value to match test blob finding
+        Uses the image at the current zoom level with size limits scaled to match,
+        zoom in to max zoom for the full resolution result
         '''
-        self.slide.lvl = 0
         if self.slide is not None:
-            self.tempBlobs = self.blobCollection[self.currentBlobs].blobFinder.blobImg()
+            self.tempBlobs = self.blobCollection[self.currentBlobs].blobFinder.blobImg(self.preview)
 
     def setCurrentBlobs(self, ind):
         '''
@@ -465,49 +507,82 @@ class MicroMSModel(object):
         '''
         #show the threshold image produced by blobfinder helper method
         if self.showThreshold:
-            im, num = blobFinder.blobFinder._blbThresh(self.slide.getImg(),
-                                                        self.blobCollection[self.currentBlobs].blobFinder.colorChannel,
-                                                        self.blobCollection[self.currentBlobs].blobFinder.threshold)
+            im, num = self.preview.getLabels(self.blobCollection[self.currentBlobs].blobFinder.colorChannel,
+                                             self.blobCollection[self.currentBlobs].blobFinder.threshold)
             return im                                  
         #else, use current image view     
         else:
             return self.slide.getImg()
 
-    def getPatches(self, limitDraw):
+    def getImageRequest(self):
         '''
-        Gets the patches of all blobs, registration marks and predicted points.
+        Gets a reader of the image of the current view which can run off the GUI thread.
+        The reader uses a copy of the view, so later moves and zooms do not change its result
+        returns (key, reader)
+            key: tuple identifying the slide and view, None if the image must be read with getCurrentImage
+            reader: function returning the image of the view as an np array
+        '''
+        #threshold images use the cached preview of the shared slide
+        if self.showThreshold:
+            return None, lambda: np.asarray(self.getCurrentImage())
+        view = copy(self.slide)
+        view.pos = list(self.slide.pos)
+        view.size = list(self.slide.size)
+        view.displaySlides = list(self.slide.displaySlides)
+        #the slide identity keeps views of a newly opened slide from matching the old image
+        key = (self.slide.fileName, id(self.slide), tuple(view.pos), view.lvl, 
+               tuple(view.size), tuple(view.displaySlides), view.brightInd)
+        return key, lambda: np.asarray(view.getImg())
+
+    def _inView(self, points):
+        '''
+        Helper method to find the global points within the current view of the slide
+        points: list of (x,y) global points
+        returns (an (n,2) np array of the points in view, np array of their indices)
+        '''
+        points = np.asarray(points, dtype = np.float64).reshape((-1, 2))
+        xlow, ylow = self.slide.getGlobalPoint((0,0))
+        xhigh, yhigh = self.slide.getGlobalPoint(self.slide.size)
+        inds = np.nonzero((points[:,0] >= xlow) & (points[:,0] <= xhigh) &
+                          (points[:,1] >= ylow) & (points[:,1] <= yhigh))[0]
+        return points[inds], inds
+
+    def drawOverlay(self, overlay, limitDraw):
+        '''
+        Updates the markups and labels of all blobs, registration marks and predicted points.
+        overlay: the overlayRenderer of the slide canvas, its layers are updated in place
         limitDraw: boolean toggle to limit the number of blobs to draw
         '''
-        ptches = []
+        overlay.begin()
         #nothing requested or nothing to show
         if self.showPatches == False or self.slide is None:
-            return PatchCollection(ptches)
+            overlay.finish()
+            return
+        overlay.setView(self.slide)
 
         #temp blobs from blob finding test.  Only drawn once and the only displayed thing
         if self.tempBlobs is not None:
-            ptches = [plt.Circle((blb.X, blb.Y),
-                                  blb.radius,
-                                  color = GUIConstants.TEMP_BLOB_FIND,
-                                  linewidth = 1,
-                                  fill = False)
-                       for blb in self.tempBlobs]
+            #temp blobs are in local coordinates
+            xlow, ylow = self.slide.getGlobalPoint((0,0))
+            scale = 2**self.slide.lvl
+            overlay.setCircles('temp',
+                               np.array([blb.X for blb in self.tempBlobs]) * scale + xlow,
+                               np.array([blb.Y for blb in self.tempBlobs]) * scale + ylow,
+                               np.array([blb.radius for blb in self.tempBlobs]) * scale,
+                               GUIConstants.TEMP_BLOB_FIND)
             #reset temp blobs
             self.tempBlobs = None
-            #return patches, if none to show match_original needs to be false
-            return PatchCollection(ptches, match_original=(len(ptches) != 0))
+            self.drawLabels(overlay)
+            overlay.finish()
+            return
         
         #draw predicted points from coordinate mapper
         lineWid = 1 if 6-self.slide.lvl < 1 else 6-self.slide.lvl   
         if self.showPrediction and len(self.coordinateMapper.physPoints) >= 2:
-            points, inds = self.slide.getPointsInBounds(self.coordinateMapper.predictedPoints())
-            ptches.extend(
-                    [plt.Circle(p, GUIConstants.FIDUCIAL_RADIUS/2**self.slide.lvl,
-                                color = GUIConstants.PREDICTED_POINTS,
-                                linewidth = lineWid,
-                                fill = False)
-                     for p in points]
-                )
-
+            points, inds = self._inView(self.coordinateMapper.predictedPoints())
+            overlay.setCircles('predicted', points[:,0], points[:,1],
+                               np.full(len(points), GUIConstants.FIDUCIAL_RADIUS),
+                               GUIConstants.PREDICTED_POINTS, lineWid)
             
         #draw fiducial labels, color blended by deviation
         if len(self.coordinateMapper.physPoints) > 2:
@@ -523,55 +598,67 @@ class MicroMSModel(object):
         good = mpl.colors.colorConverter.to_rgb(GUIConstants.FIDUCIAL)
         bad = mpl.colors.colorConverter.to_rgb(GUIConstants.FIDUCIAL_WORST)
 
-        points, inds = self.slide.getPointsInBounds(self.coordinateMapper.pixelPoints)
-        for i,p in enumerate(points):
-            #blend color based on deviation
-            d = deviations[inds[i]]
-            col = tuple(d * x + (1-d) * y for x,y in zip(bad, good))
-            ptches.append(
-                plt.Circle(p, GUIConstants.FIDUCIAL_RADIUS/2**self.slide.lvl,
-                            color = col,
-                            linewidth = lineWid,
-                            fill=False)
-                )
+        points, inds = self._inView(self.coordinateMapper.pixelPoints)
+        #blend color based on deviation
+        cols = [tuple(deviations[i] * x + (1-deviations[i]) * y for x,y in zip(bad, good))
+                for i in inds]
+        overlay.setCircles('fiducials', points[:,0], points[:,1],
+                           np.full(len(points), GUIConstants.FIDUCIAL_RADIUS),
+                           cols if len(cols) != 0 else GUIConstants.FIDUCIAL, lineWid)
 
         #draw region of interest
-        ptches.extend(self.getROIPatches())
+        self.drawROI(overlay)
 
         #draw histogram blobs
         if self.histogramBlobs is not None and len(self.histogramBlobs) != 0:
             for i, blbs in enumerate(self.histogramBlobs):
-                ptches.extend(blbs.getPatches(limitDraw, self.slide, self.histColors[i]))
+                self._drawBlobMarkups(overlay, 'histogram{}'.format(i), blbs, limitDraw,
+                                      self.histColors[i])
 
         #draw blobs
         else:
             #draw all blob lists with their own color
             if self.drawAllBlobs == True:
                 for j, blobs in enumerate(self.blobCollection):
-                    ptches.extend(blobs.getPatches(limitDraw, self.slide, GUIConstants.MULTI_BLOB[j]))
+                    self._drawBlobMarkups(overlay, 'blobs{}'.format(j), blobs, limitDraw,
+                                          GUIConstants.MULTI_BLOB[j])
 
             #show only the current blob list
             else:
-                ptches.extend(self.blobCollection[self.currentBlobs].getPatches(limitDraw, self.slide,
-                                                                                GUIConstants.MULTI_BLOB[self.currentBlobs]))
+                self._drawBlobMarkups(overlay, 'blobs{}'.format(self.currentBlobs), 
+                                      self.blobCollection[self.currentBlobs], limitDraw,
+                                      GUIConstants.MULTI_BLOB[self.currentBlobs])
+
+        #the text labels are drawn over the blobs
+        self.drawLabels(overlay)
+        overlay.finish()
 
-        #return list of patches as a patch collection, if none match_original must be false
-        return PatchCollection(ptches, match_original=(len(ptches) != 0))
+    def _drawBlobMarkups(self, overlay, name, blobs, limitDraw, color):
+        '''
+        Helper method to update the overlay layers of a blob list
+        overlay: the overlayRenderer to update
+        name: the name of the layers of the list
+        blobs: the blobList to draw
+        limitDraw: boolean toggle to limit the number of blobs to draw
+        color: color of the blobs
+        '''
+        xs, ys, rs, cells = blobs.getMarkups(limitDraw, self.slide)
+        overlay.setCircles(name, xs, ys, rs, color)
+        if cells is not None:
+            cx, cy, size, alphas = cells
+            overlay.setCells(name, cx, cy, size, color, alphas)
 
-    def getROIPatches(self, newPoint = None, append = False):
-        ptches = []
+    def drawROI(self, overlay, newPoint = None, append = False):
+        '''
+        Updates the ROI layer of the overlay
+        overlay: the overlayRenderer to update
+        newPoint: global point to preview adding or removing from the ROI, None for the current ROI
+        append: if true, preview the point at the end of the ROI
+        '''
         tROI = self.blobCollection[self.currentBlobs].getROI(newPoint, GUIConstants.ROI_DIST *2**self.slide.lvl, append)
 
         if len(tROI) > 1:
-            verts = []
-            for roi in tROI:
-                verts.append(self.slide.getLocalPoint(roi))
-            verts.append(self.slide.getLocalPoint(tROI[0]))
-            ptches.append(mpl.patches.PathPatch(Path(verts, None),
-                                                color = GUIConstants.ROI,
-                                                fill = False))
-
-        return ptches
+            overlay.setLine('ROI', list(tROI) + [tROI[0]], GUIConstants.ROI)
 
     def reportROI(self, point, append = False):
         '''
@@ -583,10 +670,11 @@ class MicroMSModel(object):
                                                           GUIConstants.ROI_DIST *2**self.slide.lvl,
                                                           append)
 
-    def drawLabels(self, axes):
+    def drawLabels(self, overlay):
         '''
-        draw text labels on the supplied axis.  Assume the axis is displaying the
-        slide image and blobs of the current state of everything.
+        Updates the text labels of the fiducials and blob groups.  Assume the overlay
+        is displaying the slide image and blobs of the current state of everything.
+        overlay: the overlayRenderer of the slide canvas, its label layers are updated in place
         '''
         if self.slide is None or self.showPatches == False:
             return
@@ -607,54 +695,53 @@ class MicroMSModel(object):
         good = mpl.colors.colorConverter.to_rgb(GUIConstants.FIDUCIAL)
         bad = mpl.colors.colorConverter.to_rgb(GUIConstants.FIDUCIAL_WORST)
 
-        points, inds = self.slide.getPointsInBounds(self.coordinateMapper.pixelPoints)
-        for i,p in enumerate(points):
-            #blend color based on deviation
-            d = deviations[inds[i]]
-            col = tuple(d * x + (1-d) * y for x,y in zip(bad, good))
-
-            axes.text(p[0] + GUIConstants.FIDUCIAL_RADIUS/2**self.slide.lvl,
-                        p[1] - GUIConstants.FIDUCIAL_RADIUS/2**self.slide.lvl,
-                        self.coordinateMapper.predictLabel(self.coordinateMapper.physPoints[inds[i]]),
-                        fontsize = lineWid + 6,
-                        fontweight='bold',
-                        color = col,
-                        bbox=dict(facecolor=GUIConstants.FIDUCIAL_LABEL_BKGRD))
+        points, inds = self._inView(self.coordinateMapper.pixelPoints)
+        #blend color based on deviation
+        cols = [tuple(deviations[i] * x + (1-deviations[i]) * y for x,y in zip(bad, good))
+                for i in inds]
+        overlay.setLabels('fiducialLabels',
+                          points[:,0] + GUIConstants.FIDUCIAL_RADIUS,
+                          points[:,1] - GUIConstants.FIDUCIAL_RADIUS,
+                          [self.coordinateMapper.predictLabel(self.coordinateMapper.physPoints[i])
+                           for i in inds],
+                          cols if len(cols) != 0 else GUIConstants.FIDUCIAL,
+                          lineWid + 6,
+                          weight = 'bold',
+                          background = GUIConstants.FIDUCIAL_LABEL_BKGRD)
         #show group labels
         #hist blobs have no text
         if self.histogramBlobs is not None and len(self.histogramBlobs) != 0:
             pass
         #normal blobs can have group labels
         else:
-            pass
             #show group names of all lists
             if self.drawAllBlobs == True:
-                for blobs in self.blobCollection:
-                    self._drawBlobLabels(axes, blobs, lineWid)
+                for j, blobs in enumerate(self.blobCollection):
+                    self._drawBlobLabels(overlay, 'labels{}'.format(j), blobs, lineWid)
 
             #show only the current list
             else:
-                self._drawBlobLabels(axes, self.blobCollection[self.currentBlobs], lineWid)
+                self._drawBlobLabels(overlay, 'labels{}'.format(self.currentBlobs),
+                                     self.blobCollection[self.currentBlobs], lineWid)
 
-    def _drawBlobLabels(self, axes, blobs, lineWid):
+    def _drawBlobLabels(self, overlay, name, blobs, lineWid):
         '''
-        Helper method to draw blob labels onto the provided axis
-        axes: matplotlib axes to draw text to
+        Helper method to update the group label layer of a blob list
+        overlay: the overlayRenderer to update
+        name: the name of the label layer of the list
         blobs: blobList with labels to draw
         lineWid: the linewidth to use for drawing 
         '''
-        #get grouplabels from blobs
-        labels = list(blobs.groupLabels.keys())
-        pos = list(blobs.groupLabels.values())
+        #get grouplabels in view from blobs, thinned for the zoom level
+        xs, ys, labels = blobs.getVisibleLabels(self.slide, GUIConstants.LABEL_SPACING)
         if len(labels) != 0:
-            points, inds = self.slide.getPointsInBounds(pos)
-            for i,p in enumerate(points):
-                #add offset from normal position
-                axes.text(p[0]+GUIConstants.DEFAULT_RADIUS/2**self.slide.lvl,
-                                p[1]-GUIConstants.DEFAULT_RADIUS/2**self.slide.lvl,
-                                labels[inds[i]],
-                                fontsize=lineWid+6, 
-                                color=GUIConstants.EXPANDED_TEXT)
+            #add offset from normal position
+            overlay.setLabels(name,
+                              xs + GUIConstants.DEFAULT_RADIUS,
+                              ys - GUIConstants.DEFAULT_RADIUS,
+                              [str(l) for l in labels],
+                              GUIConstants.EXPANDED_TEXT,
+                              lineWid + 6)
 
     def reportInfoRequest(self, localPoint):
         '''
@@ -674,28 +761,20 @@ class MicroMSModel(object):
             if self.blobCollection[self.currentBlobs] is not None and \
                 self.blobCollection[self.currentBlobs].length() > 0:
 
-                points, inds = self.slide.getPointsInBounds(blob.blob.getXYList(self.blobCollection[self.currentBlobs].blobs))
-                found = False
-                for i,p in enumerate(points):
-                    #see if click point is within radius
-                    if (localPoint[0]-p[0])**2 + (localPoint[1] - p[1])**2 <= \
-                        (self.blobCollection[self.currentBlobs].blobs[inds[i]].radius/2**self.slide.lvl)**2:
-                            self.GUI.histCanvas.singleBlob = inds[i]
-                            found = True
-                            break
-                #if not found, set to None
-                if not found:
-                    self.GUI.histCanvas.singleBlob = None
+                #see if click point is within radius, None if not found
+                self.GUI.histCanvas.singleBlob = \
+                    self.blobCollection[self.currentBlobs].blobAt(point)
 
         #get pixel color and alpha (discarded)
         try:
-            r,g,b,a = self.slide.getImg().getpixel(localPoint)
+            r,g,b,a = self.preview.getImage().getpixel(localPoint)
         except IndexError:
             r,g,b = 0,0,0
 
         #get the size and circ of an area > thresh if on blb view
         if self.showThreshold:
-            area,circ = self.blobCollection[self.currentBlobs].blobFinder.getBlobCharacteristics(localPoint)
+            area,circ = self.blobCollection[self.currentBlobs].blobFinder.getBlobCharacteristics(localPoint, 
+                                                                                                 self.preview)
             return "x = %d, y = %d r,g,b = %d,%d,%d\tArea = %d\tCirc = %.2f"%(point[0], point[1], r, g, b, area, circ)
 
         #get fiducial localization error if in a fiducial
@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 import os
+import threading
 from PyQt5 import QtGui, QtCore, QtWidgets
 
 from CoordinateMappers import supportedCoordSystems
@@ -7,6 +8,7 @@ from CoordinateMappers import connectedInstrument
 
 from ImageUtilities.slideWrapper import SlideWrapper
 from ImageUtilities.enumModule import Direction, StepSize
+from ImageUtilities import roiEngine
 
 from GUICanvases.histCanvas import HistCanvas
 from GUICanvases.slideCanvas import SlideCanvas
@@ -45,6 +47,8 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
         
         self.showHist = False
 
+        #set while global blob finding is running to allow cancelling
+        self.blobFindCancel = None
         
         self.main_widget.setFocus()
         self.setCentralWidget(self.main_widget)
@@ -155,6 +159,8 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
         self.tools_menu.addAction('Distance Filter',self.distanceFilter)
         self.tools_menu.addAction('ROI Filter Retain',self.roiFilter)
         self.tools_menu.addAction('ROI Filter Remove',self.roiFilterInverse)
+        self.tools_menu.addAction('Name Current ROI',self.nameROI)
+        self.tools_menu.addAction('Named ROI Filter',self.namedRoiFilter)
         self.tools_menu.addSeparator()
         self.tools_menu.addAction('Rectangular Pack', self.rectPack)
         self.tools_menu.addAction('Hexagonal Pack', self.hexPack)
@@ -399,7 +405,7 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
             fileName = QtWidgets.QFileDialog.getSaveFileName(self,
                                                      "Select save file",
                                                      self.directory,
-                                                     filter='*.txt')
+                                                     filter='*.txt;;*.blb')
             f = os.path.splitext(fileName[0])[0]
             ex = os.path.splitext(fileName[1])[1]
             fileName = f+ex
@@ -419,7 +425,7 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
             fileName = QtWidgets.QFileDialog.getSaveFileName(self,
                                                      "Select save file",
                                                      self.directory,
-                                                     filter='*.txt')
+                                                     filter='*.txt;;*.blb')
             f = os.path.splitext(fileName[0])[0]
             ex = os.path.splitext(fileName[1])[1]
             fileName = f+ex
@@ -439,7 +445,7 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
             fileName = QtWidgets.QFileDialog.getSaveFileName(self,
                                                      "Select save file",
                                                      self.directory,
-                                                     filter='*.txt')
+                                                     filter='*.txt;;*.blb')
             f = os.path.splitext(fileName[0])[0]
             ex = os.path.splitext(fileName[1])[1]
             fileName = f+ex
@@ -550,7 +556,7 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
             fileName = QtWidgets.QFileDialog.getOpenFileName(
                 self, 'Open File',
                 self.directory,
-                filter='*.txt')[0]  
+                filter='*.txt *.blb')[0]  
         else:
             fileName = extras.fileName
 
@@ -594,6 +600,9 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
         '''
         print the filename of the image that was displayed prior to closing
         '''
+        #stop a running blob find, which returns once this event is processed
+        if self.blobFindCancel is not None:
+            self.blobFindCancel.set()
         if self.model.coordinateMapper.isConnectedToInstrument == True  and\
             self.model.coordinateMapper.connectedInstrument.connected == True:
             self.model.coordinateMapper.connectedInstrument.homeAll()
@@ -603,17 +612,55 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
     def globalBlob(self, extras = None):
         '''
         blob find over the entire slide area or ROI
+        A cancelled blob find keeps the blobs found so far, but is not saved
         '''
+        #already running, the event loop is processed during blob finding
+        if self.blobFindCancel is not None:
+            return
         self.statusBar().showMessage('Starting blob finding')
-        self.statusBar().showMessage(
-            self.model.runGlobalBlobFind()    
-        )
-        self.saveAll(extras)
+        self.blobFindCancel = threading.Event()
+        #nothing that changes the slide or blob lists can run until blob finding ends
+        self.setBlobFindRunning(True)
+        try:
+            message = self.model.runGlobalBlobFind(self.reportBlobFindProgress, self.blobFindCancel)
+            cancelled = self.blobFindCancel.is_set()
+        finally:
+            self.setBlobFindRunning(False)
+            self.blobFindCancel = None
+        if cancelled:
+            self.statusBar().showMessage(message + ', partial result not saved')
+        else:
+            self.statusBar().showMessage(message)
+            self.saveAll(extras)
         self.slideCanvas.draw()
         
         if self.showHist == True:
             self.toggleHistWindow()
         
+    def setBlobFindRunning(self, running):
+        '''
+        Disables the menus, canvases and popups while global blob finding runs
+        running: true to disable, false to enable
+        '''
+        self.menuBar().setEnabled(not running)
+        self.slideCanvas.setEnabled(not running)
+        self.histCanvas.setEnabled(not running)
+        for popup in self.popups.values():
+            popup.setEnabled(not running)
+
+    def reportBlobFindProgress(self, event):
+        '''
+        displays the progress of global blob finding and keeps the GUI responsive
+        event: a progress dict from blobFinder.blobSlideIter
+        '''
+        if not event['finished']:
+            self.statusBar().showMessage(
+                'Blob finding: {} of {} areas, {} blobs, {:.1f} MB/s, {:.0f} seconds left (Esc to cancel)'
+                .format(event['tilesDone'], event['totalTiles'], event['blobsFound'],
+                        event['bytesRead'] / 2**20 / max(event['elapsed'], 1e-6), event['remaining']))
+        #process the event loop between subregions so a cancel can be requested
+        QtWidgets.QApplication.processEvents()
+
     def blbPopup(self):
         '''
         popup the blob finding parameters
@@ -767,6 +814,54 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
             self.histCanvas.calculateHist()
         self.slideCanvas.draw()
 
+    def nameROI(self, extras = None):
+        '''
+        Saves the current ROI under a name for filtering with several ROIs
+        '''
+        if extras is None or not hasattr(extras, 'text'):
+            text,ok = QtWidgets.QInputDialog.getText(self, "Input Required",  "Input ROI name")
+        else:
+            text = extras.text
+            ok = extras.ok
+
+        if ok and not text == '':
+            self.statusBar().showMessage(
+                self.model.nameROI(text)
+            )
+
+    def namedRoiFilter(self, extras = None):
+        '''
+        Filters blobs with a combination of named ROIs
+        '''
+        if extras is None or not hasattr(extras, 'text'):
+            text,ok = QtWidgets.QInputDialog.getText(self, "Input Required",  
+                                                     "Input ROI names separated by commas, blank for all")
+            if not ok:
+                return
+            combine,ok = QtWidgets.QInputDialog.getItem(self, "Input Required", "Combine ROIs by",
+                                                        roiEngine.roiSet.combinations, 0, False)
+            if not ok:
+                return
+            reply = QtWidgets.QMessageBox.question(self, 'Filter',
+                                                   'Retain blobs in the selection?',
+                                                   buttons = QtWidgets.QMessageBox.No | QtWidgets.QMessageBox.Yes,
+                                                   defaultButton = QtWidgets.QMessageBox.Yes)
+            inverse = reply == QtWidgets.QMessageBox.No
+        else:
+            text = extras.text
+            ok = extras.ok
+            combine = extras.combine if hasattr(extras, 'combine') else 'union'
+            inverse = extras.inverse if hasattr(extras, 'inverse') else False
+
+        if ok:
+            names = [n.strip() for n in text.split(',') if n.strip() != '']
+            self.statusBar().showMessage(
+                self.model.namedRoiFilter(names, combine, inverse)
+            )
+            if self.showHist:
+                self.histCanvas.calculateHist()
+            self.slideCanvas.draw()
+
     def rectPack(self, extras = None):
         '''
         expand each spot into a rectangularly packed grid
@@ -982,6 +1077,15 @@ class MicroMSQTWindow(QtWidgets.QMainWindow):
         '''
         key press event handler.  Key presses on parent GUI are forwarded here
         '''
+        #escape cancels a running global blob find
+        if event.key() == QtCore.Qt.Key_Escape and self.blobFindCancel is not None:
+            self.blobFindCancel.set()
+            self.statusBar().showMessage('Cancelling blob finding')
+            return
+        #other hotkeys change the view or blobs under the running blob find
+        if self.blobFindCancel is not None:
+            return
+
         if self.model.slide is not None:
             shift = event.modifiers() & QtCore.Qt.ShiftModifier
             #move with wsad
@@ -0,0 +1,255 @@
+import numpy as np
+import matplotlib as mpl
+from matplotlib.collections import EllipseCollection, PathCollection, PolyCollection
+from matplotlib.font_manager import FontProperties
+from matplotlib.lines import Line2D
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
+
+class overlayRenderer(object):
+    '''
+    Persistent matplotlib artists for the markups drawn over the slide image.
+    Each named layer keeps one collection in global slide coordinates, which is
+    mapped to the displayed image by an affine view transform.  Panning and zooming
+    change the view transform and the offsets of the visible markups, no artists are
+    created after the first frame that shows a layer.
+    A frame is drawn by calling begin, updating each shown layer and finish, layers
+    not updated during the frame are hidden.
+    Text labels are drawn as glyph outlines, one collection per layer instead of one text
+    artist per label.  The outline of each string is cached, so labels seen in earlier
+    frames are not laid out again.
+    '''
+    def __init__(self, axes, animated = False):
+        '''
+        Create a renderer for an axes
+        axes: the matplotlib axes showing the slide image in local coordinates
+        animated: if true, the artists are left out of full figure draws and are
+            drawn with drawArtists when blitting
+        '''
+        self.axes = axes
+        self.animated = animated
+        #global slide coordinates -> local image coordinates
+        self.view = Affine2D()
+        self.scale = 1
+        self.circles = dict()
+        self.cells = dict()
+        self.lines = dict()
+        #name -> (background collection, text collection)
+        self.labels = dict()
+        #(text, weight) -> TextPath of the text at a font size of 1
+        self.textPaths = dict()
+        self.updated = set()
+
+    def _transform(self):
+        '''
+        helper function to get the transform from global coordinates to the display
+        '''
+        return self.view + self.axes.transData
+
+    def _artists(self):
+        '''
+        helper function to get every artist of every layer
+        '''
+        return list(self.circles.values()) + list(self.cells.values()) + \
+            list(self.lines.values()) + [c for layer in self.labels.values() for c in layer]
+
+    def _add(self, artist):
+        '''
+        helper function to add a new artist to the axes
+        '''
+        artist.set_animated(self.animated)
+        if isinstance(artist, Line2D):
+            self.axes.add_line(artist)
+        else:
+            self.axes.add_collection(artist, autolim = False)
+
+    def setAnimated(self, animated):
+        '''
+        Sets if the artists are drawn by full figure draws or only by drawArtists
+        animated: if true, the artists are only drawn by drawArtists
+        '''
+        self.animated = animated
+        for artist in self._artists():
+            artist.set_animated(animated)
+
+    def drawArtists(self):
+        '''
+        Draws the visible layers with the renderer of the last figure draw,
+        used to redraw animated layers when blitting
+        '''
+        for artist in self._artists():
+            if artist.get_visible():
+                self.axes.draw_artist(artist)
+
+    def setView(self, slideWrapper):
+        '''
+        Sets the view transform to the current position and zoom of a slide
+        slideWrapper: the slide with the current view
+        '''
+        xlow, ylow = slideWrapper.getGlobalPoint((0,0))
+        self.scale = 2**slideWrapper.lvl
+        self.view.clear().translate(-xlow, -ylow).scale(1 / self.scale)
+
+    def begin(self):
+        '''
+        Starts a new frame, any layer not updated before finish will be hidden
+        '''
+        self.updated = set()
+
+    def finish(self):
+        '''
+        Ends a frame, hides the layers not updated and adds the artists back to the
+        axes if it was cleared
+        '''
+        for layers in (self.circles, self.cells, self.lines):
+            for name, artist in layers.items():
+                artist.set_visible(name in self.updated)
+        for name, (boxCollection, textCollection) in self.labels.items():
+            textCollection.set_visible(name in self.updated)
+            boxCollection.set_visible(name in self.updated and len(boxCollection.get_paths()) != 0)
+        self.attach()
+
+    def attach(self):
+        '''
+        Adds every artist back to the axes if it was removed by clearing the axes
+        '''
+        children = set(self.axes.get_children())
+        for artist in self._artists():
+            if artist not in children:
+                self._add(artist)
+
+    def setCircles(self, name, xs, ys, rs, color, linewidth = 1):
+        '''
+        Updates a layer of unfilled circles
+        name: the name of the layer
+        xs, ys, rs: np arrays of the centers and radii in global coordinates
+        color: edge color of every circle, or a list of colors of each circle
+        linewidth: width of the circle edges
+        '''
+        self.updated.add(name)
+        offsets = np.column_stack((xs, ys)) if len(xs) != 0 else np.zeros((0, 2))
+        #the sizes of 'xy' ellipses are in local coordinates
+        diameters = 2 * np.asarray(rs, dtype = np.float64) / self.scale
+        collection = self.circles.get(name)
+        if collection is None:
+            collection = EllipseCollection(diameters, diameters, np.zeros(len(diameters)),
+                                           units = 'xy',
+                                           offsets = offsets,
+                                           offset_transform = self._transform(),
+                                           facecolors = 'none')
+            self.circles[name] = collection
+            self._add(collection)
+        else:
+            collection.set_offsets(offsets)
+            collection.set_widths(diameters)
+            collection.set_heights(diameters)
+            collection.set_angles(np.zeros(len(diameters)))
+        collection.set_edgecolors(color)
+        collection.set_linewidths(linewidth)
+
+    def setCells(self, name, xs, ys, size, color, alphas):
+        '''
+        Updates a layer of filled squares, used for aggregated blobs
+        name: the name of the layer
+        xs, ys: np arrays of the lower corners in global coordinates
+        size: side length of the squares in global coordinates
+        color: fill color of the squares
+        alphas: np array of the opacity of each square
+        '''
+        self.updated.add(name)
+        corners = np.array([[0, 0], [size, 0], [size, size], [0, size]], dtype = np.float64)
+        verts = np.column_stack((xs, ys))[:,None,:] + corners[None,:,:] if len(xs) != 0 \
+            else np.zeros((0, 4, 2))
+        colors = np.tile(mpl.colors.to_rgba(color), (len(verts), 1))
+        colors[:,3] = alphas
+        collection = self.cells.get(name)
+        if collection is None:
+            collection = PolyCollection(verts, linewidths = 0, transform = self._transform())
+            self.cells[name] = collection
+            self._add(collection)
+        else:
+            collection.set_verts(verts)
+        collection.set_facecolors(colors)
+
+    def setLine(self, name, points, color, linewidth = 1):
+        '''
+        Updates a layer of a single polyline
+        name: the name of the layer
+        points: list of (x,y) points in global coordinates
+        color: color of the line
+        linewidth: width of the line
+        '''
+        self.updated.add(name)
+        points = np.asarray(points, dtype = np.float64).reshape((-1, 2))
+        line = self.lines.get(name)
+        if line is None:
+            line = Line2D(points[:,0], points[:,1], transform = self._transform())
+            self.lines[name] = line
+            self._add(line)
+        else:
+            line.set_data(points[:,0], points[:,1])
+        line.set_color(color)
+        line.set_linewidth(linewidth)
+
+    def _textPath(self, text, weight):
+        '''
+        helper function to get the cached outline of a string
+        returns a TextPath with its baseline starting at the origin and a font size of 1
+        '''
+        key = (text, weight)
+        path = self.textPaths.get(key)
+        if path is None:
+            path = TextPath((0, 0), text, size = 1, prop = FontProperties(weight = weight))
+            self.textPaths[key] = path
+        return path
+
+    def setLabels(self, name, xs, ys, texts, color, fontsize, weight = 'normal', background = None):
+        '''
+        Updates a layer of text labels
+        name: the name of the layer
+        xs, ys: np arrays of the left end of the baseline of each label in global coordinates
+        texts: list of the strings of each label
+        color: color of every label, or a list of colors of each label
+        fontsize: size of the labels in points
+        weight: font weight of the labels
+        background: fill color of a box behind each label, None for no box
+        '''
+        self.updated.add(name)
+        offsets = np.column_stack((xs, ys)) if len(xs) != 0 else np.zeros((0, 2))
+        paths = [self._textPath(t, weight) for t in texts]
+        boxes = []
+        if background is not None:
+            #4 point padding, as the default text bbox
+            pad = 4.0 / fontsize
+            for path in paths:
+                e = path.get_extents()
+                boxes.append(Path([(e.x0 - pad, e.y0 - pad), (e.x1 + pad, e.y0 - pad),
+                                   (e.x1 + pad, e.y1 + pad), (e.x0 - pad, e.y1 + pad),
+                                   (e.x0 - pad, e.y0 - pad)], closed = True))
+
+        #glyphs are sized in points, converted to pixels at the dpi of each draw
+        size = Affine2D().scale(fontsize / 72.0) + self.axes.figure.dpi_scale_trans
+        layer = self.labels.get(name)
+        if layer is None:
+            layer = (PathCollection(boxes, offsets = offsets,
+                                    offset_transform = self._transform(),
+                                    transform = size),
+                     PathCollection(paths, offsets = offsets,
+                                    offset_transform = self._transform(),
+                                    transform = size))
+            self.labels[name] = layer
+            for collection in layer:
+                self._add(collection)
+        boxCollection, textCollection = layer
+        boxCollection.set_paths(boxes)
+        textCollection.set_paths(paths)
+        for collection in layer:
+            collection.set_offsets(offsets)
+            collection.set_transform(size)
+        if background is not None:
+            boxCollection.set_facecolors(background)
+            boxCollection.set_edgecolors('black')
+            boxCollection.set_linewidths(1)
+        textCollection.set_facecolors(color)
+        textCollection.set_edgecolors('none')
@@ -5,6 +5,8 @@ a collection of small, custom popup windows used by microMSQT
 
 from PyQt5 import QtWidgets
 
+from ImageUtilities import thresholdEstimator
+
 class blbPopupWindow(QtWidgets.QDialog):
     '''
     Window for setting blob finding parameters
@@ -32,6 +34,17 @@ class blbPopupWindow(QtWidgets.QDialog):
         self.channel.addItem("Red")
         self.channel.addItem("Green")
         self.channel.addItem("Blue")
+        self.channel.currentIndexChanged.connect(self.showSuggestions)
+        self.suggestMethod = QtWidgets.QComboBox(self)
+        for m in thresholdEstimator.thresholdEstimator.methods:
+            self.suggestMethod.addItem(m)
+        self.suggestButton = QtWidgets.QPushButton("Suggest Threshold",self)
+        self.suggestButton.clicked.connect(self.suggestThreshold)
+        self.suggestions = QtWidgets.QLabel("",self)
+        self.features = QtWidgets.QCheckBox("Measure All Channels", self)
+        self.exact = QtWidgets.QCheckBox("Keep Large Objects Whole", self)
+        self.flatten = QtWidgets.QCheckBox("Flatten Background", self)
+        self.budget = QtWidgets.QLineEdit(self)
 
         #add to vbox layout with labels
         vbox = QtWidgets.QVBoxLayout()
@@ -49,6 +62,16 @@ class blbPopupWindow(QtWidgets.QDialog):
         vbox.addWidget(self.imgInd)
         vbox.addWidget(QtWidgets.QLabel("Color",self)) 
         vbox.addWidget(self.channel)
+        hbox = QtWidgets.QHBoxLayout()
+        hbox.addWidget(self.suggestMethod)
+        hbox.addWidget(self.suggestButton)
+        vbox.addLayout(hbox)
+        vbox.addWidget(self.suggestions)
+        vbox.addWidget(self.features)
+        vbox.addWidget(self.exact)
+        vbox.addWidget(self.flatten)
+        vbox.addWidget(QtWidgets.QLabel("Memory Budget (MB)",self)) 
+        vbox.addWidget(self.budget)
         self.setButton = QtWidgets.QPushButton("Set Parameters",self)
         self.setButton.clicked.connect(self.setParams)
         vbox.addWidget(self.setButton)
@@ -65,6 +88,54 @@ class blbPopupWindow(QtWidgets.QDialog):
         self.intens.setText(str(blbFinder.threshold))
         self.imgInd.setText(str(blbFinder.imageIndex+1))
         self.channel.setCurrentIndex(blbFinder.colorChannel)
+        self.features.setChecked(blbFinder.measureFeatures)
+        self.exact.setChecked(blbFinder.exactComponents)
+        self.flatten.setChecked(blbFinder.subtractBackground)
+        self.budget.setText('' if blbFinder.memoryBudget is None else str(blbFinder.memoryBudget))
+        self.showSuggestions()
+
+    def _suggestionArgs(self):
+        '''
+        helper function to get the estimator, image index, channel and ROI for suggestions
+        returns None if no slide is open
+        '''
+        if self.master is None or self.master.model.thresholds is None:
+            return None
+        try:
+            imgInd = int(self.imgInd.text())-1
+        except:
+            return None
+        model = self.master.model
+        return (model.thresholds, imgInd, int(self.channel.currentIndex()),
+                model.blobCollection[model.currentBlobs].ROI)
+
+    def showSuggestions(self):
+        '''
+        displays the suggested thresholds of the current channel if the histogram is cached
+        '''
+        args = self._suggestionArgs()
+        if args is None:
+            return
+        estimator, imgInd, channel, roi = args
+        if estimator.isCached(imgInd, roi):
+            vals = estimator.suggest(imgInd, channel, roi)
+            self.suggestions.setText(', '.join('{} {}'.format(m, vals[m]) 
+                                               for m in thresholdEstimator.thresholdEstimator.methods))
+        else:
+            self.suggestions.setText('')
+
+    def suggestThreshold(self):
+        '''
+        sets the threshold to the suggestion of the selected method, reading the
+        histogram of the image channel if needed
+        '''
+        args = self._suggestionArgs()
+        if args is None:
+            return
+        estimator, imgInd, channel, roi = args
+        vals = estimator.suggest(imgInd, channel, roi)
+        self.intens.setText(str(vals[self.suggestMethod.currentText()]))
+        self.showSuggestions()
 
 
     def setParams(self):
@@ -103,7 +174,15 @@ class blbPopupWindow(QtWidgets.QDialog):
         except:
             self.imgInd.setText(str(self.blobFinder.imageIndex+1))
 
+        try:
+            self.blobFinder.memoryBudget = None if self.budget.text() == '' else int(self.budget.text())
+        except:
+            self.budget.setText('' if self.blobFinder.memoryBudget is None else str(self.blobFinder.memoryBudget))
+
         self.blobFinder.colorChannel = int(self.channel.currentIndex())
+        self.blobFinder.measureFeatures = self.features.isChecked()
+        self.blobFinder.exactComponents = self.exact.isChecked()
+        self.blobFinder.subtractBackground = self.flatten.isChecked()
         #blob find
         if self.master is not None:
             self.master.model.testBlobFind()
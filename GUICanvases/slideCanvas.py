@@ -7,13 +7,14 @@ from PyQt5.QtGui import QCursor
 import numpy as np
 import random
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import matplotlib.pyplot as plt
-from matplotlib.collections import PatchCollection
 from PIL import ImageDraw, ImageFont, Image
 
 from GUICanvases.mplCanvas import MplCanvas
 from GUICanvases import GUIConstants
+from GUICanvases import overlayRenderer
 from ImageUtilities import blobFinder
 from ImageUtilities import TSPutil
 from ImageUtilities import blob
@@ -25,7 +26,13 @@ class SlideCanvas(MplCanvas):
     '''
     A QWidget for displaying and interfacing slide images
     This also has quite a bit of control code
+    The slide image and markups are persistent, animated artists.  A redraw updates
+    their data and blits them over a cached background instead of drawing the whole
+    figure, and slide images are read on a worker thread with stale reads dropped.
     '''
+    #emitted by the image reader thread with (view key, image)
+    imageReady = QtCore.pyqtSignal(object, object)
+
     def __init__(self, master, model, *args, **kwargs):
         '''
         initialize a new instance of a slide canvas
@@ -54,6 +61,24 @@ class SlideCanvas(MplCanvas):
         self.model = model
         self.master = master
 
+        #persistent collections of the blobs, fiducials and ROI
+        self.overlay = overlayRenderer.overlayRenderer(self.axes, animated = True)
+        #persistent rectangle and circle drawn while dragging
+        self.dragRect = None
+        self.dragCirc = None
+
+        #persistent image of the slide, updated with set_data
+        self.image = None
+        self.imageKey = None        #view of the displayed image
+        self.requestedKey = None    #view of the latest image read
+        #figure without the animated artists, restored before blitting
+        self.background = None
+        self.saving = False
+        self.reader = ThreadPoolExecutor(max_workers = 1)
+        self.imageReady.connect(self._showImage)
+        self.mpl_connect('draw_event', self._captureBackground)
+        self.mpl_connect('resize_event', self._invalidateBackground)
+
         #connect mouse events
         self.mpl_connect('button_release_event', self.mouseUp)
         self.mpl_connect('button_press_event', self.mouseDown)
@@ -72,26 +97,142 @@ class SlideCanvas(MplCanvas):
     def draw(self):
         '''
         redraw canvas with markups using current settings
+        If the view moved, the new image is read on the worker thread and the
+        markups are redrawn with it when it arrives
         '''
         if self.mMoveROI == True:
             return#redrawROI handles redraws here
-        if self.model.slide is not None:
-            #reset size as needed
-            self.model.reportSize((float(self.size().width()), float(self.size().height())))
-
-            #get base image from slideWrapper and show
-            self.tempIm = self.model.getCurrentImage()
-            self.axes.imshow(self.tempIm)
-
-            #add on the blobs, predicted coordinates, and fiducial set
-            self.axes.add_collection(self.model.getPatches(self.master.limitDraw.isChecked()))
-            #the text labels can't be patches, have to pass in the axes object to draw
-            self.model.drawLabels(self.axes)
-                        
-        #mirror left/right as needed
+        if self.model.slide is None:
+            super().draw()
+            return
+
+        #reset size as needed
+        self.model.reportSize((float(self.size().width()), float(self.size().height())))
+
+        #get base image from slideWrapper
+        key, reader = self.model.getImageRequest()
+        self.requestedKey = key
+        if key is None:
+            self._setImage(key, reader())
+        elif key != self.imageKey:
+            self.reader.submit(self._readImage, key, reader)
+            return
+
+        self._drawFrame()
+
+    def _readImage(self, key, reader):
+        '''
+        Reads an image on the worker thread and sends it to the GUI thread
+        key: the view of the image
+        reader: function returning the image
+        '''
+        #a newer view was requested while this one waited
+        if key != self.requestedKey:
+            return
+        self.imageReady.emit(key, reader())
+
+    def _showImage(self, key, image):
+        '''
+        Shows an image read on the worker thread, called on the GUI thread
+        key: the view of the image
+        image: np array of the image
+        '''
+        #drop images of views that are no longer shown
+        if key != self.requestedKey or self.model.slide is None:
+            return
+        self._setImage(key, image)
+        self._drawFrame()
+
+    def _setImage(self, key, image):
+        '''
+        Updates the persistent slide image
+        key: the view of the image
+        image: np array of the image
+        '''
+        self.tempIm = image
+        self.imageKey = key
+        h, w = image.shape[:2]
+        if self.image is None:
+            #replace the icon
+            for im in list(self.axes.images):
+                im.remove()
+            self.image = self.axes.imshow(image, animated = True)
+            self.background = None
+        else:
+            self.image.set_data(image)
+            self.image.set_extent((-0.5, w - 0.5, h - 0.5, -0.5))
+            #scale label images to their own range, as a new imshow would
+            if image.ndim == 2:
+                self.image.autoscale()
+
+    def _setLimits(self):
+        '''
+        Fits the axes to the image, mirrored left/right as needed
+        '''
+        h, w = self.tempIm.shape[:2]
         if self.model.mirrorImage:
-            self.axes.invert_xaxis()
-        super().draw()
+            self.axes.set_xlim(w - 0.5, -0.5)
+        else:
+            self.axes.set_xlim(-0.5, w - 0.5)
+        self.axes.set_ylim(h - 0.5, -0.5)
+
+    def _drawFrame(self):
+        '''
+        Updates the markups over the current image and shows them
+        '''
+        self._setLimits()
+        for drag in (self.dragRect, self.dragCirc):
+            if drag is not None:
+                drag.set_visible(False)
+        #update the blobs, predicted coordinates, fiducial set and their labels
+        self.model.drawOverlay(self.overlay, self.master.limitDraw.isChecked())
+        self._present()
+
+    def _animatedArtists(self):
+        '''
+        gets the artists drawn when blitting, other than the overlay
+        '''
+        return [a for a in (self.image, self.dragRect, self.dragCirc) if a is not None]
+
+    def _drawAnimated(self):
+        '''
+        Draws the image, overlay and drag shapes with the renderer of the last full draw
+        '''
+        if self.image is not None:
+            self.axes.draw_artist(self.image)
+        self.overlay.drawArtists()
+        for drag in (self.dragRect, self.dragCirc):
+            if drag is not None and drag.get_visible():
+                self.axes.draw_artist(drag)
+
+    def _present(self):
+        '''
+        Shows the animated artists, blitting over the cached background if it is valid
+        '''
+        if self.background is None:
+            super().draw()
+            return
+        self.restore_region(self.background)
+        self._drawAnimated()
+        self.blit(self.axes.bbox)
+
+    def _captureBackground(self, event):
+        '''
+        Caches the figure without animated artists after a full draw, then draws them
+        event: an mpl draw event
+        '''
+        if self.saving:
+            return
+        self.background = self.copy_from_bbox(self.axes.bbox)
+        self._drawAnimated()
+        self.blit(self.axes.bbox)
+
+    def _invalidateBackground(self, event):
+        '''
+        Forces a full draw after the canvas is resized
+        event: an mpl resize event
+        '''
+        self.background = None
             
     def mouseUp(self,event, extras = None):
         '''
@@ -286,12 +427,30 @@ class SlideCanvas(MplCanvas):
         pnt: the current point in local (image) coordinates
         '''
         if self.tempIm is not None:
-            self.axes.imshow(self.tempIm)
-            roi = self.model.getROIPatches(self.model.slide.getGlobalPoint(pnt), append)
-            self.axes.add_collection(PatchCollection(roi, match_original=(len(roi) != 0)))
-            if self.model.mirrorImage:
-                self.axes.invert_xaxis()
-            super().draw() 
+            #only the ROI is shown while it is edited
+            self.overlay.begin()
+            self.overlay.setView(self.model.slide)
+            self.model.drawROI(self.overlay, self.model.slide.getGlobalPoint(pnt), append)
+            self.overlay.finish()
+            self._setLimits()
+            self._present()
+
+    def _showDrag(self, drag):
+        '''
+        helper method to show only the image and a shape being dragged
+        drag: the persistent patch of the shape
+        '''
+        if drag not in self.axes.patches:
+            drag.set_animated(True)
+            self.axes.add_patch(drag)
+        for other in (self.dragRect, self.dragCirc):
+            if other is not None:
+                other.set_visible(other is drag)
+        #hide the markups
+        self.overlay.begin()
+        self.overlay.finish()
+        self._setLimits()
+        self._present()
 
     def redrawRect(self, pnt):
         '''
@@ -300,16 +459,16 @@ class SlideCanvas(MplCanvas):
         '''
         if self.tempIm is not None:
             tempStartP = self.ROI
-            self.axes.imshow(self.tempIm)
             lowerL = ((min(tempStartP[0], pnt[0]), 
                               min(tempStartP[1], pnt[1])))
             x = abs(tempStartP[0]- pnt[0])   
             y = abs(tempStartP[1]- pnt[1])                               
-            r = plt.Rectangle(lowerL, x, y, color=GUIConstants.ROI, fill=False)
-            self.axes.add_patch(r)        
-            if self.model.mirrorImage:
-                self.axes.invert_xaxis()
-            super().draw() 
+            if self.dragRect is None:
+                self.dragRect = plt.Rectangle(lowerL, x, y, color=GUIConstants.ROI, fill=False)
+            self.dragRect.set_xy(lowerL)
+            self.dragRect.set_width(x)
+            self.dragRect.set_height(y)
+            self._showDrag(self.dragRect)
         
     def redrawCirc(self, pnt):
         '''
@@ -318,22 +477,31 @@ class SlideCanvas(MplCanvas):
         '''
         if self.tempIm is not None:
             tempStartP = self.model.slide.getLocalPoint(self.startPC)
-            self.axes.imshow(self.tempIm)
             rad = np.sqrt((tempStartP[0]-pnt[0])**2 + (tempStartP[1]-pnt[1])**2)
                   
-            c = plt.Circle(pnt, rad,
-                           color=GUIConstants.MULTI_BLOB[self.model.currentBlobs], 
-                           linewidth=1,
-                           fill=False)
-            self.axes.add_patch(c)  
-            if self.model.mirrorImage:
-                self.axes.invert_xaxis()
-            super().draw()        
+            if self.dragCirc is None:
+                self.dragCirc = plt.Circle(pnt, rad, linewidth=1, fill=False)
+            self.dragCirc.set_center(pnt)
+            self.dragCirc.set_radius(rad)
+            self.dragCirc.set_edgecolor(GUIConstants.MULTI_BLOB[self.model.currentBlobs])
+            self._showDrag(self.dragCirc)
      
     def savePlt(self, fileName):
         '''
         saves the current figure
         fileName: the file to write to
         '''
-        self.fig.savefig(fileName, dpi = 1200)
-            
\ No newline at end of file
+        #animated artists are left out of figure draws
+        self.saving = True
+        artists = self._animatedArtists()
+        for a in artists:
+            a.set_animated(False)
+        self.overlay.setAnimated(False)
+        try:
+            self.fig.savefig(fileName, dpi = 1200)
+        finally:
+            for a in artists:
+                a.set_animated(True)
+            self.overlay.setAnimated(True)
+            self.saving = False
+            self.background = None
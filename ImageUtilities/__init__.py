@@ -3,6 +3,15 @@ The ImageUtilities package contains the classes required to display and analyze
 blob.py:            object model of the blob objects found with blobFinder and some helpful methods
 blobList.py:        a collection of blobs
 blobFinder.py:      performs blob finding with a simple threshold and group algorithm
+blobParser.py:      fast parsing of blob, position name and instrument text files into columns
+blobQueue.py:       distributed global blob finding of many slides through a shared directory queue
+blobPreview.py:     fast, cached blob finding on the current view at the displayed zoom level
+blobPyramid.py:     multi level grid aggregation of blobs for density preserving drawing of large lists
+stripLabeller.py:   exact whole slide connected components, streamed in full width strips
+spatialIndex.py:    uniform grid hash of blob centers for fast point-in-blob and nearest blob queries
+roiEngine.py:       bounding box prefiltered polygon ROI tests, named ROI sets with union, intersection and difference
+                    and an edge index for editing ROIs with many vertices
 slideWrapper.py:    wraps and extends the openslide functions to handle ndpi and tif images
+thresholdEstimator.py: suggests blob finding thresholds from cached slide intensity histograms
 TSPutil.py:         implements traveling salesperson optimization of a collection of tuples
 '''
\ No newline at end of file
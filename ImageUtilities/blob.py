@@ -7,13 +7,15 @@ class blob(object):
     """
     def __init__(self, x = float(0), y = float(0), 
                  radius = float(GUIConstants.DEFAULT_BLOB_RADIUS), 
-                 circularity = float(1), group = None):
+                 circularity = float(1), group = None, features = None):
         '''
         Initialize a new blob with the specified position, shape and group
         x: x coordinate, default 0.0
         y: y coordinate, default 0.0
         radius: effective radius of the blob, default to value specified in GUIConstants
         circularity: 0 < circ < 1, default value is 1 (perfect circle)
+        group: group number of expanded blobs, default None
+        features: dict of feature name -> value measured during blob finding, default None
         '''
         self.X = x
         self.Y = y
@@ -22,6 +24,7 @@ class blob(object):
         self.circularity = 1 if circularity > 1 else \
             (0 if circularity < 0 else circularity)
         self.group = group
+        self.features = features
 
     @staticmethod
     def getXYList(blobs):
@@ -2,10 +2,15 @@ import skimage
 from skimage import measure
 import numpy as np
 from itertools import product
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import json
 import time
 import scipy
 
 from ImageUtilities.blob import blob
+from ImageUtilities.stripLabeller import stripLabeller
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -14,6 +19,14 @@ class blobFinder(object):
     '''
     performs blob finding on a slidewrapper object
     '''
+    #names of the color bands, used to name feature columns
+    bandNames = ['Red', 'Green', 'Blue']
+    #data type of label images, determines memory use of blob finding
+    labelDtype = np.int32
+    #limits of the subregion size chosen to fit a memory budget, in pixels
+    minTileSize = 512
+    maxTileSize = 16384
+
     def __init__(self, slide, minSize = 50, maxSize = None,
                  minCircularity = 0.6, maxCircularity = None,
                  colorChannel = 2, threshold = 75, imageIndex = 1):
@@ -36,6 +49,20 @@ class blobFinder(object):
         self.colorChannel = colorChannel
         self.threshold = threshold
         self.imageIndex = imageIndex
+        #measure the intensity of each blob in every image while blob finding
+        self.measureFeatures = False
+        #memory available for global blob finding in MB, None uses the default subregion size
+        self.memoryBudget = None
+        #the subregion size and worker count chosen for the last global blob find
+        self.tilePlan = None
+        #label whole slide strips to keep objects larger than a subregion intact
+        self.exactComponents = False
+        #subtract a smooth background map before thresholding, for uneven illumination
+        self.subtractBackground = False
+        #size in max zoom pixels of the largest bright feature excluded from the background
+        self.backgroundSize = 1024
+        #background map built from the coarse pyramid, see buildBackground
+        self.background = None
 
     def copyParameters(self, other):
         '''
@@ -49,6 +76,11 @@ class blobFinder(object):
         self.colorChannel = other.colorChannel
         self.threshold = other.threshold
         self.imageIndex = other.imageIndex
+        self.measureFeatures = other.measureFeatures
+        self.memoryBudget = other.memoryBudget
+        self.exactComponents = other.exactComponents
+        self.subtractBackground = other.subtractBackground
+        self.backgroundSize = other.backgroundSize
 
 
     def getParameters(self):
@@ -63,7 +95,12 @@ class blobFinder(object):
                 'maxCir' : self.maxCircularity,
                 'channel' : self.colorChannel,
                 'thresh' : self.threshold,
-                'ImageInd' : self.imageIndex}
+                'ImageInd' : self.imageIndex,
+                'features' : self.measureFeatures,
+                'exact' : self.exactComponents,
+                'flatten' : self.subtractBackground,
+                'bgSize' : self.backgroundSize,
+                'budget' : self.memoryBudget}
 
     def setParameterFromSplitString(self, toks):
         '''
@@ -110,13 +147,36 @@ class blobFinder(object):
                 raise(ValueError('None type not acceptable for ImageInd'))
             self.imageIndex = int(toks[1])
 
+        elif toks[0] == 'features':
+            self.measureFeatures = toks[1].strip() == 'True'
+
+        elif toks[0] == 'exact':
+            self.exactComponents = toks[1].strip() == 'True'
+
+        elif toks[0] == 'flatten':
+            self.subtractBackground = toks[1].strip() == 'True'
+
+        elif toks[0] == 'bgSize':
+            if toks[1] == 'None\n':
+                raise(ValueError('None type not acceptable for bgSize'))
+            self.backgroundSize = int(toks[1])
+
+        elif toks[0] == 'budget':
+            if toks[1] == 'None\n':
+                self.memoryBudget = None
+            else:
+                self.memoryBudget = int(toks[1])
+
         
-    def getBlobCharacteristics(self, pnt):
+    def getBlobCharacteristics(self, pnt, preview = None):
         '''
         Gets the area and circularity for a blob containing the supplied point
         Returns 0,0 if no blob containing point
         pnt: (x,y) of the requested point
+        preview: a blobPreview of the slide, reuses its cached labels of the current view
         '''
+        if preview is not None:
+            return preview.blobCharacteristics(pnt, self.colorChannel, self.threshold)
         #get current image
         img = self.slide.getImg()
         #threshold image
@@ -134,17 +194,27 @@ class blobFinder(object):
                 region = lbl[dx.start-1:dx.stop+1, dy.start-1:dy.stop+1]
                 region = region == i+1
                 #get area and circularity
-                area = np.sum(region)
-                perim = skimage.measure.perimeter(region)
-                if perim == 0:
-                    circ = 1
-                else:
-                    circ = min(4*np.pi * area / perim**2, 1)
+                area, circ = blobFinder._areaCircularity(region)
                 #scale area by zoom level
                 #these get progressively less accurate with higher zoom level
                 area = area * 2**(2*self.slide.lvl)
                 break
         return area, circ
+
+    @staticmethod
+    def _areaCircularity(region):
+        '''
+        helper function to measure a single blob
+        returns the area and circularity of the region
+        region: boolean image of the blob
+        '''
+        area = np.sum(region)
+        perim = skimage.measure.perimeter(region)
+        if perim == 0:
+            circ = 1
+        else:
+            circ = min(4*np.pi * area / perim**2, 1)
+        return area, circ
         
     @staticmethod
     def _blbHelp(img, sizes, channel = 2, threshold = 200,
@@ -162,8 +232,26 @@ class blobFinder(object):
         '''
         #blob find
         lbl, num = blobFinder._blbThresh(img, channel, threshold)
+        return blobFinder._blbMeasure(lbl, num, sizes, circs, xShift, yShift)
+
+    @staticmethod
+    def _blbMeasure(lbl, num, sizes, circs = (0.7,None), xShift = 0, yShift = 0,
+                    returnLabels = False):
+        '''
+        helper function to convert a label image into a list of blobs passing the
+        size and circularity filters
+        returns a list of blobs, and the label of each blob if returnLabels is True
+        lbl: label image from ndimage.label
+        num: number of labels in lbl
+        sizes: (min, max) size to consider  max == None means not max size
+        circs: (min, max) circularity to consider max == None means no max
+        xShift: amount to add to x coordinate to shift into global coordinate
+        yShift: amount to add to x coordinate to shift into global coordinate
+        returnLabels: set to also return the list of label values of each blob
+        '''
         slices = scipy.ndimage.find_objects(lbl)
         result = []
+        labels = []
         #for each blob
         for i in range(num):
             #convert to boolean image
@@ -189,6 +277,9 @@ class blobFinder(object):
                                        x = y+dy.start-1+xShift, 
                                        radius = r, 
                                        circularity = circ))
+                    labels.append(i+1)
+        if returnLabels:
+            return result, labels
         return result
     
     @staticmethod
@@ -201,35 +292,102 @@ class blobFinder(object):
         threshold: min intensity cutoff
         '''
         img = np.array(img.split()[channel])
-        thresh = img > threshold 
-        return scipy.ndimage.label(thresh)  
+        return blobFinder._blbLabel(img, threshold)
+
+    @staticmethod
+    def _blbLabel(band, threshold = 200):
+        '''
+        helper function to threshold and group a single channel of an image
+        returns the label and total number of objects from ndimage.label
+        band: 2d np array of a single color channel
+        threshold: min intensity cutoff
+        '''
+        thresh = band > threshold
+        return scipy.ndimage.label(thresh, output = blobFinder.labelDtype)
     
-    def blobImg(self):
+    @staticmethod
+    def featureName(imageIndex, channel, reduceMax = False):
+        '''
+        Gets the name of the feature column holding the intensity of a blob
+        imageIndex: the image index of the slide
+        channel: [0, 1, 2] -> [R, G, B] channel
+        reduceMax: toggle between the average (False) or max (True) intensity
+        '''
+        return 'c{}_{}_{}'.format(imageIndex, blobFinder.bandNames[channel],
+                                  'max' if reduceMax else 'mean')
+
+    @staticmethod
+    def _blbFeatures(blbs, lbl, labels, imgs):
+        '''
+        helper function to measure the mean and max intensity of every band of each image
+        within the pixels of each blob.  Sets the features dict of each blob
+        blbs: list of blobs to set features of
+        lbl: label image the blobs were found from
+        labels: the label value of each blob in lbl
+        imgs: dict of image index -> PIL image of the same region as lbl
+        '''
+        for b in blbs:
+            b.features = {'area' : np.pi * b.radius**2,
+                          'circularity' : b.circularity}
+        if len(labels) == 0:
+            return
+        for ind, img in imgs.items():
+            bands = img.split()
+            for channel in range(len(blobFinder.bandNames)):
+                band = np.asarray(bands[channel])
+                means = scipy.ndimage.mean(band, lbl, labels)
+                maxes = scipy.ndimage.maximum(band, lbl, labels)
+                meanName = blobFinder.featureName(ind, channel, False)
+                maxName = blobFinder.featureName(ind, channel, True)
+                for b, mean, mx in zip(blbs, means, maxes):
+                    b.features[meanName] = float(mean)
+                    b.features[maxName] = float(mx)
+
+    def _readFeatureImages(self, inputImg, position, size):
+        '''
+        helper function to gather the images of every channel of the slide for a subregion
+        returns a dict of image index -> PIL image
+        inputImg: the image already read for blob finding
+        position: x,y center of the subregion
+        size: width and height of the subregion
+        '''
+        detectInd = min(len(self.slide.slides)-1, self.imageIndex)
+        imgs = {detectInd : inputImg}
+        for i, s in enumerate(self.slide.slides):
+            if s is not None and i != detectInd:
+                imgs[i] = self.slide.getMaxZoomImage(position, size, imgInd = i)
+        return imgs
+
+    def blobImg(self, preview = None):
         '''
         perform blob finding on the current position of slideWrapper at max zoom
         returns a list of blobs in image
+        preview: a blobPreview of the slide.  If provided, blob finding is performed
+            on the cached image at the current zoom level and blobs are in local coordinates
         '''
+        if preview is not None:
+            return preview.findBlobs(self)
+        if self.subtractBackground:
+            band = self._readBand(self.slide.pos, self.slide.size)
+            lbl, num = blobFinder._blbLabel(band, self.threshold)
+            return blobFinder._blbMeasure(lbl, num, (self.minSize, self.maxSize),
+                                          (self.minCircularity, self.maxCircularity))
         inputImg = self.slide.getMaxZoomImage(imgInd = self.imageIndex)
         return blobFinder._blbHelp(inputImg, (self.minSize, self.maxSize), self.colorChannel, 
                                    self.threshold, (self.minCircularity, self.maxCircularity))
         
-    def blobSlide(self, subSize = 8192, ROI = None):
+    def _tileCenters(self, subSize, ROI = None, overlap = 0):
         '''
-        perform blob finding on the entire image bounded by ROI 
-        only reads a subregion of the image at once, which causes an initial grouping of blobs
-        returns a list of blobs in image
-        subSize: size in pixels of one side of the subregion to iterate over
-            larger values may use up lots of RAM
+        helper function to determine the subregions to read when blob finding over the slide
+        returns a list of (x,y) tuples with the center of each sub image
+        subSize: size in pixels of one side of the subregion
         ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        overlap: the amount of overlap between neighboring subregions
         '''
-        #the amount of overlap between regions, would matter with larger objects but I currently ignore this
-        overlap = 0
-
         #if ROI is none, get max size and (0,0)
         if ROI is None or len(ROI) < 2:
             botR = self.slide.getSize()
             topL = (0,0)
-            ROI = [topL, botR]
         else:
             topL = (min(map(lambda x: x[0], ROI)),
                     min(map(lambda x: x[1], ROI)))
@@ -241,31 +399,569 @@ class blobFinder(object):
         ys = np.arange(topL[1] + subSize//2, botR[1]+subSize//2, subSize-overlap)
         
         #cartesian product of xs and ys
-        centers = product(xs,ys)
+        return list(product(xs,ys))
+        
+    def _readBand(self, position, size):
+        '''
+        helper function to read the blob finding color channel of a region at max zoom
+        only a single uint8 band is kept after reading
+        returns a 2d np array of the colorChannel, background corrected if subtractBackground is set
+        position: x,y center of the region
+        size: width and height of the region
+        '''
+        inputImg = self.slide.getMaxZoomImage(position, size, imgInd = self.imageIndex)
+        return self._correctBand(np.asarray(inputImg.getchannel(self.colorChannel)), 
+                                 position, size, self.colorChannel)
+
+    def _correctBand(self, band, position, size, channel):
+        '''
+        helper function to apply the background correction to a max zoom region if enabled
+        returns band unchanged if subtractBackground is not set
+        band: 2d np array of a single color channel
+        position: x,y center of the region
+        size: width and height of the region
+        channel: [0, 1, 2] -> [R, G, B] channel of band
+        '''
+        if not self.subtractBackground:
+            return band
+        return self.correctBackground(band, int(position[0] - size[0]/2), 
+                                      int(position[1] - size[1]/2), channel)
+
+    def buildBackground(self):
+        '''
+        Builds the smooth background map of each color band from the coarse pyramid level
+        Bright features smaller than backgroundSize are removed with a grey opening
+        before smoothing, so blobs do not raise the background around them.
+        The map is kept in background and reused until imageIndex or backgroundSize change
+        returns the background dict with keys
+            map: (3, h, w) float32 array of the background of each band
+            downsample: number of max zoom pixels per map pixel
+            level: median background of each band, added back after subtraction
+            key: the imageIndex and backgroundSize used
+        '''
+        key = (self.imageIndex, self.backgroundSize)
+        if self.background is not None and self.background['key'] == key:
+            return self.background
+        img, downsample = self.slide.getCoarseImage(self.imageIndex)
+        size = max(3, int(round(self.backgroundSize / downsample)))
+        maps = []
+        for band in img.split()[:3]:
+            band = np.asarray(band, dtype = np.float32)
+            band = scipy.ndimage.grey_opening(band, size = (size, size))
+            maps.append(scipy.ndimage.gaussian_filter(band, size / 2))
+        maps = np.stack(maps)
+        self.background = {'map' : maps,
+                           'downsample' : downsample,
+                           'level' : np.median(maps.reshape(3, -1), axis = 1),
+                           'key' : key}
+        return self.background
+
+    def correctBackground(self, band, x0, y0, channel, scale = 1, chunk = 512):
+        '''
+        Flattens uneven illumination of a band by subtracting the background map,
+        upsampled with bilinear interpolation at the resolution of the band.
+        The median background is added back, so thresholds keep their usual scale.
+        The band is processed in chunks of rows to bound the size of temporaries.
+        returns a uint8 np array of the corrected band
+        band: 2d np array of a single color channel
+        x0, y0: slide coordinates of the top left pixel of band
+        channel: [0, 1, 2] -> [R, G, B] channel of band
+        scale: number of max zoom pixels per pixel of band
+        chunk: number of rows to correct at once
+        '''
+        bg = self.buildBackground()
+        mp = bg['map'][channel]
+        ds = bg['downsample']
+        level = bg['level'][channel]
+
+        def weights(start, count, length):
+            #map coordinates of the pixel centers, clamped to the map
+            c = ((start + (np.arange(count) + 0.5) * scale) / ds - 0.5).clip(0, length - 1)
+            i0 = np.minimum(np.floor(c).astype(np.intp), max(length - 2, 0))
+            i1 = np.minimum(i0 + 1, length - 1)
+            return i0, i1, (c - i0).astype(np.float32)
+
+        h, w = band.shape
+        y0i, y1i, fy = weights(y0, h, mp.shape[0])
+        x0i, x1i, fx = weights(x0, w, mp.shape[1])
+        #only interpolate between the map columns covering the band
+        cols = np.union1d(x0i, x1i)
+        x0i = np.searchsorted(cols, x0i)
+        x1i = np.searchsorted(cols, x1i)
+        mp = mp[:, cols]
+
+        result = np.empty((h, w), dtype = np.uint8)
+        for r in range(0, h, chunk):
+            rs = slice(r, min(r + chunk, h))
+            rows = mp[y0i[rs]] * (1 - fy[rs, None]) + mp[y1i[rs]] * fy[rs, None]
+            local = rows[:, x0i] * (1 - fx) + rows[:, x1i] * fx
+            local = band[rs] - local + level
+            np.clip(local, 0, 255, out = local)
+            result[rs] = local
+        return result
+
+    def _blobTile(self, cent, subSize):
+        '''
+        helper function to perform blob finding on a single subregion at max zoom
+        returns the list of blobs found and the number of bytes read from the slide
+        cent: x,y center of the subregion
+        subSize: size in pixels of one side of the subregion
+        '''
+        position = (int(cent[0]),int(cent[1]))
+        #each read is a 4 band RGBA image
+        bytesRead = subSize * subSize * 4
+        if self.measureFeatures:
+            #keep all bands of the image for measuring features
+            inputImg = self.slide.getMaxZoomImage(position, 
+                                                  (subSize,subSize),imgInd = self.imageIndex)
+            band = self._correctBand(np.asarray(inputImg.getchannel(self.colorChannel)), 
+                                     position, (subSize,subSize), self.colorChannel)
+            lbl, num = blobFinder._blbLabel(band, self.threshold)
+            del band
+        else:
+            lbl, num = blobFinder._blbLabel(self._readBand(position, (subSize,subSize)), 
+                                            self.threshold)
+        blb, labels = blobFinder._blbMeasure(lbl, num, (self.minSize, self.maxSize), 
+                                             (self.minCircularity, self.maxCircularity),
+                                             cent[0]-subSize/2, cent[1]-subSize/2,
+                                             returnLabels = True)
+        #measure each blob while the subregion is in memory
+        if self.measureFeatures:
+            imgs = self._readFeatureImages(inputImg, position, (subSize,subSize))
+            bytesRead *= len(imgs)
+            blobFinder._blbFeatures(blb, lbl, labels, imgs)
+        return blb, bytesRead
+
+    def tileBytesPerPixel(self):
+        '''
+        Estimates the peak memory used per pixel of a subregion during blob finding
+        Reading holds the RGBA image from openslide and the single band kept from it,
+        labelling holds the band, the threshold mask and the label image.
+        Measuring features keeps the RGBA image of each slide channel and float
+        temporaries for the per-blob reductions.
+        returns the number of bytes per pixel
+        '''
+        labelBytes = np.dtype(blobFinder.labelDtype).itemsize
+        if not self.measureFeatures:
+            return max(4 + 1, 1 + 1 + labelBytes)
+        images = 1 if self.slide is None else \
+            max(1, sum(1 for s in self.slide.slides if s is not None))
+        #rgba images, band, mask, labels, float64 weights and int64 label copies
+        return 4 * images + 1 + 1 + labelBytes + 8 + 8
+
+    def planTiles(self, budget = None, overlap = 0, workers = None):
+        '''
+        Chooses the subregion size and number of workers for global blob finding
+        to fit within a memory budget.  Larger subregions are preferred, reducing
+        the number of workers until subregions are at least 4 times minTileSize.
+        returns a dict with the keys
+            subSize: size of one side of each subregion in pixels
+            workers: number of subregions processed at once
+            tileBytes: estimated peak memory of one subregion in bytes
+            budget: the budget used in bytes, None if no budget was set
+        budget: memory available in MB, None to use memoryBudget
+        overlap: the number of pixels of halo around each subregion
+        workers: the maximum number of workers, None for the number of cpus
+        '''
+        if budget is None:
+            budget = self.memoryBudget
+        bpp = self.tileBytesPerPixel()
+        #default, fixed size
+        if budget is None:
+            subSize = 8192
+            return {'subSize' : subSize,
+                    'workers' : 1,
+                    'tileBytes' : bpp * (subSize + 2*overlap)**2,
+                    'budget' : None}
+
+        budget = budget * 2**20
+        maxWorkers = workers if workers is not None else (os.cpu_count() or 1)
+        #the slide limits how large a subregion needs to be
+        maxSize = blobFinder.maxTileSize
+        if self.slide is not None:
+            maxSize = min(maxSize, max(self.slide.getSize()))
+        maxSize = max(maxSize, blobFinder.minTileSize)
+
+        for workers in range(maxWorkers, 0, -1):
+            #largest tile, including the halo, fitting into the budget share
+            side = int(np.sqrt(budget / workers / bpp)) - 2 * overlap
+            #round down to a multiple of the minimum size
+            subSize = side // blobFinder.minTileSize * blobFinder.minTileSize
+            subSize = min(subSize, maxSize)
+            if subSize >= min(4 * blobFinder.minTileSize, maxSize):
+                break
+        #never go below the minimum, even when over budget
+        subSize = max(subSize, blobFinder.minTileSize)
+        return {'subSize' : subSize,
+                'workers' : workers,
+                'tileBytes' : bpp * (subSize + 2*overlap)**2,
+                'budget' : budget}
 
-        #initialize time, blob list, and iterator count
+    @staticmethod
+    def describePlan(plan):
+        '''
+        returns a short string description of a plan from planTiles
+        plan: dict from planTiles
+        '''
+        if plan is None:
+            return ''
+        if 'width' in plan:
+            result = '{} x {} px strips, ~{:.0f} MB'.format(
+                plan['width'], plan['subSize'], plan['tileBytes'] / 2**20)
+        else:
+            result = '{} x {} px areas with {} worker{}, ~{:.0f} MB'.format(
+                plan['subSize'], plan['subSize'], plan['workers'], 
+                '' if plan['workers'] == 1 else 's',
+                plan['tileBytes'] * plan['workers'] / 2**20)
+        if plan['budget'] is not None:
+            result += ' of {:.0f} MB budget'.format(plan['budget'] / 2**20)
+        return result
+
+    @staticmethod
+    def _printProgress(event):
+        '''
+        default progress report of blobSlide, prints to the console
+        event: a progress dict from blobSlideIter
+        '''
+        if event['elapsed'] == 0:
+            if event['tilesDone'] != 0:
+                print("resuming after %d completed subareas" % event['tilesDone'])
+            print("starting %d images of %d x %d pixels with %d workers" % 
+                  (event['totalTiles'], event.get('width', event['subSize']), 
+                   event['subSize'], event['workers']))
+        elif event['finished']:
+            if event['cancelled']:
+                print("cancelled after %d of %d subareas" % (event['tilesDone'], event['totalTiles']))
+            print("took {:.3f} minutes".format(event['elapsed']/60))
+        #print out expected time remaining, not super accurate
+        elif event['tilesDone'] % 10 == 0 or event['tilesDone'] == 1:
+            print("finished %d of %d subareas, %d seconds left" % (event['tilesDone'], 
+                                                                   event['totalTiles'], 
+                                                                   event['remaining']))
+
+    def checkpointHeader(self, subSize, ROI = None):
+        '''
+        Describes a global blob find, a checkpoint can only be resumed with the same header
+        returns a dict of the slide, blob finding parameters and subregions
+        subSize: size in pixels of one side of the subregion
+        ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        '''
+        parameters = self.getParameters()
+        #the memory budget only sets the subregion size, which is kept on resume
+        del parameters['budget']
+        return {'slide' : getattr(self.slide, 'fileName', None),
+                'dimensions' : [int(d) for d in self.slide.getSize()],
+                'parameters' : parameters,
+                'measureFeatures' : self.measureFeatures,
+                'subtractBackground' : self.subtractBackground,
+                'backgroundSize' : self.backgroundSize,
+                'subSize' : int(subSize),
+                'ROI' : None if ROI is None else [[float(p[0]), float(p[1])] for p in ROI]}
+
+    @staticmethod
+    def _readCheckpoint(filename, header):
+        '''
+        helper function to read the completed subregions of a checkpoint file
+        A partially written last line, from a process killed while writing, is ignored
+        returns a dict of (x,y) center -> list of blobs and the byte offset 
+            after the last complete record.  Empty if the file does not match header
+        filename: the checkpoint file
+        header: the checkpointHeader of the current blob find
+        '''
+        completed = dict()
+        if not os.path.exists(filename):
+            return completed, 0
+        with open(filename, 'rb') as reader:
+            line = reader.readline()
+            try:
+                if json.loads(line.decode('utf-8')) != header:
+                    print("checkpoint {} is from a different blob find, starting over".format(filename))
+                    return completed, 0
+            except ValueError:
+                return completed, 0
+            offset = reader.tell()
+            for line in reader:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                completed[tuple(record['tile'])] = [blob(x, y, r, c, features = f) 
+                                                    for x, y, r, c, f in record['blobs']]
+                offset += len(line)
+        return completed, offset
+
+    @staticmethod
+    def _checkpointSubSize(filename):
+        '''
+        helper function to get the subregion size of an existing checkpoint file
+        returns the subregion size, None if the file does not exist or is unreadable
+        filename: the checkpoint file
+        '''
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'rb') as reader:
+            try:
+                return json.loads(reader.readline().decode('utf-8'))['subSize']
+            except (ValueError, KeyError, TypeError):
+                return None
+
+    @staticmethod
+    def _appendCheckpoint(output, cent, blbs):
+        '''
+        helper function to record a completed subregion in a checkpoint file
+        the record is flushed to disk before returning
+        output: the checkpoint file object, opened for appending
+        cent: (x,y) center of the subregion
+        blbs: list of blobs found in the subregion
+        '''
+        record = {'tile' : [int(cent[0]), int(cent[1])],
+                  'blobs' : [[b.X, b.Y, b.radius, b.circularity, b.features] for b in blbs]}
+        output.write((json.dumps(record, separators = (',',':')) + '\n').encode('utf-8'))
+        output.flush()
+        os.fsync(output.fileno())
+
+    def blobSlideIter(self, subSize = 8192, ROI = None, progress = None, cancel = None, 
+                      workers = 1, checkpoint = None):
+        '''
+        generator performing blob finding on the entire image bounded by ROI 
+        only reads a subregion of the image at once, which causes an initial grouping of blobs
+        yields the list of blobs found in each subregion as it is completed, in order
+        subSize: size in pixels of one side of the subregion to iterate over
+            larger values may use up lots of RAM
+        ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        progress: function called with a dict describing the run progress with keys
+            tilesDone, totalTiles, blobsFound, bytesRead, rate (tiles per second, excluding resumed tiles),
+            elapsed and remaining (seconds), finished, cancelled, subSize and workers
+            Called once before the first subregion, after each one and when finished.
+        cancel: a threading.Event checked between subregions, set to stop early
+        workers: number of subregions to process at once in separate threads
+        checkpoint: filename to record each completed subregion in.  If the file exists
+            from an interrupted run with the same slide, parameters and subregions,
+            the completed subregions are yielded first and not read again
+        If measureFeatures is set, each blob also records the mean and max intensity
+        of every band of every image, its area and circularity in blob.features
+        '''
+        #the amount of overlap between regions, would matter with larger objects but I currently ignore this
+        overlap = 0
+
+        centers = self._tileCenters(subSize, ROI, overlap)
+
+        completed = dict()
+        output = None
+        if checkpoint is not None:
+            header = self.checkpointHeader(subSize, ROI)
+            completed, offset = blobFinder._readCheckpoint(checkpoint, header)
+            if offset == 0:
+                output = open(checkpoint, 'wb')
+                output.write((json.dumps(header) + '\n').encode('utf-8'))
+            else:
+                #drop any partially written record before appending
+                output = open(checkpoint, 'r+b')
+                output.truncate(offset)
+                output.seek(offset)
+
+        #running totals for progress reports
+        event = {
+            'tilesDone' : 0,
+            'totalTiles' : len(centers),
+            'blobsFound' : 0,
+            'bytesRead' : 0,
+            'rate' : 0,
+            'elapsed' : 0,
+            'remaining' : 0,
+            'finished' : False,
+            'cancelled' : False,
+            'subSize' : subSize,
+            'workers' : workers}
         start = time.time()
-        total = len(xs) * len(ys)
-        print("starting %d images" % total)
+
+        #subregions finished by an earlier run
+        resumed = [c for c in centers if (int(c[0]), int(c[1])) in completed]
+        centers = [c for c in centers if (int(c[0]), int(c[1])) not in completed]
+        for cent in resumed:
+            blb = completed[(int(cent[0]), int(cent[1]))]
+            event['tilesDone'] += 1
+            event['blobsFound'] += len(blb)
+            yield blb
+        completed = None
+
+        if progress is not None:
+            progress(dict(event))
+
+        executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        #subregions submitted to the workers but not yet yielded
+        pending = deque()
+        #the subregion each pending result belongs to
+        pendingCenters = deque()
+        centers = iter(centers)
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    event['cancelled'] = True
+                    break
+                #keep each worker busy, without reading ahead of the memory budget
+                if executor is not None:
+                    for cent in centers:
+                        pending.append(executor.submit(self._blobTile, cent, subSize))
+                        pendingCenters.append(cent)
+                        if len(pending) >= workers:
+                            break
+                    if len(pending) == 0:
+                        break
+                    blb, bytesRead = pending.popleft().result()
+                    cent = pendingCenters.popleft()
+                else:
+                    cent = next(centers, None)
+                    if cent is None:
+                        break
+                    blb, bytesRead = self._blobTile(cent, subSize)
+
+                if output is not None:
+                    blobFinder._appendCheckpoint(output, cent, blb)
+
+                event['tilesDone'] += 1
+                event['blobsFound'] += len(blb)
+                event['bytesRead'] += bytesRead
+                event['elapsed'] = time.time() - start
+                #only subregions processed by this run set the rate, resumed ones took no time
+                event['rate'] = (event['tilesDone'] - len(resumed)) / max(event['elapsed'], 1e-6)
+                event['remaining'] = (event['totalTiles'] - event['tilesDone']) / event['rate']
+                if progress is not None:
+                    progress(dict(event))
+
+                yield blb
+        finally:
+            if executor is not None:
+                for p in pending:
+                    p.cancel()
+                executor.shutdown(wait = True)
+            if output is not None:
+                output.close()
+
+        event['finished'] = True
+        event['elapsed'] = time.time() - start
+        event['remaining'] = 0
+        if progress is not None:
+            progress(dict(event))
+
+    def blobSlide(self, subSize = None, ROI = None, progress = None, cancel = None,
+                  checkpoint = None):
+        '''
+        perform blob finding on the entire image bounded by ROI 
+        only reads a subregion of the image at once, which causes an initial grouping of blobs
+        returns a list of blobs in image
+        subSize: size in pixels of one side of the subregion to iterate over
+            larger values may use up lots of RAM.  None chooses the size and number 
+            of workers from memoryBudget, see planTiles.  The choice is kept in tilePlan
+        ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        progress: function called with progress dicts, see blobSlideIter. 
+            None prints to the console
+        cancel: a threading.Event checked between subregions, set to stop early.
+            The blobs found prior to cancelling are returned
+        checkpoint: filename to record completed subregions in, see blobSlideIter.
+            When resuming, the subregion size of the checkpoint is reused
+        If exactComponents is set, blobSlideExact is used with subSize as the strip height
+        and no checkpoint is kept
+        '''
+        if self.exactComponents:
+            return self.blobSlideExact(ROI, subSize, progress, cancel)
+
+        if progress is None:
+            progress = blobFinder._printProgress
+
+        if subSize is None and checkpoint is not None:
+            subSize = blobFinder._checkpointSubSize(checkpoint)
+
+        if subSize is None:
+            self.tilePlan = self.planTiles()
+        else:
+            self.tilePlan = {'subSize' : subSize,
+                             'workers' : 1,
+                             'tileBytes' : self.tileBytesPerPixel() * subSize**2,
+                             'budget' : None}
+
         blbs = []
-        i = 1
+        for blb in self.blobSlideIter(self.tilePlan['subSize'], ROI, progress, cancel, 
+                                      self.tilePlan['workers'], checkpoint):
+            blbs.extend(blb)
+        
+        return blbs
+
+    def blobSlideExact(self, ROI = None, stripHeight = None, progress = None, cancel = None):
+        '''
+        perform blob finding on the entire image bounded by ROI without splitting objects
+        between subregions.  The slide is read in full width strips and components are
+        merged across strips, see stripLabeller.  Use for large, irregular objects which
+        would be cut by the subregions of blobSlide.
+        returns a list of blobs in image
+        ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        stripHeight: number of rows to read at once, None to choose from memoryBudget.
+            The choice is kept in tilePlan
+        progress: function called with progress dicts, see blobSlideIter.
+            None prints to the console
+        cancel: a threading.Event checked between strips, set to stop early
+        Blobs only record position, size and circularity, measureFeatures is ignored
+        '''
+        if progress is None:
+            progress = blobFinder._printProgress
+        labeller = stripLabeller(self)
+        result = labeller.labelSlide(ROI, stripHeight, progress, cancel)
+        self.tilePlan = labeller.plan
+        return result
+
+    def blobSweep(self, thresholds, channels = None, subSize = 8192, ROI = None):
+        '''
+        perform blob finding with several thresholds and color channels using a single
+        read of each subregion.  Useful for selecting parameters on a new tissue or stain.
+        The size and circularity limits of this blobFinder are applied to every configuration.
+        returns a dict of (channel, threshold) -> dict with values
+            'count': number of blobs found
+            'sizes': np array of the area of each blob in pixels
+            'blobs': list of blobs found
+        thresholds: list of intensity thresholds to test
+        channels: list of [0, 1, 2] -> [R, G, B] channels to test.  None uses colorChannel
+        subSize: size in pixels of one side of the subregion to iterate over
+        ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        '''
+        if channels is None:
+            channels = [self.colorChannel]
+
+        centers = self._tileCenters(subSize, ROI)
+
+        configs = list(product(channels, thresholds))
+        blbs = dict((c, []) for c in configs)
+
+        start = time.time()
+        total = len(centers)
+        print("starting %d images with %d configurations" % (total, len(configs)))
 
-        #for each subregion
-        for cent in centers:
-            #get max zoom image
-            inputImg = self.slide.getMaxZoomImage((int(cent[0]),int(cent[1])), 
+        for i, cent in enumerate(centers):
+            #read the subregion once
+            position = (int(cent[0]),int(cent[1]))
+            inputImg = self.slide.getMaxZoomImage(position, 
                                                   (subSize,subSize),imgInd = self.imageIndex)
-            #blob find
-            blb = blobFinder._blbHelp(inputImg, (self.minSize, self.maxSize), 
-                                      self.colorChannel, self.threshold, 
-                                      (self.minCircularity, self.maxCircularity),
-                                      cent[0]-subSize/2, cent[1]-subSize/2)
-            blbs.extend(blb)
-            #print out expected time remaining, not super accurate
-            if i % 10 == 0 or i == 1:
-                print("finished %d of %d subareas, %d seconds left" % (i, total, (time.time()-start)/ i * (total-i)))
-            i = i+1
+            bands = inputImg.split()
+            for channel in channels:
+                band = self._correctBand(np.array(bands[channel]), position, 
+                                         (subSize,subSize), channel)
+                #label each threshold of the channel
+                for thresh in thresholds:
+                    lbl, num = blobFinder._blbLabel(band, thresh)
+                    blbs[(channel, thresh)].extend(
+                        blobFinder._blbMeasure(lbl, num, (self.minSize, self.maxSize),
+                                               (self.minCircularity, self.maxCircularity),
+                                               cent[0]-subSize/2, cent[1]-subSize/2))
+            if (i+1) % 10 == 0 or i == 0:
+                print("finished %d of %d subareas, %d seconds left" % (i+1, total, (time.time()-start)/ (i+1) * (total-i-1)))
             
         print("took {:.3f} minutes".format((time.time() - start)/60))
-        
-        return blbs            
\ No newline at end of file
+
+        result = dict()
+        for c in configs:
+            result[c] = {
+                'count' : len(blbs[c]),
+                'sizes' : np.array([np.pi * b.radius**2 for b in blbs[c]]),
+                'blobs' : blbs[c]}
+        return result
@@ -1,45 +1,649 @@
 import numpy as np
 import scipy
-from scipy.spatial.distance import pdist
-import matplotlib.pyplot as plt
-from matplotlib.path import Path
+from scipy.spatial import cKDTree
+from collections.abc import Sequence
 from copy import deepcopy
-import ast
+import json
+import os
+import struct
+import weakref
 
 from GUICanvases import GUIConstants
 
 from ImageUtilities import blob
 from ImageUtilities import blobFinder
+from ImageUtilities import blobParser
+from ImageUtilities import blobPyramid
+from ImageUtilities import roiEngine
+from ImageUtilities import spatialIndex
+
+class blobView(blob.blob):
+    '''
+    A blob backed by one row of the columns of a blobList.
+    Reading and setting attributes uses the columns directly, so views are cheap
+    to create and no per blob objects are stored.  A view refers to a row index,
+    removing blobs from the list invalidates existing views.
+    '''
+    __slots__ = ('_owner', '_index')
+
+    def __init__(self, owner, index):
+        '''
+        Create a view of a single blob
+        owner: the blobList holding the columns
+        index: the row of the blob
+        '''
+        self._owner = owner
+        self._index = index
+
+    def _get(self, name):
+        return self._owner._get(name, self._index)
+
+    def _set(self, name, value):
+        self._owner._set(name, self._index, value)
+
+    @property
+    def X(self):
+        return float(self._get('x'))
+
+    @X.setter
+    def X(self, value):
+        self._set('x', value)
+
+    @property
+    def Y(self):
+        return float(self._get('y'))
+
+    @Y.setter
+    def Y(self, value):
+        self._set('y', value)
+
+    @property
+    def radius(self):
+        return float(self._get('radius'))
+
+    @radius.setter
+    def radius(self, value):
+        self._set('radius', value)
+
+    @property
+    def circularity(self):
+        return float(self._get('circularity'))
+
+    @circularity.setter
+    def circularity(self, value):
+        self._set('circularity', 1 if value > 1 else (0 if value < 0 else value))
+
+    @property
+    def group(self):
+        g = self._get('group')
+        return None if g < 0 else int(g)
+
+    @group.setter
+    def group(self, value):
+        self._set('group', -1 if value is None else value)
+
+    @property
+    def features(self):
+        result = dict((name, float(self._get(name))) for name in self._owner._features
+                      if not np.isnan(self._get(name)))
+        return result if len(result) != 0 else None
+
+    @features.setter
+    def features(self, value):
+        self._owner._own()
+        for col in self._owner._features.values():
+            col[self._index] = np.nan
+        if value is not None:
+            for name, val in value.items():
+                self._owner._featureColumn(name)[self._index] = val
+        self._owner._version += 1
+
+class blobSequence(Sequence):
+    '''
+    A read only sequence of blobViews over rows of a blobList.
+    Indexing with an int gives a blobView, while slices, index arrays
+    and boolean masks give another blobSequence without copying the columns.
+    '''
+    def __init__(self, owner, indices = None):
+        '''
+        owner: the blobList holding the columns
+        indices: np array of the rows in the sequence, None for all rows
+        '''
+        self._owner = owner
+        self._indices = indices
+
+    def __len__(self):
+        if self._indices is None:
+            return self._owner.length()
+        return len(self._indices)
+
+    def rows(self):
+        '''
+        returns an np array of the rows of the owner in this sequence
+        '''
+        if self._indices is None:
+            return np.arange(self._owner.length())
+        return self._indices
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            n = len(self)
+            if key < 0:
+                key += n
+            if key < 0 or key >= n:
+                raise IndexError('blob index out of range')
+            return blobView(self._owner, key if self._indices is None else self._indices[key])
+        return blobSequence(self._owner, self.rows()[key])
+
+    def __iter__(self):
+        if self._indices is None:
+            for i in range(self._owner.length()):
+                yield blobView(self._owner, i)
+        else:
+            for i in self._indices:
+                yield blobView(self._owner, i)
+
+    def append(self, blb):
+        '''
+        Appends a blob to the owning list, only valid for sequences of the whole list
+        '''
+        self._owner.append(blb)
+
+    def pop(self, i = -1):
+        '''
+        Removes a blob from the owning list, only valid for sequences of the whole list
+        returns a copy of the removed blob
+        '''
+        view = self[i]
+        result = blob.blob(view.X, view.Y, view.radius, view.circularity, 
+                           view.group, view.features)
+        self._owner.remove(view._index)
+        return result
 
 class blobList(object):
     """
     A collection of blob objects.
-    Underlying data is the list self.blobs and supplies several
+    Underlying data are NumPy columns of the x, y, radius, circularity and group
+    of every blob, plus optional feature columns from blob finding.  self.blobs is
+    a sequence of lightweight blob views over the columns, and supplies several
     utilities for filtering, drawing and expanding blobs.
     Each bloblist also contains its own blobfinder and filters
     """
+    #names and types of the columns stored for every blob, a group of -1 is no group
+    columnTypes = [('x', np.float64),
+                   ('y', np.float64),
+                   ('radius', np.float64),
+                   ('circularity', np.float64),
+                   ('group', np.int64)]
+    #directions to march along to generate a layer of rectangular pattern points
+    #this starts at the right, moves down, left, up, right, down, to spiral around the blob
+    rectangularMarcher = np.array([[ 0.,  1.],
+                                   [-1.,  0.],
+                                   [-1.,  0.],
+                                   [ 0., -1.],
+                                   [ 0., -1.],
+                                   [ 1.,  0.],
+                                   [ 1.,  0.],
+                                   [ 0.,  1.]])
+    #directions to march along to generate a layer of hexagonal pattern points
+    hexagonalMarcher = np.array([[-0.5, np.sqrt(3)/2],
+                                 [-1. ,  0.],
+                                 [-0.5, -np.sqrt(3)/2],
+                                 [ 0.5, -np.sqrt(3)/2],
+                                 [ 1. ,  0.],
+                                 [ 0.5,  np.sqrt(3)/2]])
+    #unit offsets of layered patterns, cached by (pattern, number of layers)
+    _layerMasks = dict()
+    #extension and leading bytes of binary blob files, see saveBlobs
+    binaryExtension = '.blb'
+    binaryMagic = b'MSBLOBS\x01'
+    #alignment in bytes of each column in binary blob files
+    binaryAlignment = 64
+    #removed rows are deleted from the columns once more than 1/compactFraction
+    #of the rows are removed, or when the columns are read as a whole
+    compactFraction = 64
 
     def __init__(self, slide = None):
-        self.blobs = []
+        self._version = 0
+        self._index = None
+        self._indexVersion = -1
+        #level of detail pyramid for drawing, rebuilt when _version changes
+        self._pyramid = None
+        self._pyramidVersion = -1
+        self._setColumns([], [])
         self.blobFinder = blobFinder.blobFinder(slide)
         self.filters = []
         self.description = None
         self.threshCutoff = None
         self.ROI = []
+        #named ROIs for selecting blobs with several regions
+        self.ROIs = roiEngine.roiSet()
+        #(ROI points, roiGeometry) of the last ROI edited
+        self._roiGeometry = None
         self.groupLabels = dict()
+        #value of _version when groupLabels was generated
+        self._labelVersion = -1
+        #(key, names, positions, spatialIndex) of the labels thinned for drawing
+        self._labelCache = None
+        self.lineage = []
         ##Add any new instance vars to deepcopy!
 
+    @property
+    def blobs(self):
+        '''
+        a sequence of blob views of every blob in the list
+        '''
+        return blobSequence(self)
+
+    @blobs.setter
+    def blobs(self, newBlobs):
+        '''
+        replaces the blobs in the list
+        newBlobs: a blobSequence, a blobColumns, or any iterable of blob objects
+        '''
+        self._setFromBlobs(newBlobs)
+
+    def _setColumns(self, x, y, radius = None, circularity = None, group = None, features = None):
+        '''
+        helper function to replace every column with new values
+        x, y: sequences of the coordinates of each blob
+        radius: sequence of radii, None for the default blob radius
+        circularity: sequence of circularity, None for 1
+        group: sequence of group numbers, -1 for no group, None for no groups
+        features: dict of feature name -> sequence of values, nan if not measured
+        '''
+        x = np.array(x, dtype = np.float64)
+        n = len(x)
+        def column(values, default, dtype):
+            if values is None:
+                return np.full(n, default, dtype = dtype)
+            return np.array(values, dtype = dtype)
+        self._columns = {'x' : x,
+                         'y' : column(y, 0, np.float64),
+                         'radius' : column(radius, GUIConstants.DEFAULT_BLOB_RADIUS, np.float64),
+                         'circularity' : np.clip(column(circularity, 1, np.float64), 0, 1),
+                         'group' : column(group, -1, np.int64)}
+        self._features = dict() if features is None else \
+            dict((k, np.array(v, dtype = np.float64)) for k, v in features.items())
+        self._newStorage(n)
+        self._version += 1
+
+    def _setFromBlobs(self, newBlobs):
+        '''
+        helper function to replace the columns with the values of a sequence of blobs
+        newBlobs: a blobSequence, or any iterable of blob objects
+        '''
+        if isinstance(newBlobs, blobSequence):
+            newBlobs._owner._shareWith(self, newBlobs.rows())
+            self._version += 1
+            return
+        if isinstance(newBlobs, blobParser.blobColumns):
+            self._setColumns(newBlobs.x, newBlobs.y, newBlobs.radius, 
+                             newBlobs.circularity, newBlobs.group)
+            return
+        newBlobs = list(newBlobs)
+        names = set()
+        for b in newBlobs:
+            if b.features is not None:
+                names.update(b.features.keys())
+        features = dict((name, [np.nan if b.features is None else b.features.get(name, np.nan)
+                                for b in newBlobs]) for name in names)
+        self._setColumns([b.X for b in newBlobs],
+                         [b.Y for b in newBlobs],
+                         [b.radius for b in newBlobs],
+                         [b.circularity for b in newBlobs],
+                         [-1 if b.group is None else b.group for b in newBlobs],
+                         features)
+
+    #Column storage is copy on write.  Lists derived from this one by filtering or
+    #copying refer to the same column arrays, selecting their blobs with an array of
+    #rows into them, until one of them changes a value in place.  Every list using
+    #the arrays is in the _users weak set, so a list is private again once the lists
+    #sharing its arrays are discarded.  The arrays in _columns and _features are only
+    #written to by a private list with _rows of None, _own copies out the rows first.
+    #The first _size rows of the arrays are used, the rest is space for appending.
+    #Removed blobs are marked in _removed, a list of rows of the list before any
+    #were removed, and are only deleted from the columns by _compact.  Indices of 
+    #single blobs skip the removed rows, anything reading whole columns compacts first.
+
+    def _newStorage(self, size, readOnly = False):
+        '''
+        helper function to start using new column arrays, set in _columns and _features
+        size: number of rows used in the arrays
+        readOnly: set if the arrays can not be written to, as memory mapped files
+        '''
+        self._release()
+        self._users = weakref.WeakSet([self])
+        self._readOnly = readOnly
+        self._size = size
+        self._rows = None
+        self._removed = []
+
+    def _release(self):
+        '''
+        helper function to stop sharing the current column arrays with other lists
+        '''
+        users = getattr(self, '_users', None)
+        if users is not None:
+            users.discard(self)
+
+    def _private(self):
+        '''
+        helper function to check if the column arrays can be changed in place
+        '''
+        return not self._readOnly and len(self._users) == 1
+
+    def _baseLength(self):
+        '''
+        helper function to get the number of rows, including removed rows
+        '''
+        return self._size if self._rows is None else len(self._rows)
+
+    def _baseIndex(self, index):
+        '''
+        helper function to convert an index of this list to a row including removed rows
+        '''
+        if len(self._removed) == 0:
+            return index
+        removed = np.sort(self._removed)
+        #number of removed rows at or before each removed row's position in the list
+        return index + int(np.searchsorted(removed - np.arange(len(removed)), index, 'right'))
+
+    def _listIndices(self, rows):
+        '''
+        helper function to convert rows including removed rows to indices of this list
+        rows: np array of rows which are not removed
+        '''
+        if len(self._removed) == 0:
+            return rows
+        return rows - np.searchsorted(np.sort(self._removed), rows)
+
+    def _compact(self):
+        '''
+        helper function to delete the removed rows from the columns and spatial index
+        '''
+        if len(self._removed) == 0:
+            return
+        keep = np.ones(self._baseLength(), dtype = bool)
+        keep[self._removed] = False
+        self._removed = []
+        self._select(keep)
+        if self._index is not None and self._indexVersion == self._version:
+            self._index.compact()
+
+    def _storageRows(self, indices = None):
+        '''
+        helper function to convert indices of this list to rows of the column arrays
+        returns an np array of rows, or None when every row is selected in order
+        indices: np array of indices or boolean mask of this list, None for all blobs
+        '''
+        self._compact()
+        if indices is None:
+            return self._rows
+        indices = np.asarray(indices)
+        if indices.dtype != bool:
+            indices = indices.astype(np.intp)
+        if self._rows is None:
+            return np.arange(self.length())[indices] if indices.dtype == bool else indices
+        return self._rows[indices]
+
+    def _shareWith(self, other, indices = None):
+        '''
+        helper function to make another list refer to a selection of this list's columns
+        other: the blobList to replace the columns of
+        indices: np array of indices or boolean mask of this list, None for all blobs
+        '''
+        self._compact()
+        rows = self._storageRows(indices)
+        other._release()
+        other._columns = dict(self._columns)
+        other._features = dict(self._features)
+        other._users = self._users
+        other._users.add(other)
+        other._readOnly = self._readOnly
+        other._size = self._size
+        other._rows = rows
+        other._removed = []
+
+    def _own(self):
+        '''
+        helper function to give this list private columns of just its blobs,
+        before values are changed in place
+        '''
+        self._compact()
+        if self._rows is not None or not self._private():
+            self._columns, self._features = self._take()
+            self._newStorage(len(self._columns['x']))
+
+    def _column(self, name):
+        '''
+        helper function to read a column of the blobs in this list
+        The result may be the stored array, do not change values in place
+        name: one of x, y, radius, circularity, group or a feature name
+        '''
+        self._compact()
+        col = self._columns[name] if name in self._columns else self._features[name]
+        return col[:self._size] if self._rows is None else col[self._rows]
+
+    def _get(self, name, index):
+        '''
+        helper function to read one value of a column
+        '''
+        index = self._baseIndex(index)
+        col = self._columns[name] if name in self._columns else self._features[name]
+        return col[index if self._rows is None else self._rows[index]]
+
+    def _set(self, name, index, value):
+        '''
+        helper function to change one value of a column
+        '''
+        self._own()
+        col = self._columns[name] if name in self._columns else self._features[name]
+        col[index] = value
+        self._version += 1
+
+    def _take(self, indices = None):
+        '''
+        helper function to copy a subset of rows of every column
+        returns the columns and feature column dicts
+        indices: np array of rows or boolean mask, None for all blobs
+        '''
+        rows = self._storageRows(indices)
+        if rows is None:
+            n = self._size
+            return (dict((k, v[:n].copy()) for k, v in self._columns.items()),
+                    dict((k, v[:n].copy()) for k, v in self._features.items()))
+        return (dict((k, v[rows]) for k, v in self._columns.items()),
+                dict((k, v[rows]) for k, v in self._features.items()))
+
+    def _keep(self, indices):
+        '''
+        helper function to keep only a subset of rows
+        indices: np array of rows or boolean mask
+        '''
+        self._compact()
+        self._select(indices)
+        self._version += 1
+
+    def _select(self, indices):
+        '''
+        helper function to keep a subset of rows including removed rows.  Shared
+        columns are not copied, private columns are compacted to free the other rows
+        indices: np array of rows or boolean mask
+        '''
+        if self._private():
+            self._columns, self._features = self._take(indices)
+            self._newStorage(len(self._columns['x']))
+        else:
+            self._rows = self._storageRows(indices)
+
+    def _featureColumn(self, name):
+        '''
+        helper function to get a feature column for writing, creating it if needed
+        '''
+        self._own()
+        if name not in self._features:
+            self._features[name] = np.full(len(self._columns['x']), np.nan)
+        return self._features[name]
+
+    def getColumn(self, name):
+        '''
+        Gets a read only view of a column of every blob
+        name: one of x, y, radius, circularity, group or a feature name
+        returns an np array
+        '''
+        col = self._column(name).view()
+        col.flags.writeable = False
+        return col
+
+    def getXY(self):
+        '''
+        returns an (n,2) np array of the x,y coordinates of every blob
+        '''
+        return np.column_stack((self._column('x'), self._column('y')))
+
+    def _reserve(self, capacity):
+        '''
+        helper function to grow the private column arrays to hold capacity rows
+        '''
+        n = self._size
+        for columns, fill in ((self._columns, 0), (self._features, np.nan)):
+            for name, col in columns.items():
+                grown = np.full(capacity, fill, dtype = col.dtype)
+                grown[:n] = col[:n]
+                columns[name] = grown
+
     def append(self, blb):
         if isinstance(blb, blob.blob):
-            self.blobs.append(blb)
+            self._own()
+            n = self._size
+            #double the arrays when full, so appending is O(1) amortized
+            if n == len(self._columns['x']):
+                self._reserve(max(16, 2 * n))
+            group = -1 if blb.group is None else blb.group
+            for name, value in (('x', blb.X), ('y', blb.Y), ('radius', blb.radius),
+                                ('circularity', blb.circularity), ('group', group)):
+                self._columns[name][n] = value
+            features = blb.features if blb.features is not None else dict()
+            for name in features:
+                self._featureColumn(name)
+            for name, col in self._features.items():
+                col[n] = features.get(name, np.nan)
+            self._size = n + 1
+            current = self._indexVersion == self._version
+            self._version += 1
+            #keep a current spatial index up to date instead of rebuilding it
+            if current:
+                self._index.add(blb.X, blb.Y, blb.radius)
+                self._indexVersion = self._version
+
+    def remove(self, index):
+        '''
+        Removes the blob at index from the list.  The row is marked as removed and
+        deleted from the columns with later removals, so removing is O(1) amortized
+        index: row of the blob to remove
+        '''
+        row = self._baseIndex(index)
+        current = self._indexVersion == self._version
+        if current:
+            self._index.remove(row, self._get('x', index), self._get('y', index))
+        self._removed.append(row)
+        self._version += 1
+        if current:
+            self._indexVersion = self._version
+        if len(self._removed) * blobList.compactFraction > self._baseLength():
+            self._compact()
+
+    def getSpatialIndex(self):
+        '''
+        Gets the grid index of the blob centers, rebuilding it if the blobs changed
+        since it was built.  Appending and removing blobs updates the index in place
+        returns a spatialIndex of the rows of this list
+        '''
+        self._compact()
+        return self._spatialIndex()
+
+    def _spatialIndex(self):
+        '''
+        helper function to get the spatial index without deleting removed rows,
+        the index gives rows including removed rows
+        '''
+        if self._index is None or self._indexVersion != self._version:
+            self._index = spatialIndex.spatialIndex()
+            self._index.build(self._column('x'), self._column('y'), self._column('radius'))
+            self._indexVersion = self._version
+        return self._index
+
+
+    def getPyramid(self):
+        '''
+        Gets the level of detail pyramid of the blob centers, rebuilding it if the blobs
+        changed since it was built
+        returns a blobPyramid of the rows of this list
+        '''
+        if self._pyramid is None or self._pyramidVersion != self._version:
+            self._pyramid = blobPyramid.blobPyramid(self._column('x'), self._column('y'),
+                                                    self._column('radius'))
+            self._pyramidVersion = self._version
+        return self._pyramid
+
+    def blobAt(self, globalPoint):
+        '''
+        Finds the first blob containing a point
+        globalPoint: (x,y) tuple in the image coordinate space
+        returns the index of the blob, None if the point is not in any blob
+        '''
+        index = self._spatialIndex()
+        #the stored columns are read through _rows for just the candidates of the index
+        rows = index.containing(globalPoint[0], globalPoint[1], self._columns['x'],
+                                self._columns['y'], self._columns['radius'], self._rows)
+        return int(self._listIndices(rows[:1])[0]) if len(rows) != 0 else None
+
+    def nearest(self, globalPoint, maxDist = None):
+        '''
+        Finds the blob with a center closest to a point
+        globalPoint: (x,y) tuple in the image coordinate space
+        maxDist: largest distance to consider, None for no limit
+        returns (index, distance) of the closest blob, (None, inf) if none is found
+        '''
+        index = self._spatialIndex()
+        row, dist = index.nearest(globalPoint[0], globalPoint[1], self._columns['x'],
+                                  self._columns['y'], maxDist, self._rows)
+        if row is None:
+            return row, dist
+        return int(self._listIndices(np.array([row]))[0]), dist
 
     def length(self):
-        return len(self.blobs)
+        return self._baseLength() - len(self._removed)
+
+    def hasFeature(self, name):
+        '''
+        Checks if every blob has the named feature from blob finding
+        name: feature name, e.g. from blobFinder.featureName
+        '''
+        if self.length() == 0 or name not in self._features:
+            return False
+        return not np.any(np.isnan(self._column(name)))
+
+    def getFeature(self, name):
+        '''
+        Gets the named feature of each blob as a column
+        returns an np array of the feature values, nan for blobs without the feature
+        name: feature name, e.g. from blobFinder.featureName
+        '''
+        if name not in self._features:
+            return np.full(self.length(), np.nan)
+        return np.array(self._column(name))
 
     def __copy__(self):
         cls = self.__class__
         result = cls.__new__(cls)
         result.__dict__.update(self.__dict__)
+        #the copy shares the columns, but has its own index
+        self._shareWith(result)
+        result._index = None
+        result._indexVersion = -1
+        result.ROIs = self.ROIs.copy()
         return result
 
     def __deepcopy__(self, memo):
@@ -47,42 +651,79 @@ class blobList(object):
         result = cls.__new__(cls)
         memo[id(self)] = result
 
-        result.blobs = deepcopy(self.blobs)
-        result.filters = deepcopy(self.filters)
-        result.description = deepcopy(self.description)
-        result.ROI = deepcopy(self.ROI)
+        result._version = 0
+        result._index = None
+        result._indexVersion = -1
+        result._pyramid = None
+        result._pyramidVersion = -1
+        result._labelCache = None
+        #share the columns until either list changes them
+        self._shareWith(result)
+        result.filters = list(self.filters)
+        result.description = self.description
+        result.ROI = list(self.ROI)
+        result.ROIs = self.ROIs.copy()
+        result._roiGeometry = self._roiGeometry
         result.threshCutoff = self.threshCutoff
-        result.groupLabels = deepcopy(self.groupLabels)
+        result.groupLabels = dict(self.groupLabels)
+        result._labelVersion = 0 if self._labelVersion == self._version else -1
+        result.lineage = list(self.lineage)
 
         result.blobFinder = blobFinder.blobFinder(self.blobFinder.slide)
         result.blobFinder.copyParameters(self.blobFinder)
 
         return result
 
-    def partialDeepCopy(self, newBlobs):
+    def partialDeepCopy(self, newBlobs, operation = 'subset'):
+        '''
+        Creates a new list with the parameters of this list and different blobs.
+        A selection of this list shares its columns until either list changes them,
+        so chained filters only store the selected rows
+        newBlobs: a blobSequence, an iterable of blobs, or an np array of the 
+            rows or boolean mask of this list to keep
+        operation: short description of the derivation, recorded in lineage
+        '''
         cls = self.__class__
         result = cls.__new__(cls)
 
-        result.blobs = newBlobs
+        result._version = 0
+        result._index = None
+        result._indexVersion = -1
+        result._pyramid = None
+        result._pyramidVersion = -1
+        result._labelCache = None
+        result._labelVersion = -1
+        if isinstance(newBlobs, np.ndarray):
+            self._shareWith(result, newBlobs)
+        else:
+            result._setFromBlobs(newBlobs)
         result.generateGroupLabels()
-        result.filters = deepcopy(self.filters)
-        result.description = deepcopy(self.description)
-        result.ROI = deepcopy(self.ROI)
+        result.filters = list(self.filters)
+        result.description = self.description
+        result.ROI = list(self.ROI)
+        result.ROIs = self.ROIs.copy()
+        result._roiGeometry = self._roiGeometry
         result.threshCutoff = self.threshCutoff
+        #each step records the operation and the number of blobs kept
+        result.lineage = self.lineage + ['{} ({} of {} blobs)'.format(operation, result.length(), 
+                                                                     self.length())]
 
         result.blobFinder = blobFinder.blobFinder(self.blobFinder.slide)
         result.blobFinder.copyParameters(self.blobFinder)
 
         return result
 
-
     def saveBlobs(self, filename):
         '''
         save the current blob coordinates in pixels and the set of blob find parameters
         and histogram filters applied to generate the set
+        Files with the binaryExtension are written in the binary format, see saveBinaryBlobs
         fileName: file to save to
         '''
-        if len(self.blobs) == 0:
+        if self.length() == 0:
+            return
+        if os.path.splitext(filename)[1].lower() == blobList.binaryExtension:
+            self.saveBinaryBlobs(filename)
             return
         output = open(filename,'w')
         #save blob finding parameters
@@ -90,6 +731,8 @@ class blobList(object):
             output.write("{}\t{}\n".format(key,val))
         #save ROI
         output.write('ROI: {}\n'.format(self.ROI))
+        if len(self.ROIs) != 0:
+            output.write('ROIs: {}\n'.format(self.ROIs.toDict()))
         #save histogram filters 
         if len(self.filters) != 0:
             output.write("->{}->\n".format('->'.join(self.filters)))
@@ -97,47 +740,134 @@ class blobList(object):
             output.write("->\n")
         #blb parameter header
         output.write("x\ty\tr\tc\n")    
-        #save blobs
-        for b in self.blobs:
-            output.write("{}\n".format(b.toString()))
+        #save blobs, matching blob.toString
+        np.savetxt(output, np.column_stack([self._column(k) for k in ('x','y','radius','circularity')]),
+                   fmt = '%.3f', delimiter = '\t')
             
         output.close()
 
+    def saveBinaryBlobs(self, filename):
+        '''
+        save the blobs in a binary, columnar format which loads without parsing.
+        The file starts with binaryMagic and the length of a json header, which holds
+        the blob finding parameters, ROI, filters and the dtype and offset of each column.
+        Every column follows as a raw, little endian array aligned to binaryAlignment bytes,
+        so the columns can be memory mapped.  Unlike the text format, groups and
+        features from blob finding are kept.
+        filename: file to save to
+        '''
+        names = [name for name, dtype in blobList.columnTypes] + sorted(self._features)
+        columns = []
+        offset = 0
+        for name in names:
+            col = np.ascontiguousarray(self._column(name))
+            col = col.astype(col.dtype.newbyteorder('<'))
+            columns.append((name, col, offset))
+            offset += -(-col.nbytes // blobList.binaryAlignment) * blobList.binaryAlignment
+
+        header = {'count' : self.length(),
+                  'parameters' : dict((key, str(val)) for key, val in 
+                                      self.blobFinder.getParameters().items()),
+                  'ROI' : [[float(p[0]), float(p[1])] for p in self.ROI],
+                  'ROIs' : self.ROIs.toDict(),
+                  'filters' : self.filters,
+                  'columns' : [{'name' : name, 'dtype' : col.dtype.str, 'offset' : off}
+                               for name, col, off in columns]}
+        header = json.dumps(header).encode('utf-8')
+        start = len(blobList.binaryMagic) + 4 + len(header)
+        padding = -start % blobList.binaryAlignment
+
+        with open(filename, 'wb') as output:
+            output.write(blobList.binaryMagic)
+            output.write(struct.pack('<I', len(header)))
+            output.write(header)
+            output.write(b'\0' * padding)
+            for name, col, off in columns:
+                output.write(col.tobytes())
+                output.write(b'\0' * (-col.nbytes % blobList.binaryAlignment))
+
+    @staticmethod
+    def isBinaryBlobFile(filename):
+        '''
+        Checks if a file is in the binary blob format of saveBinaryBlobs
+        filename: the file to check
+        '''
+        with open(filename, 'rb') as reader:
+            return reader.read(len(blobList.binaryMagic)) == blobList.binaryMagic
+
+    def loadBinaryBlobs(self, filename, memoryMap = True):
+        '''
+        Loads the blobs and sets the blob finding parameters from a binary blob file
+        filename: the file to read in.  Formatted from saveBinaryBlobs
+        memoryMap: set to map the columns from the file instead of reading them,
+            the columns are copied when changed
+        '''
+        with open(filename, 'rb') as reader:
+            if reader.read(len(blobList.binaryMagic)) != blobList.binaryMagic:
+                raise ValueError('{} is not a binary blob file'.format(filename))
+            length = struct.unpack('<I', reader.read(4))[0]
+            header = json.loads(reader.read(length).decode('utf-8'))
+        start = len(blobList.binaryMagic) + 4 + length
+        start += -start % blobList.binaryAlignment
+
+        for key, val in header['parameters'].items():
+            self.blobFinder.setParameterFromSplitString([key, '{}\n'.format(val)])
+        self.ROI = [tuple(p) for p in header['ROI']]
+        self.ROIs = roiEngine.roiSet(header.get('ROIs'))
+        self.filters = header['filters']
+
+        n = header['count']
+        columns = dict()
+        for col in header['columns']:
+            dtype = np.dtype(col['dtype'])
+            if n == 0:
+                columns[col['name']] = np.zeros(0, dtype = dtype)
+            elif memoryMap:
+                columns[col['name']] = np.memmap(filename, dtype = dtype, mode = 'r', 
+                                                 offset = start + col['offset'], shape = (n,))
+            else:
+                with open(filename, 'rb') as reader:
+                    reader.seek(start + col['offset'])
+                    columns[col['name']] = np.fromfile(reader, dtype = dtype, count = n)
+        names = [name for name, dtype in blobList.columnTypes]
+        self._columns = dict((name, columns.pop(name)) for name in names)
+        self._features = columns
+        #mapped columns are read only, copy before changing them
+        self._newStorage(n, memoryMap)
+        self._version += 1
+        self.generateGroupLabels()
+
     def loadBlobs(self, filename):
         '''
         Loads the blobs and sets the blob finding parameters from a filename
-        filename: the txt file to read in.  Formatted from saveBlobs
+        filename: the txt file to read in.  Formatted from saveBlobs, 
+            binary blob files are read with loadBinaryBlobs
         '''
+        if blobList.isBinaryBlobFile(filename):
+            self.loadBinaryBlobs(filename)
+            return
         reader = open(filename,'r')
         lines = reader.readlines()
-        self.blobs = []
-        for l in lines:
-            toks = l.split('\t')
-            if len(toks) == 1 and toks[0][0] == 'x':
-                self.loadBlobsFromXY(lines)
-                break
-            if len(toks) == 2:
-                #set blob finder parameters
-                self.blobFinder.setParameterFromSplitString(toks)
-            elif toks[0] != 'x' and len(toks) > 2:
-                #add new blob
-                self.blobs.append(blob.blob.blobFromSplitString(toks))    
-            else:
-                #get filters
-                toks = l.split('->')
-                if len(toks) > 1:
-                    self.filters = toks[1:-1]
-                elif l[0:3] == 'ROI':
-                    self.ROI = ast.literal_eval(l[5:])
+        reader.close()
+        parameters, ROI, ROIs, filters, columns = blobParser.parseBlobText(lines)
+        for toks in parameters:
+            #set blob finder parameters
+            self.blobFinder.setParameterFromSplitString(toks)
+        if filters is not None:
+            self.filters = filters
+        if ROI is not None:
+            self.ROI = ROI
+        if ROIs is not None:
+            self.ROIs = roiEngine.roiSet(ROIs)
 
+        self.blobs = columns
         self.generateGroupLabels()
 
     def loadBlobsFromXY(self, lines):
         '''
         Loads blobs from a text file of the form "x_{}y_{}" which is used frequently in bruker instruments
         '''
-        for l in lines:
-            self.blobs.append(blob.blob.blobFromXYString(l));
+        self.blobs = blobParser.parseXYNames(lines)
 
     def blobRequest(self, globalPoint, radius):
         '''
@@ -147,300 +877,250 @@ class blobList(object):
         radius: the radius of the new blob to be added
         returns true if a blob was added, false if one was removed
         '''
-        for i,b in enumerate(self.blobs):
-            if (globalPoint[0]-b.X)**2 + (globalPoint[1]-b.Y)**2 <= \
-                b.radius**2:
-                self.blobs.pop(i)
-                return False, i
+        i = self.blobAt(globalPoint)
+        if i is not None:
+            self.remove(i)
+            return False, i
 
-        self.blobs.append(blob.blob(globalPoint[0], globalPoint[1], radius))
+        self.append(blob.blob(globalPoint[0], globalPoint[1], radius))
         return True, -1
 
 
-    def blobSlide(self):
+    def blobSlide(self, progress = None, cancel = None, checkpoint = None):
+        '''
+        Performs blob finding on the whole slide or the ROI and sets the result to this list
+        progress: function called with progress dicts, see blobFinder.blobSlideIter
+        cancel: a threading.Event checked between subregions, set to stop early
+        checkpoint: filename to record completed subregions in, resumed if it exists
+        returns a string summarizing the result
+        '''
         if len(self.ROI) < 3:
-            self.blobs = self.blobFinder.blobSlide()
-            return "Finished blob finding on whole slide, found {} blobs".format(len(self.blobs))
+            self.blobs = self.blobFinder.blobSlide(progress = progress, cancel = cancel,
+                                                   checkpoint = checkpoint)
+            status = "Cancelled" if cancel is not None and cancel.is_set() else "Finished"
+            return "{} blob finding on whole slide, found {} blobs ({})".format(
+                status, self.length(), blobFinder.blobFinder.describePlan(self.blobFinder.tilePlan))
         else:
-            self.blobs = self.blobFinder.blobSlide(ROI = self.ROI)
-            if len(self.blobs) != 0:
-                roi = Path(self.ROI)
-                points = np.array([ (b.X,b.Y) for b in self.blobs])
-                self.blobs = [self.blobs[i] for i in np.where(roi.contains_points(points))[0]]
-            return "Finished blob finding in ROI, found {} blobs".format(len(self.blobs))
+            self.blobs = self.blobFinder.blobSlide(ROI = self.ROI, progress = progress, cancel = cancel,
+                                                   checkpoint = checkpoint)
+            status = "Cancelled" if cancel is not None and cancel.is_set() else "Finished"
+            if self.length() != 0:
+                self._keep(roiEngine.containsPoints(self.ROI, self._column('x'), self._column('y')))
+            return "{} blob finding in ROI, found {} blobs ({})".format(
+                status, self.length(), blobFinder.blobFinder.describePlan(self.blobFinder.tilePlan))
 
     def getROI(self, point, distCutoff, append = False):
         '''
         Performs checks and additions to interacting with an ROI. Does not alter ROI
+        Removes the first vertex within distCutoff of the point, otherwise inserts the point
+        into the closest edge which does not cause the ROI to cross itself.
+        The edge index of the ROI is kept until the ROI changes, so repeated calls while
+        the mouse moves only search near the point
         point: global point to check
+        distCutoff: distance to an existing vertex to remove it
+        append: if true, always add the point to the end of the ROI
         returns a new list of tuples of the ROI
         '''
         result = self.ROI.copy()
         if point is not None and len(self.ROI) > 2 and append == False:
-            #find distances between point and ROI
-            dists = pdist([point] + result)[:len(result)]
-            #remove first point with dist <= ROI_DIST
-            for i,d in enumerate(dists):
-                if d < distCutoff:
-                    result.pop(i)
-                    return result
-
-            #add between the two closest dists
-            dists = np.append(dists, dists[0])
-            dist2 = []
-            for i in range(len(dists) -1):
-                dist2.append(dists[i] + dists[i+1])
-            #quick, no check for intersection
-            #result.insert(np.argmin(dist2)+1, point)
-
-            #slower, checks for overlapping, returns the shortest distance without overlap
-            pos = np.argsort(dist2)
-            for p in pos:
-                #check first leg of path
-                segment = Path([result[p], point])
-                testSeg = Path(result[p+1:] + result[:p], [Path.MOVETO] + [Path.LINETO]*(len(result)-2))
-                if testSeg.intersects_path(segment):
-                    continue
-
-                #check second leg of path
-                if p+1 == len(result):
-                    segment = Path([point, result[0]])
-                    testSeg = Path(result[1:], [Path.MOVETO] + [Path.LINETO]*(len(result)-2))
-                    if testSeg.intersects_path(segment):
-                        continue
-                else:
-                    segment = Path([point, result[p+1]])
-                    testSeg = Path(result[p+2:] + result[:p+1], [Path.MOVETO] + [Path.LINETO]*(len(result)-2))
-                    if testSeg.intersects_path(segment):
-                        continue
-
-                #passed, return:
-                result.insert(p+1, point)
+            geometry = self.getROIGeometry()
+            i = geometry.vertexNear(point, distCutoff)
+            if i is not None:
+                result.pop(i)
                 return result
 
+            i = geometry.insertionIndex(point)
+            if i is not None:
+                result.insert(i, point)
+
         elif point is not None:
             result.append(point)
             
         return result
 
-    def roiFilter(self):
-        if len(self.ROI) < 3:
+    def getROIGeometry(self):
+        '''
+        Gets the edge index of the current ROI, rebuilding it if the ROI has changed
+        returns a roiEngine.roiGeometry
+        '''
+        key = tuple(tuple(p) for p in self.ROI)
+        if self._roiGeometry is None or self._roiGeometry[0] != key:
+            self._roiGeometry = (key, roiEngine.roiGeometry(self.ROI))
+        return self._roiGeometry[1]
+
+    def nameROI(self, name):
+        '''
+        Saves the current ROI as a named ROI, replacing any ROI with the same name
+        name: the name of the ROI
+        '''
+        self.ROIs.add(name, self.ROI)
+
+    def roiMask(self, names = None, combine = 'union'):
+        '''
+        Tests which blobs fall within the ROI
+        names: list of named ROIs to combine, None to use the current ROI
+        combine: 'union', 'intersection' or 'difference' of the named ROIs, 
+            see roiEngine.roiSet.contains
+        returns a boolean np array, None if there is no ROI to test
+        '''
+        if names is None:
+            if len(self.ROI) < 3:
+                return None
+            return roiEngine.containsPoints(self.ROI, self._column('x'), self._column('y'))
+        return self.ROIs.contains(self._column('x'), self._column('y'), names, combine)
+
+    def roiFilter(self, names = None, combine = 'union'):
+        '''
+        Keeps the blobs within the ROI
+        names: list of named ROIs to combine, None to use the current ROI
+        combine: 'union', 'intersection' or 'difference' of the named ROIs
+        returns a new blobList
+        '''
+        mask = self.roiMask(names, combine)
+        if mask is None:
             return deepcopy(self)
-        roi = Path(self.ROI)
-        points = np.array([ (b.X,b.Y) for b in self.blobs])
-        if points.size == 0:
-            return self.partialDeepCopy([])
-        result = self.partialDeepCopy([self.blobs[i] for i in np.where(roi.contains_points(points))[0]])
-        return result
+        return self.partialDeepCopy(mask, 'ROI filter')
 
-    def roiFilterInverse(self):
-        if len(self.ROI) < 3:
+    def roiFilterInverse(self, names = None, combine = 'union'):
+        '''
+        Removes the blobs within the ROI
+        names: list of named ROIs to combine, None to use the current ROI
+        combine: 'union', 'intersection' or 'difference' of the named ROIs
+        returns a new blobList
+        '''
+        mask = self.roiMask(names, combine)
+        if mask is None:
             return deepcopy(self)
-        roi = Path(self.ROI)
-        points = np.array([ (b.X,b.Y) for b in self.blobs])
-        if points.size == 0:
-            return self.partialDeepCopy([])
-        result = self.partialDeepCopy([self.blobs[i] for i in np.where(np.logical_not(roi.contains_points(points)))[0]])
-        return result
+        return self.partialDeepCopy(~mask, 'inverse ROI filter')
 
     def distanceFilter(self, dist, subblocks = None, verbose = False):
         '''
         Filter blob positions based on a set separation distance.
-        Implemented by dividing the area into different subregions.
-        Blobs are binned into at least one region, then all pairwise distances
-        are compared to the distance cutoff.
-        Returns list of bool with result[i] == true if i has a neighbor too close (< dist away)
+        Pairs of blobs closer than the cutoff are found with a KD-tree,
+        both blobs of each pair fail the filter.
+        Returns a new blobList of the blobs without a neighbor too close (< dist away)
 
-        blobs: list of blobs
         dist: the distance cutoff
-        subblocks: specify the number of subblocks to divide the area into.
-            Divides the x and y into subblocks sections
-            = None allows the function to dynamically determine number of subblocks 
+        subblocks: unused, kept for compatibility with the previous subregion implementation
         verbose: set if output message is printed to console
         '''
-        if self.blobs is None or len(self.blobs) == 0:
+        if self.length() == 0:
             return
-        #initialize result and determine subblocks
-        result = [False] * len(self.blobs)
-        if subblocks is None:
-            subblocks = int(np.ceil(np.sqrt(len(self.blobs)/100)))
-            subblocks = min(subblocks, 5)
-
-        subLocs = self._groupBlobs(dist, subblocks)
-
-        #perform distance filtering on each sub block
-        for i in range(subblocks+1):
-            for j in range(subblocks+1):
-                #number of points in sub region
-                n = len(subLocs[i][j])
-                #np array of points
-                locs = np.zeros((n,2))
-                #populate locs
-                for ii,v in enumerate(subLocs[i][j]):
-                    locs[ii,0] = self.blobs[v].X
-                    locs[ii,1] = self.blobs[v].Y
-                #distance filter the sub region list
-                #tooClose[i] == true if point[i] is too close to a neighbor
-                tooClose = blobList._distFilter(locs, dist)
-                #set result, index is the subLocs[x][y] and the kth point in that subregion list
-                for k in np.where(tooClose)[0]:
-                    result[subLocs[i][j][k]] = True
+        xy = self.getXY()
+        #pairs of indices at most dist apart
+        pairs = cKDTree(xy).query_pairs(dist, output_type = 'ndarray')
+        #drop pairs exactly dist apart, the cutoff is strict
+        if len(pairs) != 0:
+            diff = xy[pairs[:,0]] - xy[pairs[:,1]]
+            pairs = pairs[np.hypot(diff[:,0], diff[:,1]) < dist]
+        #tooClose[i] == true if point[i] is too close to a neighbor
+        tooClose = np.zeros(self.length(), dtype = bool)
+        tooClose[pairs.ravel()] = True
 
         #determine number of blobs passing filter
-        count = np.sum(result)
+        count = np.sum(tooClose)
         #report to console
-        if verbose: print("Done! {} blobs within {} pixels, {} remaining".format(count, dist, len(result) - count))
+        if verbose: print("Done! {} blobs within {} pixels, {} remaining".format(count, dist, len(tooClose) - count))
         
-        newList = self.partialDeepCopy([self.blobs[i] for i in np.where(~np.array(result))[0]])
+        newList = self.partialDeepCopy(~tooClose, "distance > {}".format(dist))
         newList.filters.append("distance > {}".format(dist))
         return newList
 
-    
-    @staticmethod    
-    def _distFilter(locs, dist):
-        '''
-        A helper function for performing distance filtering of a np matrix.
-        Returns a list of bool with result[i] == true if too close to another point
-        locs: np array of points[n][2]
-        dist: the distance cutoff
-        '''
-        #number of points
-        n = len(locs)
-        #map between square form of row i, column j, and the row vector from pdist
-        q = lambda i,j,n: int(n*j - j*(j+1)/2+i-1-j)
-        #initialize result
-        result = [False] * n
-        #calculate euclidean distance
-        dists = pdist(locs)
-        #for each x,y pair
-        for i in range(1,n):
-            for j in range(i):
-                #if distance between i and j is less than distance
-                if dists[q(i,j,n)] < dist:
-                    #both blobs fail, ie result = true
-                    result[i] = True
-                    result[j] = True
-        return result
-
     def minimumDistances(self, subblocks = None, overlap = 250):
         '''
         Calculate the minimum distance between each blob.
-        Similar algorithm to distFilter, but records the min distance
-        returns a list of floats with the minimum distance between each point
-        blobs: list of blobs
-        subblocks: number of subdivisions of x and y dimension
-            = None to dynamically choose number of subblocks
-        overlap: the amount of overlap in pixels between subregions, in a sense defines
-            the maximum, reliable distance reported
+        The nearest neighbor of every blob is found exactly with a KD-tree
+        returns an np array of floats with the minimum distance between each point
+        subblocks: unused, kept for compatibility with the previous subregion implementation
+        overlap: distance reported for a blob without any neighbor, 
+            only used when the list holds a single blob
         '''
 
-        if self.blobs is None or self.length() == 0:
+        if self.length() == 0:
             return None
-        
-        #initialize result
-        result = [float("inf")] * len(self.blobs)
-        #determine subblocks size
-        if subblocks is None:
-            subblocks = int(np.ceil(np.sqrt(len(self.blobs)/100)))
-            subblocks = min(subblocks, 5)
-
-        subLocs = self._groupBlobs(overlap, subblocks)
-
-        #for each sub region list
-        for i in range(subblocks+1):
-            for j in range(subblocks+1):
-                #number of points
-                n = len(subLocs[i][j])
-                #initialize temporary list of points
-                locs = np.zeros((n,2))
-                #add points into locs
-                for ii,v in enumerate(subLocs[i][j]):
-                    locs[ii,0] = self.blobs[v].X
-                    locs[ii,1] = self.blobs[v].Y
-                #calculate distances
-                dists = blobList._minDists(locs)
-                #record minimum of the reported distance and previous value
-                for k, d in enumerate(dists):
-                    result[subLocs[i][j][k]] = min(result[subLocs[i][j][k]], d)
-        
-        temp = np.array(result)
-        maxVal = max(temp[temp != float("inf")])
-        maxVal = max(maxVal, overlap)
-        for i, r in enumerate(result):
-            if r == float("inf"):
-                result[i] = maxVal
-        return result
+        if self.length() == 1:
+            return np.array([float(overlap)])
+
+        xy = self.getXY()
+        #the closest point to each blob is itself, the second is its nearest neighbor
+        dists, _ = cKDTree(xy).query(xy, k = 2)
+        return dists[:,1]
     
     @staticmethod
-    def _minDists(locs):
-        '''
-        A helper function to calculate the closest neighbor of each blob
-        returns a list of floats with result[i] indicating there exists another neighbor
-            that distance away.
-        locs: an np array of the x,y coordinates
-        '''
-        #get number of points
-        n = len(locs)
-        #lambda function to convert index in square and row form
-        q = lambda i,j,n: int(n*j - j*(j+1)/2+i-1-j)
-        #initialize result
-        result = [float("inf")] * n
-        #calculate euclidean distance between each point
-        dists = pdist(locs)
-        #for each x,y pair
-        for i in range(1,n):
-            for j in range(i):
-                #record the minimum of the current distance an the previous value
-                result[i] = min(result[i], dists[q(i,j,n)])
-                result[j] = min(result[j], dists[q(i,j,n)])
-        return result
-
-    def _groupBlobs(self, overlap, subblocks):
+    def _layerMask(pattern, numLayers):
         '''
-        A helper function for grouping blobs into subregions defined by the number of subblocks
-        return a 2d list of indices split by the blob x and y coordinates
-        overlap: amount of overlap for adding duplicate blobs
-        subblocks: number of subdivisions in x and y
+        helper function to get the unit offsets of a layered pattern around a blob
+        The first offset is the blob center.  Layer n starts n+1 spacings to the right
+        and spirals around the center, taking each marcher direction n+1 times.
+        Masks are cached by pattern and number of layers
+        returns a read only (m,2) np array of offsets in units of the spacing
+        pattern: 'rectangular' or 'hexagonal'
+        numLayers: number of layers around the center
         '''
-        #find min and max limits of x and y
-        lowX = min(map(lambda x : x.X, self.blobs))
-        highX = max(map(lambda x : x.X, self.blobs))
-        lowY = min(map(lambda x : x.Y, self.blobs))
-        highY = max(map(lambda x : x.Y, self.blobs))
+        key = (pattern, int(numLayers))
+        if key not in blobList._layerMasks:
+            marcher = blobList.rectangularMarcher if pattern == 'rectangular' \
+                else blobList.hexagonalMarcher
+            layers = [np.zeros((1,2))]
+            for n in range(key[1]):
+                steps = np.repeat(marcher, n+1, axis = 0)
+                layers.append(np.array([[n+1., 0]]) + np.cumsum(steps, axis = 0))
+            mask = np.vstack(layers)
+            mask.flags.writeable = False
+            blobList._layerMasks[key] = mask
+        return blobList._layerMasks[key]
 
-        #find subblock size of x and y
-        subX =  (highX - lowX)/ subblocks
-        subY = (highY - lowY)/subblocks
+    @staticmethod
+    def _circleMask(spots):
+        '''
+        helper function to get the unit vectors of evenly spaced points on a circle
+        returns an (spots,2) np array
+        spots: number of points
+        '''
+        thetas = np.linspace(0, 2*np.pi, int(spots), False)
+        return np.column_stack((np.cos(thetas), np.sin(thetas)))
 
-        #initialize a 2d array of empty lists to hold each point
-        result = [[[] for x in range(subblocks+1)] for y in range(subblocks+1)]
-        
-        #place indices of points into subLocs list
-        for i,v in enumerate(self.blobs):
-            #get divisor and remainder
-            (xd, xm) = (0,0) if subX == 0 else divmod(v.X-lowX, subX)
-            (yd, ym) = (0,0) if subY == 0 else divmod(v.Y-lowY, subY)
-            xd, yd = int(xd), int(yd)
-            #put into 'normal block'
-            result[xd][yd].append(i)
-            #place into overlap region
-            #in the top left corner
-            if (xm <=2*overlap and ym <= 2*overlap) and (xd-1 >=0 and yd -1 >=0):
-                result[xd-1][yd-1].append(i) 
-            #in the left margin
-            if xm <= 2*overlap and xd-1 >= 0:
-                result[xd-1][yd].append(i)
-            #in the top margin
-            if ym <= 2*overlap and yd -1 >= 0:
-                result[xd][yd-1].append(i)
+    def _expandMasks(self, keys, maskFor, scales, r, c, operation):
+        '''
+        helper function to expand every blob into a pattern of points.
+        Blobs sharing a pattern key are expanded together by broadcasting the mask
+        over their coordinates.
+        returns a new blobList of the expanded points, in blob order with the
+            group of each point set to the index of its blob
+        keys: np array of the pattern key of each blob, e.g. the number of layers
+        maskFor: function returning the (m,2) unit offsets of a pattern key
+        scales: np array of the factor scaling the offsets of each blob
+        r: radius of new blobs
+        c: circularity of new blobs
+        operation: name of the pattern, recorded in lineage
+        '''
+        blobXs, blobYs = self._column('x'), self._column('y')
+        xs, ys, groups = [np.zeros(0)], [np.zeros(0)], [np.zeros(0, dtype = np.int64)]
+        for key in np.unique(keys):
+            rows = np.where(keys == key)[0]
+            mask = maskFor(key)
+            x = blobXs[rows,None] + scales[rows,None] * mask[None,:,0]
+            y = blobYs[rows,None] + scales[rows,None] * mask[None,:,1]
+            xs.append(x.ravel())
+            ys.append(y.ravel())
+            groups.append(np.repeat(rows, len(mask)))
+        groups = np.concatenate(groups)
+        #keep the points of each blob together and in mask order
+        order = np.argsort(groups, kind = 'mergesort')
+        n = len(groups)
 
+        result = self.partialDeepCopy(np.zeros(0, dtype = np.intp), operation)
+        result._setColumns(np.concatenate(xs)[order], np.concatenate(ys)[order],
+                           np.full(n, r, dtype = np.float64), np.full(n, c, dtype = np.float64),
+                           groups[order])
+        result.generateGroupLabels()
+        result.lineage[-1] = '{} ({} points from {} blobs)'.format(operation, n, self.length())
         return result
 
     def circularPackPoints(self, spacing, maxSpots, offset, minSpots = 4, 
                            r=GUIConstants.DEFAULT_PATTERN_RADIUS, c = 1):
         '''
         Expands each blob into several points surrounding the blob.
-        blobs: list of blobs to expand
         spacing: minimum spacing between points
         maxSpots: max number of spots to expand for each blob
         offset: offset of circumference to space blobs
@@ -453,50 +1133,22 @@ class blobList(object):
         maxSpots = minSpots if maxSpots < minSpots else maxSpots
         #calculate min and max r:
         maxR = maxSpots*spacing/(2* np.pi)-offset
-        #angles and unit vectors of max spots
-        thetas = np.linspace(0,2*np.pi,maxSpots,False)
-        maxUnits = np.vstack((np.cos(thetas),np.sin(thetas)))
-        
         minR = minSpots*spacing/(2*np.pi)-offset
-        #angles and unit vectors at min number of spots
-        thetas = np.linspace(0,2*np.pi,minSpots,False)
-        minUnits = np.vstack((np.cos(thetas),np.sin(thetas)))
-        
-                
-        result = []
-        ind = 0
-        for blb in self.blobs:
-            #check radius for min, max or between
-            if(blb.radius > maxR):
-                unitvec =  maxUnits
-            elif(blb.radius < minR):
-                unitvec = minUnits
-            #between min and max, use most spots as possible while retaining the spacing
-            else:
-                spots = np.floor(2*np.pi*(blb.radius + offset)/spacing)
-                thetas = np.linspace(0,2*np.pi,spots,False)
-                unitvec = np.vstack((np.cos(thetas),np.sin(thetas)))
-            
-            #expand each blob into a new x,y positions        
-            targetSpots = unitvec*(blb.radius + offset) + \
-                np.matlib.repmat(np.array((blb.X, blb.Y))
-                                 ,unitvec.shape[1],1).T
-            #add targets to result
-            for e in targetSpots.T:
-                result.append(blob.blob(x = e[0],y = e[1], radius = r, circularity = c, group = ind))
-            #increment group number for next blob
-            ind += 1
-                   
-        result = self.partialDeepCopy(result)     
-        result.generateGroupLabels()
-        return result
+
+        radii = self._column('radius')
+        #between min and max, use most spots as possible while retaining the spacing
+        spots = np.floor(2*np.pi*(radii + offset)/spacing)
+        spots[radii > maxR] = maxSpots
+        spots[radii < minR] = minSpots
+
+        return self._expandMasks(spots.astype(np.int64), blobList._circleMask, 
+                                 radii + offset, r, c, 'circular pattern')
     
     def rectangularlyPackPoints(self, spacing, numLayers, 
                                    r = GUIConstants.DEFAULT_PATTERN_RADIUS, c = 1,
                                    dynamicLayering = False):
         '''
         Expands each blob into a grid of points, with regular rectangular spacing
-        blobs: list of blob objects to expand
         spacing: spacing between new blobs
         numLayers: number of layers around each blob. 1 generates a grid of 3x3 with the 
             initial blob in the center.  This can be adjusted for radius
@@ -504,67 +1156,16 @@ class blobList(object):
         c: circularity of new blobs
         dynamicLayering: set to True to account for blob size in making pattern positions
         '''
-        #marcher is a list of directions to move to for generating the spacing
-        #this starts at the right, moves down, left, up, right, down, to spiral around the blob
-        #additional layers are generated by applying the marcher multiple times
-        marcher = np.array([[0  ,  1],
-                            [-1.   ,  0.   ],
-                            [-1.   ,  0.   ],
-                            [0.   ,  -1.   ],
-                            [0.   ,  -1.   ],
-                            [ 1.   ,  0.   ],
-                            [ 1.   ,  0.   ],
-                            [0  ,  1]])
-        #use one mask each time
-        if dynamicLayering == False:
-            #start at center
-            mask = np.array([[0,0]])
-            for n in range(numLayers):
-                #move to the right by n spaces
-                current = np.array([[n+1.,0]])
-                for i in range(8):
-                    #add the marcher n times
-                    direction = marcher[i,:]
-                    for j in range(n+1):
-                        current += direction
-                        mask = np.append(mask,current,axis=0)
-            #scale unit mask by spacing
-            mask *= spacing
-        
-        result = []
-        ind = 0
-        for blb in self.blobs:
-            #use new mask each blob, with number of layers being size dependent
-            if dynamicLayering == True:
-                mask = np.array([[0,0]])
-                #only change from above is the blb.radius/spacing
-                for n in range(numLayers + int(np.ceil(blb.radius / spacing))):
-                    current = np.array([[n+1.,0]])
-                    for i in range(8):
-                        direction = marcher[i,:]
-                        for j in range(n+1):
-                            current += direction
-                            mask = np.append(mask,current,axis=0)
-                    
-                mask *= spacing
-            #expand blb by mask
-            for b in map(lambda x: blob.blob(x = x[0], y = x[1], radius = r, circularity=c, group=ind), 
-                         list(mask+(blb.X, blb.Y))
-                         ):
-                #add each point to result
-                result.append(b)
-            ind += 1
-
-        result = self.partialDeepCopy(result)
-        result.generateGroupLabels()
-        return result
+        return self._expandMasks(self._numLayers(spacing, numLayers, dynamicLayering),
+                                 lambda n: blobList._layerMask('rectangular', n),
+                                 np.full(self.length(), spacing, dtype = np.float64), r, c,
+                                 'rectangular pattern')
     
     def hexagonallyClosePackPoints(self, spacing, numLayers, 
                                    r = GUIConstants.DEFAULT_PATTERN_RADIUS, c = 1,
                                    dynamicLayering = False):
         '''
         Expands each blob into a grid of points, with hexagonal close packed spacing
-        blobs: list of blob objects to expand
         spacing: spacing between new blobs
         numLayers: number of layers around each blob. 1 generates a grid of 7 with the 
             initial blob in the center.  This can be adjusted for radius
@@ -572,86 +1173,121 @@ class blobList(object):
         c: circularity of new blobs
         dynamicLayering: set to True to account for blob size in making pattern positions
         '''
-        #this may save some computation time to precompute
-        sqrt3ov2 = np.sqrt(3)/2
-        #list of directions to march along to generate a layer
-        marcher = np.array([[-0.5  ,  sqrt3ov2],
-                            [-1.   ,  0.   ],
-                            [-0.5  , -sqrt3ov2],
-                            [ 0.5  , -sqrt3ov2],
-                            [ 1.   ,  0.   ],
-                            [ 0.5  ,  sqrt3ov2]])
-        #use one mask each time
-        if dynamicLayering == False:
-            #start at center
-            mask = np.array([[0,0]])
-            for n in range(numLayers):
-                current = np.array([[n+1.,0]])
-                for i in range(6):
-                    direction = marcher[i,:]
-                    for j in range(n+1):
-                        current += direction
-                        mask = np.append(mask,current,axis=0)
-                    
-            mask *= spacing
-        
-        
-        #strip off radius
-        result = []
-        ind = 0
-        for blb in self.blobs:
-            #use new mask each blob, with number of layers being size dependent
-            if dynamicLayering == True:
-                mask = np.array([[0,0]])
-                #change number of layers by blb radius
-                for n in range(numLayers + int(np.ceil(blb.radius / spacing))):
-                    current = np.array([[n+1.,0]])
-                    for i in range(6):
-                        direction = marcher[i,:]
-                        for j in range(n+1):
-                            current += direction
-                            mask = np.append(mask,current,axis=0)
-                    
-                mask *= spacing
-            #expand blb into points based on mask
-            for b in map(lambda x: blob.blob(x = x[0], y = x[1], radius = r, circularity=c, group=ind), 
-                         list(mask+(blb.X, blb.Y))
-                         ):
-                result.append(b)
-            ind += 1
-        
-        result = self.partialDeepCopy(result)
-        result.generateGroupLabels()
-        return result
+        return self._expandMasks(self._numLayers(spacing, numLayers, dynamicLayering),
+                                 lambda n: blobList._layerMask('hexagonal', n),
+                                 np.full(self.length(), spacing, dtype = np.float64), r, c,
+                                 'hexagonal pattern')
+
+    def _numLayers(self, spacing, numLayers, dynamicLayering):
+        '''
+        helper function to get the number of pattern layers around each blob
+        returns an np array of the layers of each blob
+        dynamicLayering: set to add layers covering the radius of each blob
+        '''
+        if dynamicLayering == True:
+            return numLayers + np.ceil(self._column('radius') / spacing).astype(np.int64)
+        return np.full(self.length(), numLayers, dtype = np.int64)
 
     def generateGroupLabels(self):
         '''
         Populates groupLabels, a dict of NAME -> (x,y) for each group member.
         (x,y) is the top right corner (max X, min Y) in global coordinates
+        The group column is sorted and reduced in one pass, the labels are kept
+        until the blobs change
         '''
+        if self._labelVersion == self._version:
+            return
 
+        groups = self._column('group')
+        grouped = np.nonzero(groups >= 0)[0]
         self.groupLabels = dict()
-        for b in self.blobs:
-            if b.group is not None:
-                #add in current blob
-                if b.group not in self.groupLabels:
-                    self.groupLabels[b.group] = (b.X, b.Y)
-                else:
-                    #update tuple
-                    p = self.groupLabels[b.group]
-                    self.groupLabels[b.group] = (max(b.X, p[0]), min(b.Y, p[1]))
+        if len(grouped) != 0:
+            groups = groups[grouped]
+            #expanded patterns are already sorted by group
+            if np.any(groups[1:] < groups[:-1]):
+                order = np.argsort(groups, kind = 'mergesort')
+                grouped, groups = grouped[order], groups[order]
+            starts = np.concatenate(([0], np.nonzero(groups[1:] != groups[:-1])[0] + 1))
+            maxX = np.maximum.reduceat(self._column('x')[grouped], starts)
+            minY = np.minimum.reduceat(self._column('y')[grouped], starts)
+            self.groupLabels = dict(zip(groups[starts].tolist(), zip(maxX, minY)))
+        self._labelVersion = self._version
 
+    def getVisibleLabels(self, slideWrapper, spacing):
+        '''
+        Gets the group labels to draw in the current view of a slide.
+        Labels are thinned to at most one in each cell of a grid with a side of spacing
+        local pixels, so the number drawn is bounded at every zoom level.  The thinned
+        labels and their spatial index are kept until the labels or zoom level change
+        slideWrapper: the slide with the current view
+        spacing: the minimum distance between labels in local pixels
+        returns (xs, ys, names) np arrays of the label positions and group names in view
+        '''
+        self.generateGroupLabels()
+        key = (self._labelVersion, slideWrapper.lvl)
+        if self._labelCache is None or self._labelCache[0] != key:
+            names = np.array(list(self.groupLabels.keys()), dtype = np.int64)
+            pos = np.array(list(self.groupLabels.values()), dtype = np.float64).reshape((-1, 2))
+            cellSize = float(spacing * 2**slideWrapper.lvl)
+            if len(names) != 0:
+                #keep the first label of each cell
+                cells = np.floor(pos / cellSize).astype(np.int64)
+                first = np.sort(np.unique(cells, axis = 0, return_index = True)[1])
+                names, pos = names[first], pos[first]
+            index = spatialIndex.spatialIndex(cellSize)
+            index.build(pos[:,0], pos[:,1], np.zeros(len(names)))
+            self._labelCache = (key, names, pos, index)
 
-    def getPatches(self, limitDraw, slideWrapper, blobColor):
+        key, names, pos, index = self._labelCache
+        xlow, ylow = slideWrapper.getGlobalPoint((0,0))
+        xhigh, yhigh = slideWrapper.getGlobalPoint(slideWrapper.size)
+        rows = index.candidates((xlow + xhigh) / 2, (ylow + yhigh) / 2,
+                                max(xhigh - xlow, yhigh - ylow) / 2)
+        rows = np.sort(rows[(pos[rows,0] >= xlow) & (pos[rows,0] <= xhigh) &
+                            (pos[rows,1] >= ylow) & (pos[rows,1] <= yhigh)])
+        return pos[rows,0], pos[rows,1], names[rows]
 
-        todraw = slideWrapper.getBlobsInBounds(self.blobs)
+    def inBounds(self, slideWrapper):
+        '''
+        Finds the blobs in the current view of a slide
+        slideWrapper: the slide with the current view
+        returns an np array of the indices of blobs in the view
+        '''
+        #get bounds of image in global coordinate
+        xlow, ylow = slideWrapper.getGlobalPoint((0,0))
+        xhigh, yhigh = slideWrapper.getGlobalPoint(slideWrapper.size)
+        x = self._column('x')
+        y = self._column('y')
+        return np.nonzero((x > xlow) & (x < xhigh) & (y > ylow) & (y < yhigh))[0]
 
-        if limitDraw and len(todraw) > GUIConstants.DRAW_LIMIT:
+    def getMarkups(self, limitDraw, slideWrapper):
+        '''
+        Gets the markups of the blobs in the current view of a slide, in global coordinates.
+        If limitDraw is set and more than DRAW_LIMIT blobs are in view, blobs are aggregated
+        into grid cells of the level of detail pyramid.  Cells with a single blob draw the blob,
+        cells with several blobs are filled with an opacity set by their number of blobs
+        limitDraw: boolean toggle to limit the number of markups
+        slideWrapper: the slide with the current view
+        returns (xs, ys, rs, cells)
+            xs, ys, rs: np arrays of the centers and radii of the blobs to draw
+            cells: (xs, ys, size, alphas) of the lower corners, side length and opacity
+                of the aggregated cells, None if blobs are not aggregated
+        '''
+        inds = self.inBounds(slideWrapper)
+        cells = None
 
-            todraw = [todraw[i] for i in range(0, len(todraw), 
-                                               len(todraw)//GUIConstants.DRAW_LIMIT)]
+        if limitDraw and len(inds) > GUIConstants.DRAW_LIMIT:
+            xlow, ylow = slideWrapper.getGlobalPoint((0,0))
+            xhigh, yhigh = slideWrapper.getGlobalPoint(slideWrapper.size)
+            inds, counts, cellX, cellY, cellSize = self.getPyramid().query(xlow, ylow, xhigh, yhigh,
+                                                                           GUIConstants.DRAW_LIMIT)
+            dense = counts > 1
+            alphas = np.zeros(0)
+            if np.any(dense):
+                alphas = GUIConstants.DENSITY_ALPHA_MIN + \
+                    (GUIConstants.DENSITY_ALPHA_MAX - GUIConstants.DENSITY_ALPHA_MIN) * \
+                    counts[dense] / counts[dense].max()
+            cells = (cellX[dense], cellY[dense], cellSize, alphas)
+            inds = inds[~dense]
 
-        return list(map(lambda el: plt.Circle((el[0],el[1]), el[2],
-                                             color = blobColor,
-                                             linewidth = 1,
-                                             fill = False), todraw))
\ No newline at end of file
+        return self._column('x')[inds], self._column('y')[inds], self._column('radius')[inds], cells
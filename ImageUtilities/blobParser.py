@@ -0,0 +1,191 @@
+'''
+Fast parsing of text files of blob positions into columns.
+Reads the tab delimited files of blobList.saveBlobs, files of "x_{}y_{}" position names
+and the instrument files written by the coordinate mappers.  Numbers are extracted from
+the whole file at once with numpy and regular expressions instead of splitting every line.
+'''
+import ast
+import re
+
+import numpy as np
+
+from GUICanvases import GUIConstants
+from ImageUtilities import blob
+
+class blobColumns(object):
+    '''
+    Parsed blob positions stored as columns.
+    Iterating gives blob objects, so it can be used wherever a list of blobs is expected,
+    while blobList copies the columns directly.
+    '''
+    def __init__(self, x, y, radius = None, circularity = None, group = None):
+        '''
+        x, y: np arrays of the coordinates of each blob
+        radius: np array of radii, None for the default blob radius
+        circularity: np array of circularity, None for 1
+        group: np array of group numbers, -1 for no group, None for no groups
+        '''
+        self.x = np.asarray(x, dtype = np.float64)
+        n = len(self.x)
+        self.y = np.asarray(y, dtype = np.float64)
+        self.radius = np.full(n, float(GUIConstants.DEFAULT_BLOB_RADIUS)) if radius is None \
+            else np.asarray(radius, dtype = np.float64)
+        self.circularity = np.ones(n) if circularity is None \
+            else np.asarray(circularity, dtype = np.float64)
+        self.group = np.full(n, -1, dtype = np.int64) if group is None \
+            else np.asarray(group, dtype = np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __iter__(self):
+        for x, y, r, c, g in zip(self.x, self.y, self.radius, self.circularity, self.group):
+            yield blob.blob(float(x), float(y), r, c, None if g < 0 else int(g))
+
+def _numbers(lines, columns):
+    '''
+    helper function to read whitespace delimited numbers of lines with the same number of columns
+    returns an (n, columns) np array, or None if any line has a different number of values
+    lines: list of strings
+    columns: number of values on each line
+    '''
+    lines = [l for l in lines if l.strip() != '']
+    values = np.fromstring(''.join(l if l.endswith('\n') else l + '\n' for l in lines),
+                           dtype = np.float64, sep = ' ')
+    if len(values) != columns * len(lines):
+        return None
+    return values.reshape((len(lines), columns))
+
+def _groups(found):
+    '''
+    helper function to convert matched group strings to group numbers
+    returns an np array with -1 for unmatched groups
+    found: np array of strings, '' where the group is absent
+    '''
+    return np.where(found == '', '-1', found).astype(np.int64)
+
+def _match(text, pattern, flags = 0):
+    '''
+    helper function to find every match of a pattern with (group, x, y) capture groups
+    returns a blobColumns of the matches
+    '''
+    found = re.findall(pattern, text, flags)
+    if len(found) == 0:
+        return blobColumns(np.zeros(0), np.zeros(0))
+    found = np.array(found)
+    return blobColumns(found[:,1].astype(np.float64), found[:,2].astype(np.float64),
+                       group = _groups(found[:,0]))
+
+def parseXYNames(lines):
+    '''
+    Parses position names of the form "x_{}y_{}", optionally preceded by "s_{}" with the group
+    lines: list of strings, one position per line
+    returns a blobColumns of the positions
+    '''
+    return _match(''.join(lines), r'(?:s_(-?\d+))?x_(-?[\d.]+)y_(-?[\d.]+)')
+
+def parseDelimited(lines):
+    '''
+    Parses lines of "x y" or "x y group", separated by tabs or spaces.
+    Used by the zaber and oMaldi instrument files
+    lines: list of strings, one position per line
+    returns a blobColumns of the positions
+    '''
+    for columns in (2, 3):
+        values = _numbers(lines, columns)
+        if values is not None:
+            return blobColumns(values[:,0], values[:,1],
+                               group = values[:,2] if columns == 3 else None)
+    #mix of grouped and ungrouped lines
+    x, y, group = [], [], []
+    for l in lines:
+        toks = l.split()
+        if len(toks) < 2:
+            continue
+        x.append(float(toks[0]))
+        y.append(float(toks[1]))
+        group.append(int(toks[2]) if len(toks) == 3 else -1)
+    return blobColumns(x, y, group = group)
+
+def parseBlobText(lines):
+    '''
+    Parses a file written by blobList.saveBlobs.
+    The header block of blob finding parameters, ROI and filters is read line by line,
+    the blob lines after it are read at once.  Files of "x_{}y_{}" lines are parsed with
+    parseXYNames
+    lines: list of strings of the file
+    returns (parameters, ROI, ROIs, filters, columns)
+        parameters: list of split parameter lines for blobFinder.setParameterFromSplitString
+        ROI: list of ROI points, None if not in the file
+        ROIs: dict of name -> list of points of named ROIs, None if not in the file
+        filters: list of filter descriptions, None if not in the file
+        columns: blobColumns of the blobs
+    '''
+    parameters, ROI, ROIs, filters = [], None, None, None
+    start = len(lines)
+    for i, l in enumerate(lines):
+        toks = l.split('\t')
+        if len(toks) == 1 and l[0:1] == 'x':
+            return [], None, None, None, parseXYNames(lines)
+        if len(toks) == 2:
+            parameters.append(toks)
+        elif toks[0] != 'x' and len(toks) > 2:
+            #first blob line
+            start = i
+            break
+        else:
+            toks = l.split('->')
+            if len(toks) > 1:
+                filters = toks[1:-1]
+            elif l[0:5] == 'ROIs:':
+                ROIs = ast.literal_eval(l[6:])
+            elif l[0:3] == 'ROI':
+                ROI = ast.literal_eval(l[5:])
+
+    data = lines[start:]
+    for columns in (4, 3):
+        values = _numbers(data, columns)
+        if values is not None:
+            return parameters, ROI, ROIs, filters, \
+                blobColumns(values[:,0], values[:,1], values[:,2],
+                            values[:,3] if columns == 4 else None)
+    #irregular lines, fall back to parsing each line
+    blobs = [blob.blob.blobFromSplitString(l.split('\t')) for l in data if len(l.split('\t')) > 2]
+    return parameters, ROI, ROIs, filters, \
+        blobColumns([b.X for b in blobs], [b.Y for b in blobs],
+                    [b.radius for b in blobs], [b.circularity for b in blobs])
+
+def parseXEO(lines):
+    '''
+    Parses the plate spots of a bruker xeo geometry file, named "x_{}y_{}" or "s_{}x_{}y_{}"
+    lines: list of strings of the file
+    returns a blobColumns of the positions
+    '''
+    #ignore header and footer
+    return _match(''.join(lines[13:-12]),
+                  r'PositionName="(?:s_(-?\d+))?x_(-?\d+)y_(-?\d+)"')
+
+def parseSRS(lines):
+    '''
+    Parses an srs instrument file, lines of "x_{}y_{}\\tX\\tY" with an optional group column
+    lines: list of strings of the file
+    returns a blobColumns of the positions
+    '''
+    #toss focus plane
+    text = ''.join(lines[2:])
+    found = re.findall(r'^x_(-?\d+)y_(-?\d+)\t[^\t\n]*\t[^\t\n]*(?:\t(-?\d+))?', text, re.MULTILINE)
+    if len(found) == 0:
+        return blobColumns(np.zeros(0), np.zeros(0))
+    found = np.array(found)
+    return blobColumns(found[:,0].astype(np.float64), found[:,1].astype(np.float64),
+                       group = _groups(found[:,2]))
+
+def parseFlexImaging(lines):
+    '''
+    Parses a flexImaging target file, lines of "X Y x{}_y{} region" where the spot name
+    may be preceded by a group
+    lines: list of strings of the file
+    returns a blobColumns of the positions
+    '''
+    text = ''.join(lines[1:])
+    return _match(text, r'^\S+ \S+ (?:\w(-?\d+)_)?\w(-?\d+)_\w(-?\d+)', re.MULTILINE)
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import numpy as np
+import scipy
+
+from ImageUtilities.blobFinder import blobFinder
+
+class blobPreview(object):
+    '''
+    Fast, approximate blob finding on the current view of a slideWrapper.
+    Works on the image at the current zoom level instead of max zoom, with
+    size limits scaled by the zoom factor.  The downsampled images and label
+    images are cached per viewport, so redraws and repeated queries of the
+    same view do not re-read or re-label the slide.
+    '''
+    def __init__(self, slide, cacheSize = 8):
+        '''
+        Create a new preview engine for the slide
+        slide: the slideWrapper to preview
+        cacheSize: number of viewports to keep images and labels of
+        '''
+        self.slide = slide
+        self.cacheSize = cacheSize
+        self.images = OrderedDict()
+        self.labels = OrderedDict()
+
+    def clear(self):
+        '''
+        Remove all cached images and labels
+        '''
+        self.images.clear()
+        self.labels.clear()
+
+    def scale(self):
+        '''
+        returns the number of max zoom pixels per pixel of the current view
+        '''
+        return 2**self.slide.lvl
+
+    def _clampIndex(self, imageIndex):
+        '''
+        helper to limit an image index to the channels of the slide, as getMaxZoomImage
+        '''
+        if imageIndex is None:
+            return None
+        return min(len(self.slide.slides)-1, imageIndex)
+
+    def viewKey(self, imageIndex = None):
+        '''
+        Generates a hashable description of the current view of the slide
+        imageIndex: the single image channel to read, None for the displayed composite
+        '''
+        imageIndex = self._clampIndex(imageIndex)
+        key = (tuple(self.slide.pos), tuple(self.slide.size), self.slide.lvl)
+        if imageIndex is None:
+            return key + (tuple(self.slide.displaySlides), self.slide.brightInd)
+        return key + (imageIndex,)
+
+    @staticmethod
+    def _cache(cache, key, value, limit):
+        '''
+        helper to add a value to a cache, evicting the least recently used
+        '''
+        cache[key] = value
+        while len(cache) > limit:
+            cache.popitem(last = False)
+
+    def getImage(self, imageIndex = None):
+        '''
+        Gets the image of the current view, from the cache if possible
+        imageIndex: the single image channel to read, None for the displayed composite
+        returns a PIL image of the current view
+        '''
+        imageIndex = self._clampIndex(imageIndex)
+        key = self.viewKey(imageIndex)
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key]
+        if imageIndex is None:
+            img = self.slide.getImg()
+        else:
+            img = self.slide.getChannelImg(imageIndex)
+        blobPreview._cache(self.images, key, img, self.cacheSize)
+        return img
+
+    def getLabels(self, channel, threshold, imageIndex = None):
+        '''
+        Gets the thresholded label image of the current view, from the cache if possible
+        channel: r,g,b channel to threshold
+        threshold: min intensity cutoff
+        imageIndex: the single image channel to read, None for the displayed composite
+        returns the label image and number of labels from ndimage.label
+        '''
+        key = self.viewKey(imageIndex) + (channel, threshold)
+        if key in self.labels:
+            self.labels.move_to_end(key)
+            return self.labels[key]
+        result = blobFinder._blbThresh(self.getImage(imageIndex), channel, threshold)
+        blobPreview._cache(self.labels, key, result, self.cacheSize)
+        return result
+
+    def findBlobs(self, finder):
+        '''
+        Performs blob finding on the current view with the parameters of a blobFinder
+        Sizes are compared in max zoom pixels, circularity is measured at the current zoom
+        finder: the blobFinder with parameters to use
+        returns a list of blobs in the local coordinates of the current view
+        '''
+        if finder.subtractBackground:
+            #corrected labels depend on the background map, so they are not cached
+            band = np.asarray(self.getImage(finder.imageIndex).getchannel(finder.colorChannel))
+            scale = self.scale()
+            band = finder.correctBackground(band, 
+                                            self.slide.pos[0] - self.slide.size[0] * scale / 2,
+                                            self.slide.pos[1] - self.slide.size[1] * scale / 2,
+                                            finder.colorChannel, scale)
+            lbl, num = blobFinder._blbLabel(band, finder.threshold)
+        else:
+            lbl, num = self.getLabels(finder.colorChannel, finder.threshold, finder.imageIndex)
+        area = self.scale()**2
+        sizes = (finder.minSize / area,
+                 None if finder.maxSize is None else finder.maxSize / area)
+        return blobFinder._blbMeasure(lbl, num, sizes,
+                                      (finder.minCircularity, finder.maxCircularity))
+
+    def blobCharacteristics(self, pnt, channel, threshold):
+        '''
+        Gets the area and circularity for a blob of the displayed image containing the point
+        Returns 0,0 if no blob containing point
+        pnt: (x,y) of the requested point in the current view
+        channel: r,g,b channel to threshold
+        threshold: min intensity cutoff
+        '''
+        lbl, num = self.getLabels(channel, threshold)
+        x, y = int(pnt[0]), int(pnt[1])
+        if y < 0 or x < 0 or y >= lbl.shape[0] or x >= lbl.shape[1] or lbl[y, x] == 0:
+            return 0, 0
+        mask = lbl == lbl[y, x]
+        #only consider the bounding box of the blob, with a blank border
+        s = scipy.ndimage.find_objects(mask.astype(np.int8))[0]
+        area, circ = blobFinder._areaCircularity(np.pad(mask[s], 1, 'constant'))
+        #scale area by zoom level
+        #these get progressively less accurate with higher zoom level
+        return area * self.scale()**2, circ
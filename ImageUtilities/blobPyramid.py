@@ -0,0 +1,122 @@
+import numpy as np
+
+class blobPyramid(object):
+    '''
+    Multi level grid aggregation of blob centers for drawing large blob lists.
+    The finest level bins blobs into cells about one blob wide, each coarser level
+    merges 2x2 cells of the level below.  Every occupied cell stores the number
+    of blobs it holds and a representative blob, the one closest to the center
+    of mass of the cell.  A viewport query picks the finest level with a bounded
+    number of occupied cells in view, giving a spatially uniform set of glyphs
+    where every blob is accounted for in the count of its cell.
+    Cells are counted from the lowest blob coordinates, so cell indices are never
+    negative and halving them merges every blob into one cell at the top level.
+    '''
+    #coarsest level to build, limits the pyramid for widely spread blobs
+    maxLevels = 32
+
+    def __init__(self, xs, ys, radii):
+        '''
+        Builds the pyramid of a set of blobs
+        xs, ys: np arrays of the blob centers, in row order
+        radii: np array of the blob radii
+        '''
+        self.levels = []
+        self.origin = (0.0, 0.0)
+        n = len(xs)
+        if n == 0:
+            return
+        xs = np.asarray(xs, dtype = np.float64)
+        ys = np.asarray(ys, dtype = np.float64)
+        #about one blob per cell for evenly spaced blobs, but no smaller than a blob
+        area = (np.ptp(xs) + 1) * (np.ptp(ys) + 1)
+        cellSize = max(2 * float(np.max(radii)), np.sqrt(area / n), 1.0)
+
+        #the finest level is reduced from the blobs, the rest from the level below
+        self.origin = (float(xs.min()), float(ys.min()))
+        cx = np.floor((xs - self.origin[0]) / cellSize).astype(np.int64)
+        cy = np.floor((ys - self.origin[1]) / cellSize).astype(np.int64)
+        counts = np.ones(n, dtype = np.int64)
+        sumX, sumY = xs, ys
+        repX, repY = xs, ys
+        rows = np.arange(n)
+        while len(self.levels) < blobPyramid.maxLevels:
+            level = blobPyramid._reduce(cx, cy, counts, sumX, sumY, repX, repY, rows)
+            level['cellSize'] = cellSize
+            self.levels.append(level)
+            if len(level['counts']) == 1:
+                break
+            cx, cy = level['cx'] >> 1, level['cy'] >> 1
+            counts, sumX, sumY = level['counts'], level['sumX'], level['sumY']
+            repX, repY, rows = level['x'], level['y'], level['rows']
+            cellSize *= 2
+
+    @staticmethod
+    def _reduce(cx, cy, counts, sumX, sumY, repX, repY, rows):
+        '''
+        helper function to merge items sharing a cell
+        cx, cy: np arrays of the cell of each item
+        counts: np array of the number of blobs in each item
+        sumX, sumY: np arrays of the summed coordinates of the blobs in each item
+        repX, repY, rows: np arrays of the position and row of the representative of each item
+        returns a dict of np arrays of the occupied cells, sorted by cx then cy
+        '''
+        #sort by a single key combining cx and cy
+        width = int(cy.max() - cy.min()) + 1
+        order = np.argsort((cx - cx.min()) * width + (cy - cy.min()))
+        cx, cy = cx[order], cy[order]
+        starts = np.concatenate(([0], np.nonzero((cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1]))[0] + 1))
+        cellCounts = np.add.reduceat(counts[order], starts)
+        cellX = np.add.reduceat(sumX[order], starts)
+        cellY = np.add.reduceat(sumY[order], starts)
+
+        #representative is the first item closest to the center of mass of the cell
+        cell = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(order))))
+        dists = np.hypot(repX[order] - cellX[cell] / cellCounts[cell],
+                         repY[order] - cellY[cell] / cellCounts[cell])
+        closest = np.nonzero(dists == np.minimum.reduceat(dists, starts)[cell])[0]
+        closest = closest[np.concatenate(([True], cell[closest][1:] != cell[closest][:-1]))]
+        closest = order[closest]
+        return {'cx' : cx[starts], 'cy' : cy[starts], 'counts' : cellCounts,
+                'sumX' : cellX, 'sumY' : cellY,
+                'x' : repX[closest], 'y' : repY[closest], 'rows' : rows[closest]}
+
+    def _inView(self, level, xlow, ylow, xhigh, yhigh):
+        '''
+        helper function to find the occupied cells of a level overlapping a box
+        returns an np array of indices into the cells of the level
+        '''
+        cellSize = level['cellSize']
+        x0, y0 = self.origin
+        low = np.searchsorted(level['cx'], int(np.floor((xlow - x0) / cellSize)))
+        high = np.searchsorted(level['cx'], int(np.floor((xhigh - x0) / cellSize)), 'right')
+        cy = level['cy'][low:high]
+        inside = (cy >= np.floor((ylow - y0) / cellSize)) & (cy <= np.floor((yhigh - y0) / cellSize))
+        return np.nonzero(inside)[0] + low
+
+    def query(self, xlow, ylow, xhigh, yhigh, limit):
+        '''
+        Finds the cells to draw for a viewport
+        xlow, ylow, xhigh, yhigh: bounds of the viewport in global coordinates
+        limit: the largest number of cells to return
+        returns (rows, counts, xs, ys, cellSize)
+            rows: np array of the representative blob row of each cell
+            counts: np array of the number of blobs in each cell
+            xs, ys: np arrays of the lower corner of each cell in global coordinates
+            cellSize: side length of the cells of the chosen level
+        '''
+        best = None
+        #coarse to fine, stop when the next level has too many cells in view
+        for level in reversed(self.levels):
+            cells = self._inView(level, xlow, ylow, xhigh, yhigh)
+            if best is not None and len(cells) > limit:
+                break
+            best = (level, cells)
+        if best is None:
+            empty = np.zeros(0, dtype = np.int64)
+            return empty, empty, np.zeros(0), np.zeros(0), 1.0
+        level, cells = best
+        cellSize = level['cellSize']
+        return level['rows'][cells], level['counts'][cells], \
+            self.origin[0] + level['cx'][cells] * cellSize, \
+            self.origin[1] + level['cy'][cells] * cellSize, cellSize
@@ -0,0 +1,465 @@
+'''
+Distributed global blob finding through a work queue on a shared directory.
+Slides are split into subregion work units which any number of worker processes,
+on any host mounting the queue directory, claim with lease files, blob find and commit.
+A final reduce step writes one blobList file per slide, in the binary format when
+features are measured so they are kept.  No services are required,
+all coordination uses atomic file creation and renames.
+
+Queue layout:
+    jobs/       one json file per slide with the slide, blob finding parameters and output
+    pending/    one json file per work unit still to be processed
+    leases/     lease files of claimed work units, with the host, process and claim time
+    done/       one json file per committed work unit with the blobs found
+    failed/     one json file per work unit which raised an error, with the unit and error
+
+Usage:
+    python -m ImageUtilities.blobQueue submit QUEUE slide1.tif slide2.ndpi [--params saved.txt]
+    python -m ImageUtilities.blobQueue work QUEUE
+    python -m ImageUtilities.blobQueue reduce QUEUE
+    python -m ImageUtilities.blobQueue status QUEUE
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import socket
+import time
+import traceback
+
+from ImageUtilities import blob
+from ImageUtilities import blobFinder
+from ImageUtilities import blobList
+
+#seconds without a heartbeat before a lease is considered abandoned
+LEASE_TIMEOUT = 600
+
+DIRECTORIES = ['jobs', 'pending', 'leases', 'done', 'failed']
+
+def _path(queue, directory, name = None):
+    '''
+    helper function to build a path inside the queue
+    '''
+    if name is None:
+        return os.path.join(queue, directory)
+    return os.path.join(queue, directory, name)
+
+def _writeJson(filename, data):
+    '''
+    helper function to atomically write a json file
+    the data is written to a temporary file which is renamed, so readers
+    never see a partially written file
+    '''
+    temp = '{}.{}.{}.tmp'.format(filename, socket.gethostname(), os.getpid())
+    with open(temp, 'w') as output:
+        json.dump(data, output)
+    os.replace(temp, filename)
+
+def _readJson(filename):
+    '''
+    helper function to read a json file
+    returns None if the file has been removed by another process
+    '''
+    try:
+        with open(filename, 'r') as reader:
+            return json.load(reader)
+    except (IOError, OSError):
+        return None
+
+def _listJson(directory):
+    '''
+    helper function to list the names of json files in a directory without extension
+    '''
+    return [f[:-5] for f in os.listdir(directory) if f.endswith('.json')]
+
+def initQueue(queue):
+    '''
+    Creates the queue directories if needed
+    queue: the shared queue directory
+    '''
+    for d in DIRECTORIES:
+        os.makedirs(_path(queue, d), exist_ok = True)
+
+def jobName(slideName):
+    '''
+    Generates a unique, readable job name for a slide
+    slideName: the slide filename
+    '''
+    slideName = os.path.abspath(slideName)
+    base = os.path.splitext(os.path.basename(slideName))[0]
+    return '{}_{}'.format(base, hashlib.sha1(slideName.encode('utf-8')).hexdigest()[:10])
+
+def submit(queue, slideNames, template = None, outputDir = None, budget = None):
+    '''
+    Splits each slide into work units and adds them to the queue
+    Slides already in the queue are skipped
+    queue: the shared queue directory
+    slideNames: list of slide filenames, must be readable by every worker at the same path
+    template: a blob file saved from microMS, its blob finding parameters and ROI are
+        used for every slide.  None uses the default parameters and the whole slide
+    outputDir: directory to write the blob files to, None saves next to each slide.
+        Blob files are binary if features are measured, as the text format drops them
+    budget: memory available to each worker in MB, sets the subregion size
+    returns the number of work units added
+    '''
+    #openslide is only needed to read slides, not to check or reduce the queue
+    from ImageUtilities import slideWrapper
+    initQueue(queue)
+    total = 0
+    for slideName in slideNames:
+        name = jobName(slideName)
+        if os.path.exists(_path(queue, 'jobs', name + '.json')):
+            print('{} is already queued'.format(slideName))
+            continue
+
+        blbs = blobList.blobList(slideWrapper.SlideWrapper(slideName))
+        if template is not None:
+            blbs.loadBlobs(template)
+            blbs.blobs = []
+        finder = blbs.blobFinder
+        if budget is not None:
+            finder.memoryBudget = budget
+
+        if finder.exactComponents:
+            #the slide is labelled in strips by a single worker
+            subSize = None
+            centers = [None]
+        else:
+            subSize = finder.planTiles(workers = 1)['subSize']
+            centers = finder._tileCenters(subSize, blbs.ROI if len(blbs.ROI) > 2 else None)
+
+        extension = blobList.blobList.binaryExtension if finder.measureFeatures else '.txt'
+        if outputDir is None:
+            output = os.path.splitext(os.path.abspath(slideName))[0] + '_blobs' + extension
+        else:
+            output = os.path.join(os.path.abspath(outputDir),
+                                  os.path.splitext(os.path.basename(slideName))[0] + '_blobs' + extension)
+
+        units = []
+        for i, cent in enumerate(centers):
+            unit = '{}_{:06d}'.format(name, i)
+            units.append(unit)
+            _writeJson(_path(queue, 'pending', unit + '.json'), {
+                'job' : name,
+                'center' : None if cent is None else [int(cent[0]), int(cent[1])],
+                'subSize' : subSize})
+        #the job file is written last, reduce only sees jobs with every unit queued
+        _writeJson(_path(queue, 'jobs', name + '.json'), {
+            'slide' : os.path.abspath(slideName),
+            'parameters' : finder.getParameters(),
+            'measureFeatures' : finder.measureFeatures,
+            'exactComponents' : finder.exactComponents,
+            'subtractBackground' : finder.subtractBackground,
+            'backgroundSize' : finder.backgroundSize,
+            'memoryBudget' : finder.memoryBudget,
+            'ROI' : blbs.ROI,
+            'output' : output,
+            'units' : units})
+        total += len(units)
+        print('queued {} with {} work units'.format(slideName, len(units)))
+    return total
+
+def _leaseInfo():
+    '''
+    helper function to generate the contents of a lease file
+    '''
+    return '{}\t{}\t{}\n'.format(socket.gethostname(), os.getpid(), time.time())
+
+def claim(queue, unit, timeout = LEASE_TIMEOUT):
+    '''
+    Tries to claim a work unit by creating its lease file
+    An existing lease older than timeout is taken over.  The stale lease is renamed
+    first so only one of several competing workers can remove it.  Another worker may
+    take over the lease between the age check and the rename, so the age of the renamed
+    lease is checked again and a fresh lease is put back.
+    queue: the shared queue directory
+    unit: name of the work unit
+    timeout: seconds since the last heartbeat for a lease to be stale
+    returns True if the unit was claimed by this process
+    '''
+    lease = _path(queue, 'leases', unit + '.lease')
+    try:
+        fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        stale = '{}.{}.{}.stale'.format(lease, socket.gethostname(), os.getpid())
+        try:
+            if time.time() - os.path.getmtime(lease) < timeout:
+                return False
+            os.rename(lease, stale)
+        except OSError:
+            #another worker took over or committed the unit first
+            return False
+        try:
+            fresh = time.time() - os.path.getmtime(stale) < timeout
+        except OSError:
+            fresh = False
+        if fresh:
+            #renamed the lease of a worker which just took over, restore it unless
+            #a new lease was already created
+            try:
+                os.link(stale, lease)
+            except OSError:
+                pass
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+            return False
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+        try:
+            fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+    os.write(fd, _leaseInfo().encode('utf-8'))
+    os.close(fd)
+    return True
+
+def heartbeat(queue, unit):
+    '''
+    Refreshes the lease of a claimed work unit so it is not considered stale
+    queue: the shared queue directory
+    unit: name of the work unit
+    '''
+    try:
+        os.utime(_path(queue, 'leases', unit + '.lease'))
+    except OSError:
+        pass
+
+def commit(queue, unit, blobs):
+    '''
+    Records the blobs found for a work unit and releases its lease
+    queue: the shared queue directory
+    unit: name of the work unit
+    blobs: list of blobs found
+    '''
+    _writeJson(_path(queue, 'done', unit + '.json'),
+               [[b.X, b.Y, b.radius, b.circularity, b.features] for b in blobs])
+    release(queue, unit, True)
+
+def release(queue, unit, finished = False):
+    '''
+    Removes the lease of a work unit so it can be claimed again
+    queue: the shared queue directory
+    unit: name of the work unit
+    finished: also remove the pending file, the unit will not be claimed again
+    '''
+    files = [('leases', '.lease')]
+    if finished:
+        files.insert(0, ('pending', '.json'))
+    for d, ext in files:
+        try:
+            os.remove(_path(queue, d, unit + ext))
+        except OSError:
+            pass
+
+def fail(queue, unit, error):
+    '''
+    Moves a work unit which raised an error out of the pending units
+    The failed file holds the pending unit with the host and error added,
+    moving it back to the pending directory retries the unit
+    queue: the shared queue directory
+    unit: name of the work unit
+    error: description of the error
+    '''
+    failed = _readJson(_path(queue, 'pending', unit + '.json'))
+    if failed is None:
+        release(queue, unit)
+        return
+    failed['host'] = socket.gethostname()
+    failed['error'] = error
+    _writeJson(_path(queue, 'failed', unit + '.json'), failed)
+    release(queue, unit, True)
+
+def _makeFinder(name, job, finders):
+    '''
+    helper function to build the blobFinder of a job, reusing the open slide
+    and background map of the previous unit of the same job
+    name: the job name
+    job: the job dict
+    finders: dict of job name -> blobFinder, updated with new jobs
+    '''
+    from ImageUtilities import slideWrapper
+    if name in finders:
+        return finders[name]
+    #keep only the most recent slide open
+    finders.clear()
+    finder = blobFinder.blobFinder(slideWrapper.SlideWrapper(job['slide']))
+    for key, val in job['parameters'].items():
+        finder.setParameterFromSplitString([key, '{}\n'.format(val)])
+    finder.measureFeatures = job['measureFeatures']
+    finder.exactComponents = job['exactComponents']
+    finder.memoryBudget = job['memoryBudget']
+    finder.subtractBackground = job.get('subtractBackground', False)
+    finder.backgroundSize = job.get('backgroundSize', finder.backgroundSize)
+    finders[name] = finder
+    return finder
+
+def process(queue, unit, finders):
+    '''
+    Performs blob finding on a claimed work unit and commits the result
+    queue: the shared queue directory
+    unit: name of the work unit
+    finders: dict of job name -> blobFinder reused between units
+    returns the number of blobs found, None if the unit was already finished
+    '''
+    work = _readJson(_path(queue, 'pending', unit + '.json'))
+    if work is None:
+        release(queue, unit)
+        return None
+    #committed by a worker that stopped before removing the pending file
+    if os.path.exists(_path(queue, 'done', unit + '.json')):
+        release(queue, unit, True)
+        return None
+    job = _readJson(_path(queue, 'jobs', work['job'] + '.json'))
+    if job is None:
+        release(queue, unit)
+        return None
+    finder = _makeFinder(work['job'], job, finders)
+    if work['center'] is None:
+        roi = job['ROI'] if len(job['ROI']) > 2 else None
+        #refresh the lease after each strip of the long running unit
+        blbs = finder.blobSlideExact(roi, progress = lambda event: heartbeat(queue, unit))
+    else:
+        blbs, bytesRead = finder._blobTile(work['center'], work['subSize'])
+    commit(queue, unit, blbs)
+    return len(blbs)
+
+def work(queue, timeout = LEASE_TIMEOUT, wait = False, poll = 30):
+    '''
+    Claims and processes work units until the queue is empty
+    Units are tried in random order to reduce contention between workers.
+    Units raising an error are moved to the failed directory and skipped
+    queue: the shared queue directory
+    timeout: seconds since the last heartbeat for a lease to be stale
+    wait: keep polling for new or abandoned units instead of returning when none are free
+    poll: seconds between checks of the queue when waiting
+    returns the number of units processed by this worker
+    '''
+    initQueue(queue)
+    finders = dict()
+    processed = 0
+    while True:
+        units = _listJson(_path(queue, 'pending'))
+        random.shuffle(units)
+        claimed = False
+        for unit in units:
+            if not claim(queue, unit, timeout):
+                continue
+            claimed = True
+            start = time.time()
+            try:
+                num = process(queue, unit, finders)
+            except Exception:
+                #a unit which fails here would fail for every worker, record it and move on
+                error = traceback.format_exc()
+                print('{} failed:\n{}'.format(unit, error))
+                fail(queue, unit, error)
+                break
+            if num is not None:
+                processed += 1
+                print('{}: {} blobs in {:.1f} seconds'.format(unit, num, time.time() - start))
+            #rescan for units released by other workers
+            break
+        #nothing free, remaining units are leased by live workers
+        if not claimed:
+            if not wait:
+                break
+            time.sleep(poll)
+    return processed
+
+def status(queue):
+    '''
+    Summarizes the progress of each job in the queue
+    queue: the shared queue directory
+    returns a dict of job name -> (units done, total units)
+    '''
+    result = dict()
+    done = set(_listJson(_path(queue, 'done')))
+    for name in _listJson(_path(queue, 'jobs')):
+        job = _readJson(_path(queue, 'jobs', name + '.json'))
+        if job is None:
+            continue
+        result[name] = (sum(1 for u in job['units'] if u in done), len(job['units']))
+    return result
+
+def reduce(queue):
+    '''
+    Writes the blob file of each finished job in the queue
+    Blobs are filtered to the job ROI as in blobList.blobSlide
+    queue: the shared queue directory
+    returns a list of the blob files written
+    '''
+    written = []
+    failed = set(_listJson(_path(queue, 'failed')))
+    for name, (done, total) in sorted(status(queue).items()):
+        if done != total:
+            job = _readJson(_path(queue, 'jobs', name + '.json'))
+            numFailed = 0 if job is None else sum(1 for u in job['units'] if u in failed)
+            print('{}: {} of {} work units done, {} failed'.format(name, done, total, numFailed))
+            continue
+        job = _readJson(_path(queue, 'jobs', name + '.json'))
+        blbs = blobList.blobList()
+        for key, val in job['parameters'].items():
+            blbs.blobFinder.setParameterFromSplitString([key, '{}\n'.format(val)])
+        blbs.ROI = [tuple(p) for p in job['ROI']]
+        found = []
+        for unit in job['units']:
+            for x, y, r, c, features in _readJson(_path(queue, 'done', unit + '.json')):
+                found.append(blob.blob(x, y, r, c, features = features))
+        blbs.blobs = found
+        if len(blbs.ROI) > 2 and blbs.length() != 0:
+            blbs = blbs.roiFilter()
+        blbs.generateGroupLabels()
+        blbs.saveBlobs(job['output'])
+        written.append(job['output'])
+        print('{}: wrote {} blobs to {}'.format(name, blbs.length(), job['output']))
+    return written
+
+def main(args = None):
+    '''
+    command line interface to the queue
+    '''
+    parser = argparse.ArgumentParser(description = 'Distributed global blob finding')
+    commands = parser.add_subparsers(dest = 'command')
+
+    sub = commands.add_parser('submit', help = 'add slides to the queue')
+    sub.add_argument('queue')
+    sub.add_argument('slides', nargs = '+')
+    sub.add_argument('--params', default = None,
+                     help = 'saved blob file with the blob finding parameters and ROI')
+    sub.add_argument('--output', default = None, help = 'directory for the blob files')
+    sub.add_argument('--budget', type = int, default = None,
+                     help = 'memory available to each worker in MB')
+
+    wrk = commands.add_parser('work', help = 'process work units')
+    wrk.add_argument('queue')
+    wrk.add_argument('--timeout', type = float, default = LEASE_TIMEOUT,
+                     help = 'seconds before an abandoned lease is taken over')
+    wrk.add_argument('--wait', action = 'store_true', help = 'keep waiting for new work')
+
+    red = commands.add_parser('reduce', help = 'write blob files of finished slides')
+    red.add_argument('queue')
+
+    sts = commands.add_parser('status', help = 'show the progress of each slide')
+    sts.add_argument('queue')
+
+    args = parser.parse_args(args)
+    if args.command == 'submit':
+        submit(args.queue, args.slides, args.params, args.output, args.budget)
+    elif args.command == 'work':
+        work(args.queue, args.timeout, args.wait)
+    elif args.command == 'reduce':
+        reduce(args.queue)
+    elif args.command == 'status':
+        for name, (done, total) in sorted(status(args.queue).items()):
+            print('{}\t{} of {} work units done'.format(name, done, total))
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+from collections import OrderedDict
+import heapq
+
+import numpy as np
+from matplotlib.path import Path
+
+def boundingBox(polygon):
+    '''
+    Gets the bounding box of a polygon
+    polygon: list of (x,y) points
+    returns (xmin, ymin, xmax, ymax)
+    '''
+    points = np.asarray(polygon, dtype = np.float64)
+    return (points[:,0].min(), points[:,1].min(), points[:,0].max(), points[:,1].max())
+
+def containsPoints(polygon, xs, ys, candidates = None):
+    '''
+    Tests which points fall within a polygon.  Points outside the bounding box
+    are rejected with column comparisons, only the rest are tested against the path
+    polygon: list of (x,y) points, at least 3
+    xs, ys: np arrays of the point coordinates
+    candidates: np array of the indices of the points to test, None for all points
+    returns a boolean np array over all points, False for points not in candidates
+    '''
+    result = np.zeros(len(xs), dtype = bool)
+    if candidates is None:
+        candidates = np.arange(len(xs))
+    xmin, ymin, xmax, ymax = boundingBox(polygon)
+    cx, cy = xs[candidates], ys[candidates]
+    candidates = candidates[(cx >= xmin) & (cx <= xmax) & (cy >= ymin) & (cy <= ymax)]
+    if len(candidates) != 0:
+        result[candidates] = Path(polygon).contains_points(
+            np.column_stack((xs[candidates], ys[candidates])))
+    return result
+
+class roiSet(object):
+    '''
+    A collection of named polygon ROIs.
+    Blobs can be selected by the union, intersection or difference of several ROIs,
+    each polygon only tests the points which can still change the result
+    '''
+    #ways to combine several ROIs
+    combinations = ['union', 'intersection', 'difference']
+
+    def __init__(self, polygons = None):
+        '''
+        Create a new set of ROIs
+        polygons: dict of name -> list of (x,y) points, None for an empty set
+        '''
+        self.polygons = OrderedDict()
+        if polygons is not None:
+            for name, polygon in polygons.items():
+                self.add(name, polygon)
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def add(self, name, polygon):
+        '''
+        Adds or replaces a named ROI
+        name: the name of the ROI
+        polygon: list of (x,y) points, at least 3
+        '''
+        if len(polygon) < 3:
+            raise ValueError('ROI {} needs at least 3 points'.format(name))
+        self.polygons[name] = [(float(p[0]), float(p[1])) for p in polygon]
+
+    def remove(self, name):
+        '''
+        Removes a named ROI
+        name: the name of the ROI
+        '''
+        del self.polygons[name]
+
+    def names(self):
+        '''
+        returns a list of the ROI names, in the order they were added
+        '''
+        return list(self.polygons.keys())
+
+    def copy(self):
+        '''
+        returns a new roiSet with the same polygons
+        '''
+        return roiSet(self.polygons)
+
+    def toDict(self):
+        '''
+        returns a dict of name -> list of (x,y) points, suitable for saving
+        '''
+        return dict((name, list(polygon)) for name, polygon in self.polygons.items())
+
+    def contains(self, xs, ys, names = None, combine = 'union'):
+        '''
+        Tests which points are selected by a combination of ROIs
+        xs, ys: np arrays of the point coordinates
+        names: list of ROI names to combine, None for every ROI
+        combine: 'union' for points in any ROI, 'intersection' for points in every ROI,
+            'difference' for points in the first ROI and none of the others
+        returns a boolean np array
+        '''
+        if names is None:
+            names = self.names()
+        if combine not in roiSet.combinations:
+            raise ValueError('Unknown ROI combination {}'.format(combine))
+        if len(names) == 0:
+            return np.zeros(len(xs), dtype = bool)
+        polygons = [self.polygons[name] for name in names]
+
+        result = containsPoints(polygons[0], xs, ys)
+        for polygon in polygons[1:]:
+            if combine == 'union':
+                #only points not yet selected can be added
+                result |= containsPoints(polygon, xs, ys, np.where(~result)[0])
+            elif combine == 'intersection':
+                #only selected points can remain
+                result = containsPoints(polygon, xs, ys, np.where(result)[0])
+            else:
+                selected = np.where(result)[0]
+                result[selected] = ~containsPoints(polygon, xs, ys, selected)[selected]
+        return result
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    '''
+    helper function to get the side of line ab that point c falls on
+    returns the signed area, positive for counterclockwise, 0 for collinear
+    '''
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+def _onSegment(ax, ay, bx, by, cx, cy):
+    '''
+    helper function to test if a point collinear with segment ab lies within it
+    '''
+    return (np.minimum(ax, bx) <= cx) & (cx <= np.maximum(ax, bx)) & \
+        (np.minimum(ay, by) <= cy) & (cy <= np.maximum(ay, by))
+
+def segmentsIntersect(a, b, cx, cy, dx, dy):
+    '''
+    Tests if a segment crosses or touches each of several other segments
+    a, b: (x,y) end points of the segment
+    cx, cy, dx, dy: np arrays of the end points of the other segments
+    returns a boolean np array
+    '''
+    ax, ay = a
+    bx, by = b
+    d1 = _orientation(cx, cy, dx, dy, ax, ay)
+    d2 = _orientation(cx, cy, dx, dy, bx, by)
+    d3 = _orientation(ax, ay, bx, by, cx, cy)
+    d4 = _orientation(ax, ay, bx, by, dx, dy)
+    result = (d1 * d2 < 0) & (d3 * d4 < 0)
+    #end points touching the other segment
+    result |= (d1 == 0) & _onSegment(cx, cy, dx, dy, ax, ay)
+    result |= (d2 == 0) & _onSegment(cx, cy, dx, dy, bx, by)
+    result |= (d3 == 0) & _onSegment(ax, ay, bx, by, cx, cy)
+    result |= (d4 == 0) & _onSegment(ax, ay, bx, by, dx, dy)
+    return result
+
+class roiGeometry(object):
+    '''
+    A closed polygon with a uniform grid hash of its edges for interactive editing.
+    Edge i joins vertex i to vertex i+1, the last edge closes the polygon.
+    Each edge is stored in every grid cell its bounding box covers, so finding nearby
+    vertices, the best edge to insert a point into and edges crossing a new segment
+    only test the edges of a few cells instead of the whole polygon.
+    The geometry is not changed by edits, build a new one for the edited polygon.
+    '''
+    def __init__(self, polygon, cellSize = None):
+        '''
+        Create the geometry of a polygon
+        polygon: list of (x,y) points
+        cellSize: length of a side of each grid cell, None to use the mean edge length
+        '''
+        self.points = np.asarray(polygon, dtype = np.float64).reshape((-1, 2))
+        n = len(self.points)
+        self.starts = self.points
+        self.ends = np.roll(self.points, -1, axis = 0)
+        lengths = np.hypot(*(self.ends - self.starts).T)
+        if cellSize is None:
+            cellSize = max(float(lengths.mean()) if n != 0 else 1.0, 1.0)
+        self.cellSize = cellSize
+        self.cells = dict()
+        self.low = self.high = None
+        if n == 0:
+            return
+
+        #cells covered by the bounding box of each edge
+        low = np.floor(np.minimum(self.starts, self.ends) / cellSize).astype(np.int64)
+        high = np.floor(np.maximum(self.starts, self.ends) / cellSize).astype(np.int64)
+        for i, (l, h) in enumerate(zip(low.tolist(), high.tolist())):
+            for cx in range(l[0], h[0] + 1):
+                for cy in range(l[1], h[1] + 1):
+                    self.cells.setdefault((cx, cy), []).append(i)
+        self.low = (int(low[:,0].min()), int(low[:,1].min()))
+        self.high = (int(high[:,0].max()), int(high[:,1].max()))
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, x, y):
+        '''
+        helper function to get the cell key of a point
+        '''
+        return (int(np.floor(x / self.cellSize)), int(np.floor(y / self.cellSize)))
+
+    def edgesNear(self, low, high):
+        '''
+        Gets the edges in cells overlapping a box
+        low, high: (x,y) corners of the box
+        returns a sorted np array of edge indices, a superset of the edges touching the box
+        '''
+        low, high = self._cell(*low), self._cell(*high)
+        #a large box covers more cells than are occupied, test every edge
+        if (high[0] - low[0] + 1) * (high[1] - low[1] + 1) > len(self.cells):
+            return np.arange(len(self.points))
+        edges = set()
+        for cx in range(max(low[0], self.low[0]), min(high[0], self.high[0]) + 1):
+            for cy in range(max(low[1], self.low[1]), min(high[1], self.high[1]) + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is not None:
+                    edges.update(cell)
+        return np.array(sorted(edges), dtype = np.int64)
+
+    def vertexNear(self, point, distCutoff):
+        '''
+        Finds the first vertex closer than distCutoff to a point
+        point: (x,y) query point
+        distCutoff: the largest distance, exclusive
+        returns the index of the vertex, None if no vertex is close enough
+        '''
+        if len(self.points) == 0:
+            return None
+        x, y = point
+        #every vertex starts an edge stored in the cell of the vertex
+        vertices = self.edgesNear((x - distCutoff, y - distCutoff), (x + distCutoff, y + distCutoff))
+        close = vertices[np.hypot(self.points[vertices, 0] - x,
+                                  self.points[vertices, 1] - y) < distCutoff]
+        return int(close[0]) if len(close) != 0 else None
+
+    def crosses(self, a, b, exclude = ()):
+        '''
+        Tests if a segment crosses or touches any edge of the polygon
+        a, b: (x,y) end points of the segment
+        exclude: indices of edges to ignore, such as the edges sharing an end point
+        returns True if any other edge intersects the segment
+        '''
+        if len(self.points) == 0:
+            return False
+        edges = self.edgesNear((min(a[0], b[0]), min(a[1], b[1])),
+                               (max(a[0], b[0]), max(a[1], b[1])))
+        edges = edges[~np.isin(edges, np.array(exclude, dtype = np.int64))]
+        if len(edges) == 0:
+            return False
+        return bool(segmentsIntersect(a, b, self.starts[edges, 0], self.starts[edges, 1],
+                                      self.ends[edges, 0], self.ends[edges, 1]).any())
+
+    def _ring(self, center, ring):
+        '''
+        helper function to get the edges in cells a ring of cells away from center
+        '''
+        cx, cy = center
+        if ring == 0:
+            keys = [center]
+        else:
+            keys = [(i, cy - ring) for i in range(cx - ring, cx + ring + 1)] + \
+                [(i, cy + ring) for i in range(cx - ring, cx + ring + 1)] + \
+                [(cx - ring, j) for j in range(cy - ring + 1, cy + ring)] + \
+                [(cx + ring, j) for j in range(cy - ring + 1, cy + ring)]
+        edges = []
+        for key in keys:
+            cell = self.cells.get(key)
+            if cell is not None:
+                edges.extend(cell)
+        return edges
+
+    def insertionEdges(self, point):
+        '''
+        Generates the edges in order of the summed distance from the point to both
+        end points, the edge that lengthens the perimeter least when split by the point.
+        Rings of cells are searched outward, an edge is only given once no edge in an
+        unsearched cell can have a smaller sum.  Ties are broken by the lower index
+        point: (x,y) point to insert
+        yields edge indices
+        '''
+        n = len(self.points)
+        if n == 0:
+            return
+        x, y = point
+        center = self._cell(x, y)
+        lastRing = max(abs(center[0] - self.low[0]), abs(center[0] - self.high[0]),
+                       abs(center[1] - self.low[1]), abs(center[1] - self.high[1]))
+        seen = set()
+        heap = []
+        for ring in range(lastRing + 1):
+            #searching the rest ring by ring would visit more cells than are occupied
+            if (2 * ring + 1)**2 > len(self.cells):
+                ring = lastRing
+                edges = [i for i in range(n) if i not in seen]
+            else:
+                #an edge spanning several cells of the ring is listed once per cell
+                edges = [i for i in dict.fromkeys(self._ring(center, ring)) if i not in seen]
+            if len(edges) != 0:
+                seen.update(edges)
+                edges = np.array(edges, dtype = np.int64)
+                sums = np.hypot(self.starts[edges, 0] - x, self.starts[edges, 1] - y) + \
+                    np.hypot(self.ends[edges, 0] - x, self.ends[edges, 1] - y)
+                for s, i in zip(sums.tolist(), edges.tolist()):
+                    heapq.heappush(heap, (s, i))
+            #an edge outside the searched rings has both end points at least ring * cellSize away
+            bound = 2 * ring * self.cellSize if ring < lastRing else float('inf')
+            while len(heap) != 0 and heap[0][0] <= bound:
+                yield heapq.heappop(heap)[1]
+            if ring == lastRing:
+                return
+
+    def insertionIndex(self, point):
+        '''
+        Finds where to insert a point into the polygon.  The point splits the edge with the
+        smallest summed distance to the point whose two new edges do not cross the polygon
+        point: (x,y) point to insert
+        returns the index to insert the point at, None if every edge would cause a crossing
+        '''
+        n = len(self.points)
+        for i in self.insertionEdges(point):
+            j = (i + 1) % n
+            #new edges share end points with the edges around the split edge
+            if self.crosses(self.points[i], point, exclude = ((i - 1) % n, i)):
+                continue
+            if self.crosses(point, self.points[j], exclude = (i, j)):
+                continue
+            return i + 1
+        return None
@@ -34,6 +34,7 @@ class SlideWrapper(object):
         
         self.slides = []
         self.filetype = ex
+        self.fileName = os.path.abspath(fileName)
             
         #nanozoomer, ends in triple or brightfield
         if ex == '.ndpi':
@@ -143,6 +144,19 @@ class SlideWrapper(object):
         
         return slideImg
 
+    def getChannelImg(self, imageInd):
+        '''
+        Reads a single image channel at the current position and zoom, without merging
+        imageInd: the image index to read
+        returns a PIL image, black if the channel is not available at this zoom
+        '''
+        img = None
+        if imageInd >= 0 and imageInd < len(self.slides) and self.slides[imageInd] is not None:
+            img = self._getImg(imageInd)
+        if img is None:
+            img = Image.new("RGBA", self.size, "black")
+        return img
+
     def _getImg(self, imageInd):
         '''
         Helper method to read in an image from a single channel.  Uses instance position and zoom
@@ -224,6 +238,33 @@ class SlideWrapper(object):
                             position, size))
         return (self.slides[imgInd][0]).read_region(tempPos, 0, size)
         
+    def getCoarseImage(self, imgInd = 1, maxPixels = 2**22):
+        '''
+        Get an image of the whole slide from the pyramid or decimated images.  
+        Uses the finest level with at most maxPixels, or the coarsest level available
+        imgInd: the image index to read
+        maxPixels: the largest number of pixels to read
+        returns the PIL image and the number of max zoom pixels per image pixel,
+            (None, None) if the image index is a missing channel
+        '''
+        imgInd = min(len(self.slides)-1, imgInd)
+        if self.slides[imgInd] is None:
+            return None, None
+        #each decimated image is 8x smaller than the previous
+        candidates = []
+        for i, s in enumerate(self.slides[imgInd]):
+            for lvl in range(s.level_count):
+                dims = s.level_dimensions[lvl]
+                candidates.append((8**i * s.level_downsamples[lvl], s, lvl, dims))
+        candidates.sort(key = lambda x: x[0])
+        choice = candidates[-1]
+        for c in candidates:
+            if c[3][0] * c[3][1] <= maxPixels:
+                choice = c
+                break
+        downsample, s, lvl, dims = choice
+        return s.read_region((0,0), lvl, dims), downsample
+
     def step(self, direction, stepSize):
         '''
         Step the position in the designated direction.
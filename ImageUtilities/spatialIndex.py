@@ -0,0 +1,219 @@
+import numpy as np
+
+class spatialIndex(object):
+    '''
+    A uniform grid hash of blob centers for fast point queries.
+    Each blob is stored in the grid cell holding its center, so point-in-blob
+    and nearest blob queries only test the blobs of a few cells around the query.
+    Blobs are tracked by ids which increase with the row of the blob, allowing
+    appends and removals to update the index without renumbering every cell.
+    A removed blob leaves its cell at once but keeps its row, so rows after it are
+    not renumbered until compact is called.
+    '''
+    def __init__(self, cellSize = None):
+        '''
+        Create a new, empty index
+        cellSize: length of a side of each grid cell, None to choose from the blobs on build
+        '''
+        self.cellSize = cellSize
+        self.cells = dict()
+        #ids[row] -> id of the blob in that row, always increasing
+        self.ids = np.zeros(0, dtype = np.int64)
+        self.nextId = 0
+        #rows removed since the last compact
+        self.removed = []
+        #largest radius added, the reach of point-in-blob queries
+        self.maxRadius = 0
+        #extent of the occupied cells, bounds nearest neighbor searches
+        self.low = None
+        self.high = None
+
+    def _cell(self, x, y):
+        '''
+        helper function to get the cell key of a point
+        '''
+        return (int(np.floor(x / self.cellSize)), int(np.floor(y / self.cellSize)))
+
+    def _extend(self, key):
+        '''
+        helper function to grow the extent of occupied cells to include key
+        '''
+        if self.low is None:
+            self.low, self.high = key, key
+        else:
+            self.low = (min(self.low[0], key[0]), min(self.low[1], key[1]))
+            self.high = (max(self.high[0], key[0]), max(self.high[1], key[1]))
+
+    def build(self, xs, ys, radii):
+        '''
+        Replaces the contents of the index with a set of blobs
+        xs, ys: np arrays of the blob centers, in row order
+        radii: np array of the blob radii
+        '''
+        n = len(xs)
+        if self.cellSize is None:
+            #about one blob per cell for evenly spaced blobs, but no smaller than a blob
+            self.cellSize = 1.0
+            if n != 0:
+                area = (np.ptp(xs) + 1) * (np.ptp(ys) + 1)
+                self.cellSize = max(2 * float(np.max(radii)), np.sqrt(area / n), 1.0)
+        self.cells = dict()
+        self.ids = np.arange(n, dtype = np.int64)
+        self.nextId = n
+        self.removed = []
+        self.maxRadius = float(np.max(radii)) if n != 0 else 0
+        self.low = self.high = None
+        if n == 0:
+            return
+
+        cx = np.floor(np.asarray(xs) / self.cellSize).astype(np.int64)
+        cy = np.floor(np.asarray(ys) / self.cellSize).astype(np.int64)
+        #sort rows by cell, then split into runs of the same cell
+        order = np.lexsort((cy, cx))
+        cx, cy = cx[order], cy[order]
+        starts = np.concatenate(([0], np.where((np.diff(cx) != 0) | (np.diff(cy) != 0))[0] + 1))
+        for start, rows in zip(starts, np.split(order, starts[1:])):
+            self.cells[(int(cx[start]), int(cy[start]))] = rows.tolist()
+        self.low = (int(cx.min()), int(cy.min()))
+        self.high = (int(cx.max()), int(cy.max()))
+
+    def add(self, x, y, radius):
+        '''
+        Adds a blob after the last row
+        x, y: the blob center
+        radius: the blob radius
+        '''
+        if self.cellSize is None:
+            self.cellSize = max(2 * float(radius), 1.0)
+        key = self._cell(x, y)
+        self.cells.setdefault(key, []).append(self.nextId)
+        self._extend(key)
+        self.ids = np.append(self.ids, self.nextId)
+        self.nextId += 1
+        self.maxRadius = max(self.maxRadius, float(radius))
+
+    def remove(self, row, x, y):
+        '''
+        Removes the blob in a row.  The row is no longer returned by queries, 
+        rows after it move up by one when compact is called
+        row: the row of the blob to remove
+        x, y: the blob center
+        '''
+        key = self._cell(x, y)
+        cell = self.cells[key]
+        cell.remove(int(self.ids[row]))
+        if len(cell) == 0:
+            del self.cells[key]
+        self.removed.append(row)
+
+    def compact(self):
+        '''
+        Renumbers the rows after removed blobs, matching the rows of the blob list
+        after the removed rows are deleted
+        '''
+        if len(self.removed) != 0:
+            self.ids = np.delete(self.ids, self.removed)
+            self.removed = []
+
+    def _rows(self, ids):
+        '''
+        helper function to convert blob ids to their current rows
+        '''
+        return np.searchsorted(self.ids, np.array(ids, dtype = np.int64))
+
+    def candidates(self, x, y, reach):
+        '''
+        Gets the blobs with centers in cells within reach of a point
+        returns an np array of rows, a superset of the blobs within reach
+        x, y: the query point
+        reach: the distance to cover
+        '''
+        if self.cellSize is None:
+            return np.zeros(0, dtype = np.int64)
+        low = self._cell(x - reach, y - reach)
+        high = self._cell(x + reach, y + reach)
+        ids = []
+        for i in range(low[0], high[0] + 1):
+            for j in range(low[1], high[1] + 1):
+                cell = self.cells.get((i, j))
+                if cell is not None:
+                    ids.extend(cell)
+        return self._rows(ids)
+
+    def containing(self, x, y, xs, ys, radii, storageRows = None):
+        '''
+        Finds the blobs containing a point
+        returns a sorted np array of the rows of every blob with the point within its radius
+        x, y: the query point
+        xs, ys, radii: np arrays of the blob centers and radii, in row order
+        storageRows: np array of the position of each row in xs, ys and radii,
+            None if they are in row order.  Only the candidate rows are looked up
+        '''
+        rows = self.candidates(x, y, self.maxRadius)
+        pos = rows if storageRows is None else storageRows[rows]
+        inside = (x - xs[pos])**2 + (y - ys[pos])**2 <= radii[pos]**2
+        return np.sort(rows[inside])
+
+    @staticmethod
+    def _ring(center, ring):
+        '''
+        helper function to generate the keys of the cells a ring of cells away from center
+        '''
+        if ring == 0:
+            yield center
+            return
+        cx, cy = center
+        for i in range(cx - ring, cx + ring + 1):
+            yield (i, cy - ring)
+            yield (i, cy + ring)
+        for j in range(cy - ring + 1, cy + ring):
+            yield (cx - ring, j)
+            yield (cx + ring, j)
+
+    def nearest(self, x, y, xs, ys, maxDist = None, storageRows = None):
+        '''
+        Finds the blob center closest to a point
+        Searches rings of cells around the point until the closest center found
+        is nearer than any unsearched cell
+        returns (row, distance) of the closest blob, (None, inf) if none is found
+        x, y: the query point
+        xs, ys: np arrays of the blob centers, in row order
+        maxDist: largest distance to search, None for no limit
+        storageRows: np array of the position of each row in xs and ys,
+            None if they are in row order
+        '''
+        if len(self.cells) == 0:
+            return None, float('inf')
+        center = self._cell(x, y)
+        #rings needed to reach every occupied cell
+        lastRing = max(abs(center[0] - self.low[0]), abs(center[0] - self.high[0]),
+                       abs(center[1] - self.low[1]), abs(center[1] - self.high[1]))
+        if maxDist is not None:
+            lastRing = min(lastRing, int(np.ceil(maxDist / self.cellSize)))
+        bestRow, bestDist = None, float('inf')
+        for ring in range(lastRing + 1):
+            #points outside the searched rings are at least (ring-1) * cellSize away
+            if bestDist <= (ring - 1) * self.cellSize:
+                break
+            #searching the rest ring by ring would visit more cells than are occupied
+            if 8 * ring > len(self.cells):
+                rows = np.delete(np.arange(len(self.ids)), self.removed)
+            else:
+                ids = []
+                for key in spatialIndex._ring(center, ring):
+                    cell = self.cells.get(key)
+                    if cell is not None:
+                        ids.extend(cell)
+                if len(ids) == 0:
+                    continue
+                rows = self._rows(ids)
+            pos = rows if storageRows is None else storageRows[rows]
+            dists = np.hypot(xs[pos] - x, ys[pos] - y)
+            i = np.argmin(dists)
+            if dists[i] < bestDist:
+                bestRow, bestDist = int(rows[i]), float(dists[i])
+            if 8 * ring > len(self.cells):
+                break
+        if maxDist is not None and bestDist > maxDist:
+            return None, float('inf')
+        return bestRow, bestDist
@@ -0,0 +1,326 @@
+import time
+import numpy as np
+import scipy
+
+from ImageUtilities.blob import blob
+
+class stripLabeller(object):
+    '''
+    Exact connected component labelling of a whole slide, streamed in horizontal strips.
+    Each strip spans the full width of the slide (or ROI bounding box) and is labelled
+    on its own.  The last row of labels is carried forward to the next strip, labels
+    touching across the boundary are merged with union-find, and the area, centroid
+    and perimeter of each component are accumulated as strips are read.  Components
+    are reported as soon as they stop touching the carried row, so memory scales
+    with the slide width instead of its area.
+    Pixels are connected along rows and columns, matching ndimage.label.
+    '''
+    #default number of rows in each strip when no memory budget is set
+    defaultStripHeight = 1024
+
+    def __init__(self, finder):
+        '''
+        Create a labeller using the parameters of a blobFinder
+        finder: the blobFinder with the slide, channel, threshold and size/circularity limits
+        '''
+        self.finder = finder
+        self.resetVariables()
+
+    def resetVariables(self):
+        '''
+        Clears the union-find forest and the statistics of open components
+        '''
+        #union-find parent of each label still referenced by the carried row
+        self.parent = {}
+        #root label -> [area, sum of x, sum of y, perimeter edges] of open components
+        self.stats = {}
+        #global labels of the last row read, 0 for background
+        self.carried = None
+        #next unused global label
+        self.nextLabel = 1
+
+    def stripBytesPerPixel(self):
+        '''
+        Estimates the peak memory used per pixel of a strip
+        Reading holds the RGBA image and the single band kept from it,
+        labelling holds the band, the threshold mask, the labels, two
+        temporary masks used to count perimeter edges and the coordinates of the
+        foreground pixels, assuming the worst case of every pixel above threshold.
+        returns the number of bytes per pixel
+        '''
+        labelBytes = np.dtype(self.finder.labelDtype).itemsize
+        return max(4 + 1, 1 + 1 + labelBytes + 2 + 2*8)
+
+    def bounds(self, ROI = None):
+        '''
+        Gets the region to label
+        ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        returns the (left, top) and (right, bottom) corners, clipped to the slide
+        '''
+        size = self.finder.slide.getSize()
+        if ROI is None or len(ROI) < 2:
+            return (0, 0), (int(size[0]), int(size[1]))
+        topL = (max(0, int(min(map(lambda x: x[0], ROI)))),
+                max(0, int(min(map(lambda x: x[1], ROI)))))
+        botR = (min(int(size[0]), int(np.ceil(max(map(lambda x: x[0], ROI))))),
+                min(int(size[1]), int(np.ceil(max(map(lambda x: x[1], ROI))))))
+        return topL, botR
+
+    def planStrips(self, width, stripHeight = None, budget = None):
+        '''
+        Chooses the number of rows in each strip
+        returns a plan dict as in blobFinder.planTiles, with the strip width added
+        width: number of pixels in each row
+        stripHeight: number of rows, None to fit the strip into the memory budget
+        budget: memory available in MB, None to use the memoryBudget of the blobFinder
+        '''
+        if budget is None:
+            budget = self.finder.memoryBudget
+        bpp = self.stripBytesPerPixel()
+        if stripHeight is None:
+            if budget is None:
+                stripHeight = stripLabeller.defaultStripHeight
+            else:
+                stripHeight = max(1, int(budget * 2**20 / bpp / max(width, 1)))
+        return {'subSize' : stripHeight,
+                'width' : width,
+                'workers' : 1,
+                'tileBytes' : bpp * stripHeight * width,
+                'budget' : None if budget is None else budget * 2**20}
+
+    def _find(self, label):
+        '''
+        helper function to find the root of a label, compressing the path
+        label: global label value
+        '''
+        root = label
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[label] != root:
+            self.parent[label], label = root, self.parent[label]
+        return root
+
+    def _union(self, a, b):
+        '''
+        helper function to merge the components of two labels and their statistics
+        a, b: global label values
+        '''
+        a = self._find(a)
+        b = self._find(b)
+        if a == b:
+            return
+        #keep the smaller label as root for deterministic output
+        if b < a:
+            a, b = b, a
+        self.parent[b] = a
+        sa = self.stats[a]
+        for i, v in enumerate(self.stats.pop(b)):
+            sa[i] += v
+
+    @staticmethod
+    def _edgeCounts(lbl, mask, num):
+        '''
+        helper function to count the exposed pixel edges of each label within a strip
+        counts left and right edges of every row and top and bottom edges between rows
+        of the strip.  Edges across the strip boundaries are counted separately.
+        returns an array with the edge count of each label, index 0 is unused
+        lbl: label image of the strip
+        mask: thresholded image of the strip
+        num: number of labels in lbl
+        '''
+        counts = np.zeros(num+1, dtype = np.int64)
+        #left and right edges, the outside of the region is background
+        padded = np.pad(mask, ((0,0),(1,1)), 'constant')
+        exposed = mask & ~padded[:, :-2]
+        counts += np.bincount(lbl[exposed], minlength = num+1)
+        exposed = mask & ~padded[:, 2:]
+        counts += np.bincount(lbl[exposed], minlength = num+1)
+        #top and bottom edges between rows inside the strip
+        exposed = mask[1:] & ~mask[:-1]
+        counts += np.bincount(lbl[1:][exposed], minlength = num+1)
+        exposed = mask[:-1] & ~mask[1:]
+        counts += np.bincount(lbl[:-1][exposed], minlength = num+1)
+        return counts
+
+    def _toBlobs(self, area, sumX, sumY, perim):
+        '''
+        helper function to convert component statistics into blobs passing the
+        size and circularity filters of the blobFinder
+        The perimeter is the number of exposed pixel edges, which overestimates the
+        boundary of smooth shapes by 4/pi, so it is scaled by pi/4 before computing
+        circularity = 4 pi area / perimeter^2
+        returns a list of blobs
+        area, sumX, sumY, perim: np arrays of the statistics of each component
+        '''
+        f = self.finder
+        keep = area > f.minSize
+        if f.maxSize is not None:
+            keep &= area < f.maxSize
+        area, sumX, sumY, perim = area[keep], sumX[keep], sumY[keep], perim[keep]
+        perim = perim * np.pi / 4
+        circ = 4*np.pi * area / np.maximum(perim, 1)**2
+        keep = circ > f.minCircularity
+        if f.maxCircularity is not None:
+            keep &= circ < f.maxCircularity
+        area, sumX, sumY, circ = area[keep], sumX[keep], sumY[keep], circ[keep]
+        return [blob(x = sx/a, y = sy/a, radius = np.sqrt(a/np.pi), circularity = c)
+                for a, sx, sy, c in zip(area, sumX, sumY, circ)]
+
+    def _closeComponents(self, active):
+        '''
+        helper function to report the open components no longer touching the carried row
+        returns a list of blobs
+        active: set of root labels in the carried row
+        '''
+        closed = [k for k in self.stats if k not in active]
+        if len(closed) == 0:
+            return []
+        stats = np.array([self.stats.pop(k) for k in closed], dtype = np.float64)
+        return self._toBlobs(stats[:,0], stats[:,1], stats[:,2], stats[:,3])
+
+    def _addStrip(self, band, x0, y0, last):
+        '''
+        helper function to label a strip and merge it with the carried row
+        returns a list of blobs completed by this strip
+        band: 2d np array of the color channel of the strip
+        x0, y0: global coordinates of the top left pixel of the strip
+        last: True if this is the final strip
+        '''
+        f = self.finder
+        mask = band > f.threshold
+        lbl, num = scipy.ndimage.label(mask, output = f.labelDtype)
+        del band
+
+        #statistics of every label in the strip
+        rows, cols = np.nonzero(mask)
+        ids = lbl[rows, cols]
+        area = np.bincount(ids, minlength = num+1).astype(np.float64)
+        sumX = np.bincount(ids, weights = cols + x0, minlength = num+1)
+        sumY = np.bincount(ids, weights = rows + y0, minlength = num+1)
+        del rows, cols, ids
+        perim = stripLabeller._edgeCounts(lbl, mask, num).astype(np.float64)
+
+        if self.carried is None:
+            prevMask = np.zeros(mask.shape[1], dtype = bool)
+        else:
+            prevMask = self.carried > 0
+        #top edges of the first row
+        exposed = mask[0] & ~prevMask
+        perim += np.bincount(lbl[0][exposed], minlength = num+1)
+        #bottom edges of the carried row, belonging to open components
+        if self.carried is not None:
+            exposed = prevMask & ~mask[0]
+            for root, count in zip(*np.unique(self.carried[exposed], return_counts = True)):
+                self.stats[int(root)][3] += count
+
+        #labels touching the carried row or continuing into the next strip stay open
+        touching = mask[0] & prevMask
+        openLabels = np.union1d(np.unique(lbl[0][touching]), np.unique(lbl[-1]))
+        openLabels = openLabels[openLabels > 0]
+        isOpen = np.zeros(num+1, dtype = bool)
+        isOpen[openLabels] = True
+        isOpen[0] = True
+
+        #everything else is complete within the strip
+        closed = ~isOpen
+        result = self._toBlobs(area[closed], sumX[closed], sumY[closed], perim[closed])
+
+        #open labels get global values and join the union-find forest
+        offset = self.nextLabel - 1
+        self.nextLabel += num
+        for l in openLabels:
+            g = int(l) + offset
+            self.parent[g] = g
+            self.stats[g] = [area[l], sumX[l], sumY[l], perim[l]]
+
+        #merge components connected across the boundary
+        if self.carried is not None and np.any(touching):
+            pairs = np.unique(np.stack((self.carried[touching],
+                                        lbl[0][touching].astype(np.int64) + offset)), axis = 1)
+            for a, b in pairs.T:
+                self._union(int(a), int(b))
+
+        #carry the last row forward as root labels
+        lastRow = lbl[-1].astype(np.int64)
+        lastRow[lastRow > 0] += offset
+        values, inverse = np.unique(lastRow, return_inverse = True)
+        roots = np.array([0 if v == 0 else self._find(int(v)) for v in values], dtype = np.int64)
+        self.carried = roots[inverse]
+        active = set(int(r) for r in roots if r > 0)
+        #only the roots of the carried row are referenced again
+        self.parent = dict((r, r) for r in active)
+
+        if last:
+            #bottom edges of the final row
+            for root, count in zip(*np.unique(self.carried[self.carried > 0], return_counts = True)):
+                self.stats[int(root)][3] += count
+            active = set()
+        result.extend(self._closeComponents(active))
+        return result
+
+    def labelSlide(self, ROI = None, stripHeight = None, progress = None, cancel = None):
+        '''
+        Finds every connected component of the thresholded slide within the bounding box of ROI
+        returns a list of blobs
+        ROI: a list of points for ROI polygon.  Only used to determine bounding box.
+        stripHeight: number of rows to read at once, None to choose from the memory budget
+        progress: function called with progress dicts, see blobFinder.blobSlideIter
+        cancel: a threading.Event checked between strips, set to stop early.
+            Components open when cancelled are reported as they are
+        '''
+        self.resetVariables()
+        topL, botR = self.bounds(ROI)
+        width = max(0, botR[0] - topL[0])
+        plan = self.planStrips(width, stripHeight)
+        self.plan = plan
+        stripHeight = plan['subSize']
+        tops = list(range(topL[1], botR[1], stripHeight)) if width > 0 else []
+
+        event = {
+            'tilesDone' : 0,
+            'totalTiles' : len(tops),
+            'blobsFound' : 0,
+            'bytesRead' : 0,
+            'rate' : 0,
+            'elapsed' : 0,
+            'remaining' : 0,
+            'finished' : False,
+            'cancelled' : False,
+            'subSize' : stripHeight,
+            'width' : width,
+            'workers' : 1}
+        start = time.time()
+        if progress is not None:
+            progress(dict(event))
+
+        result = []
+        for i, top in enumerate(tops):
+            if cancel is not None and cancel.is_set():
+                event['cancelled'] = True
+                break
+            rows = min(stripHeight, botR[1] - top)
+            #getMaxZoomImage takes the center of the region
+            band = self.finder._readBand((topL[0] + width/2, top + rows/2), (width, rows))
+            blbs = self._addStrip(band, topL[0], top, i == len(tops) - 1)
+            result.extend(blbs)
+
+            event['tilesDone'] += 1
+            event['blobsFound'] += len(blbs)
+            event['bytesRead'] += width * rows * 4
+            event['elapsed'] = time.time() - start
+            event['rate'] = event['tilesDone'] / max(event['elapsed'], 1e-6)
+            event['remaining'] = (event['totalTiles'] - event['tilesDone']) / event['rate']
+            if progress is not None:
+                progress(dict(event))
+
+        if event['cancelled'] and len(self.stats) > 0:
+            result.extend(self._closeComponents(set()))
+        self.resetVariables()
+
+        event['finished'] = True
+        event['blobsFound'] = len(result)
+        event['elapsed'] = time.time() - start
+        event['remaining'] = 0
+        if progress is not None:
+            progress(dict(event))
+        return result
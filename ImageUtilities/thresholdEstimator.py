@@ -0,0 +1,230 @@
+import numpy as np
+from matplotlib.path import Path
+
+class thresholdEstimator(object):
+    '''
+    Suggests blob finding thresholds from the intensity histogram of a slide.
+    Histograms of every color band are accumulated in a single pass over the
+    coarsest pyramid level holding enough pixels, or over tiles sampled at max zoom,
+    and cached by image index, source and ROI.  Suggestions for another color
+    band or method of a cached histogram need no reading.
+    '''
+    #names of the supported methods
+    methods = ['Otsu', 'Triangle', 'Percentile']
+    #histogram sources
+    sources = ['coarse', 'tiles']
+
+    def __init__(self, slide, maxPixels = 2**22, tileSize = 512, samples = 64,
+                 percentile = 99):
+        '''
+        Create a new estimator for the slide
+        slide: the slideWrapper to estimate thresholds for
+        maxPixels: the largest coarse image to read
+        tileSize: size in pixels of one side of each sampled tile
+        samples: number of tiles to sample at max zoom
+        percentile: the percentile of intensity used by the Percentile method
+        '''
+        self.slide = slide
+        self.maxPixels = maxPixels
+        self.tileSize = tileSize
+        self.samples = samples
+        self.percentile = percentile
+        #(imageIndex, source, ROI) -> (bands, 256) array of counts
+        self.histograms = dict()
+
+    @staticmethod
+    def _key(imageIndex, source, ROI):
+        '''
+        helper function to generate the cache key of a histogram
+        '''
+        roi = None if ROI is None or len(ROI) < 3 else tuple((float(p[0]), float(p[1])) for p in ROI)
+        return (imageIndex, source, roi)
+
+    def isCached(self, imageIndex, ROI = None, source = 'coarse'):
+        '''
+        Checks if the histogram of an image has been read
+        imageIndex: the image index of the slide
+        ROI: a list of points for the ROI polygon, None for the whole slide
+        source: 'coarse' or 'tiles'
+        '''
+        return thresholdEstimator._key(imageIndex, source, ROI) in self.histograms
+
+    @staticmethod
+    def _accumulate(hist, img, mask = None):
+        '''
+        helper function to add the band intensities of an image to a histogram
+        Transparent pixels, outside of the scanned area of the slide, are skipped
+        hist: (bands, 256) array of counts, updated in place
+        img: PIL image to add
+        mask: boolean np array of pixels to include, None for all
+        '''
+        if img.mode == 'RGBA':
+            opaque = np.asarray(img.split()[3]) != 0
+            mask = opaque if mask is None else mask & opaque
+        for i, band in enumerate(img.split()[:hist.shape[0]]):
+            band = np.asarray(band)
+            if mask is not None:
+                band = band[mask]
+            hist[i] += np.bincount(band.ravel(), minlength = 256)[:256]
+
+    def _coarseHistogram(self, imageIndex, ROI):
+        '''
+        helper function to build the histogram from the coarse pyramid
+        '''
+        img, downsample = self.slide.getCoarseImage(imageIndex, self.maxPixels)
+        hist = np.zeros((3, 256), dtype = np.int64)
+        #missing channel
+        if img is None:
+            return hist
+        mask = None
+        if ROI is not None and len(ROI) > 2:
+            #test the center of each coarse pixel in slide coordinates
+            w, h = img.size
+            xs, ys = np.meshgrid((np.arange(w) + 0.5) * downsample,
+                                 (np.arange(h) + 0.5) * downsample)
+            mask = Path(ROI).contains_points(np.column_stack((xs.ravel(), ys.ravel())))
+            mask = mask.reshape((h, w))
+        thresholdEstimator._accumulate(hist, img, mask)
+        return hist
+
+    def _tileHistogram(self, imageIndex, ROI):
+        '''
+        helper function to build the histogram from tiles sampled at max zoom
+        Tiles are spread on a regular grid over the slide or ROI bounding box,
+        only tiles centered within the ROI are read
+        '''
+        if ROI is None or len(ROI) < 3:
+            size = self.slide.getSize()
+            topL, botR = (0, 0), (size[0], size[1])
+        else:
+            topL = (min(p[0] for p in ROI), min(p[1] for p in ROI))
+            botR = (max(p[0] for p in ROI), max(p[1] for p in ROI))
+        #grid with about samples points, matching the aspect ratio
+        w, h = max(botR[0] - topL[0], 1), max(botR[1] - topL[1], 1)
+        nx = max(1, int(round(np.sqrt(self.samples * w / h))))
+        ny = max(1, int(round(self.samples / nx)))
+        xs = topL[0] + (np.arange(nx) + 0.5) * w / nx
+        ys = topL[1] + (np.arange(ny) + 0.5) * h / ny
+        centers = np.array([(x, y) for y in ys for x in xs])
+        if ROI is not None and len(ROI) > 2:
+            centers = centers[Path(ROI).contains_points(centers)]
+
+        hist = np.zeros((3, 256), dtype = np.int64)
+        #missing channel, using the image index clamped as in getMaxZoomImage
+        if self.slide.slides[min(len(self.slide.slides)-1, imageIndex)] is None:
+            return hist
+        for x, y in centers:
+            img = self.slide.getMaxZoomImage((int(x), int(y)), (self.tileSize, self.tileSize),
+                                             imgInd = imageIndex)
+            thresholdEstimator._accumulate(hist, img)
+        return hist
+
+    def histogram(self, imageIndex, channel, ROI = None, source = 'coarse'):
+        '''
+        Gets the intensity histogram of a color band, reading the slide if not cached
+        returns an array with the number of pixels of each intensity, 0-255
+        imageIndex: the image index of the slide
+        channel: [0, 1, 2] -> [R, G, B] channel
+        ROI: a list of points for the ROI polygon, None for the whole slide
+        source: 'coarse' to read the coarse pyramid level, 'tiles' to sample max zoom tiles
+        '''
+        key = thresholdEstimator._key(imageIndex, source, ROI)
+        if key not in self.histograms:
+            if source == 'coarse':
+                self.histograms[key] = self._coarseHistogram(imageIndex, ROI)
+            elif source == 'tiles':
+                self.histograms[key] = self._tileHistogram(imageIndex, ROI)
+            else:
+                raise ValueError('Unknown histogram source {}'.format(source))
+        return self.histograms[key][channel]
+
+    def clear(self):
+        '''
+        Removes all cached histograms
+        '''
+        self.histograms.clear()
+
+    @staticmethod
+    def otsu(hist):
+        '''
+        Finds the threshold maximizing the between class variance of the histogram
+        returns the threshold, pixels above it are foreground
+        hist: array of counts of each intensity
+        '''
+        hist = np.asarray(hist, dtype = np.float64)
+        total = hist.sum()
+        if total == 0:
+            return 0
+        levels = np.arange(len(hist))
+        #class weights and means for each threshold
+        w0 = np.cumsum(hist)
+        w1 = total - w0
+        m0 = np.cumsum(hist * levels)
+        m1 = m0[-1] - m0
+        valid = (w0 > 0) & (w1 > 0)
+        if not np.any(valid):
+            return 0
+        between = np.zeros(len(hist))
+        between[valid] = w0[valid] * w1[valid] * \
+            (m0[valid] / w0[valid] - m1[valid] / w1[valid])**2
+        return int(np.argmax(between))
+
+    @staticmethod
+    def triangle(hist):
+        '''
+        Finds the threshold with the triangle method, suited for a large dark background
+        peak with a small bright foreground.  The threshold is the intensity furthest
+        from the line between the histogram peak and the far end of the histogram
+        returns the threshold, pixels above it are foreground
+        hist: array of counts of each intensity
+        '''
+        hist = np.asarray(hist, dtype = np.float64)
+        nonzero = np.nonzero(hist)[0]
+        if len(nonzero) < 2:
+            return 0 if len(nonzero) == 0 else int(nonzero[0])
+        peak = int(np.argmax(hist))
+        first, last = int(nonzero[0]), int(nonzero[-1])
+        #use the longer tail, flipping so the tail is always to the right
+        flip = peak - first > last - peak
+        if flip:
+            hist = hist[::-1]
+            peak = len(hist) - 1 - peak
+            last = len(hist) - 1 - first
+        if last == peak:
+            return peak if not flip else len(hist) - 1 - peak
+        levels = np.arange(peak, last + 1)
+        #distance from the line between (peak, hist[peak]) and (last, 0), up to a constant
+        height = hist[peak]
+        dist = height * (levels - peak) / (last - peak) + hist[levels] - height
+        thresh = int(levels[np.argmax(-dist)])
+        if flip:
+            thresh = len(hist) - 1 - thresh
+        return thresh
+
+    @staticmethod
+    def percentileThreshold(hist, percentile = 99):
+        '''
+        Finds the intensity below which percentile of the pixels fall
+        returns the threshold, pixels above it are foreground
+        hist: array of counts of each intensity
+        percentile: 0-100, percent of pixels at or below the threshold
+        '''
+        hist = np.asarray(hist, dtype = np.float64)
+        total = hist.sum()
+        if total == 0:
+            return 0
+        return int(np.searchsorted(np.cumsum(hist), total * percentile / 100.0))
+
+    def suggest(self, imageIndex, channel, ROI = None, source = 'coarse'):
+        '''
+        Suggests thresholds for blob finding of a color band of an image
+        returns a dict of method name -> threshold
+        imageIndex: the image index of the slide
+        channel: [0, 1, 2] -> [R, G, B] channel
+        ROI: a list of points for the ROI polygon, None for the whole slide
+        source: 'coarse' to read the coarse pyramid level, 'tiles' to sample max zoom tiles
+        '''
+        hist = self.histogram(imageIndex, channel, ROI, source)
+        return {'Otsu' : thresholdEstimator.otsu(hist),
+                'Triangle' : thresholdEstimator.triangle(hist),
+                'Percentile' : thresholdEstimator.percentileThreshold(hist, self.percentile)}